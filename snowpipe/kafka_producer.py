@@ -1,8 +1,10 @@
 from kafka import KafkaProducer
 import json
+import os
+import struct
 import pandas as pd
 import time
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import numpy as np
 
 # Configuration
@@ -11,10 +13,90 @@ KAFKA_TOPIC = 'raw_ml_features_topic'
 CSV_FILE = 'input.csv'
 SEND_INTERVAL = 1
 
+# Slim messages: olt_key/cluster_key instead of the OLT, cluster, city and region strings.
+# Consumers restore them from the dimension cache (streamlit/utils/dimensions.py).
+SLIM_MESSAGES = os.environ.get('SLIM_MESSAGES', '0') == '1'
+RAW_DIR = os.environ.get('RAW_DIR', '../dataset/RAW')
+DIMENSION_COLUMNS = ['olt_id', 'cluster_id', 'cluster_name', 'city', 'province', 'region']
+
+# 'json', or 'binary': the latest registered schema's fields, no names (implies slim messages).
+# Readers decode with streamlit/utils/message_codec.py, which owns the format and the schema registry.
+VALUE_FORMAT = os.environ.get('VALUE_FORMAT', 'json')
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'streamlit', 'data', 'schemas',
+                          f'{KAFKA_TOPIC}-value')
+
+STRUCT_CODES = {'uint8': 'B', 'int32': 'i', 'uint32': 'I', 'float32': 'f', 'float64': 'd',
+                'timestamp': 'q', 'timestamptz': 'q'}
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+def load_latest_schema(schema_dir=SCHEMA_DIR):
+    """
+    Latest version of the topic's value schema from the local schema registry
+    """
+    versions = []
+    for name in os.listdir(schema_dir):
+        if name.startswith('v') and name.endswith('.json'):
+            with open(os.path.join(schema_dir, name)) as f:
+                versions.append(json.load(f))
+    return max(versions, key=lambda schema: schema['version'])
+
+class BinaryEncoder:
+    """
+    Encode a row dict with a registered schema:
+    0x00 | schema id | null bitmap | fixed-width fields | strings (uint16 length + UTF-8)
+    """
+    def __init__(self, schema):
+        self.schema = schema
+        self.header = struct.pack('>BI', 0, schema['id'])
+        self.fixed = [(i, f['name'], f['type']) for i, f in enumerate(schema['fields']) if f['type'] != 'string']
+        self.strings = [(i, f['name']) for i, f in enumerate(schema['fields']) if f['type'] == 'string']
+        self.struct = struct.Struct('<' + ''.join(STRUCT_CODES[kind] for _, _, kind in self.fixed))
+        self.bitmap_len = (len(schema['fields']) + 7) // 8
+
+    @staticmethod
+    def micros(value, utc):
+        value = datetime.fromisoformat(str(value))
+        if utc:
+            value = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+            return (value - EPOCH_UTC) // MICROSECOND
+        return (value.replace(tzinfo=None) - EPOCH) // MICROSECOND
+
+    def __call__(self, data):
+        nulls = 0
+        fixed = []
+        for i, name, kind in self.fixed:
+            value = data.get(name)
+            if value is None:
+                nulls |= 1 << i
+                fixed.append(float('nan') if kind.startswith('float') else 0)
+            elif kind.startswith('float'):
+                fixed.append(float(value))
+            elif kind.startswith('timestamp'):
+                fixed.append(self.micros(value, kind == 'timestamptz'))
+            else:
+                fixed.append(int(value))
+        strings = []
+        for i, name in self.strings:
+            value = data.get(name)
+            if value is None:
+                nulls |= 1 << i
+                strings.append(b'\x00\x00')
+            else:
+                encoded = str(value).encode('utf-8')
+                strings.append(struct.pack('<H', len(encoded)) + encoded)
+        return b''.join([self.header, nulls.to_bytes(self.bitmap_len, 'little'), self.struct.pack(*fixed)] + strings)
+
+if VALUE_FORMAT == 'binary':
+    value_serializer = BinaryEncoder(load_latest_schema())
+else:
+    value_serializer = lambda v: json.dumps(v).encode('utf-8')
+
 # Create Kafka Producer
 producer = KafkaProducer(
     bootstrap_servers=[KAFKA_BROKER],
-    value_serializer=lambda v: json.dumps(v).encode('utf-8')
+    value_serializer=value_serializer
 )
 
 def clean_data(value):
@@ -29,31 +111,53 @@ def clean_data(value):
             return None
     return value
 
-def send_csv_to_kafka(csv_path, interval=1):
+def slim_rows(df, raw_dir=RAW_DIR):
+    """
+    Replace dimension strings with the integer keys of RAW_OLT and RAW_CLUSTER
+    """
+    olt = pd.read_csv(os.path.join(raw_dir, 'RAW_OLT.csv'))
+    cluster = pd.read_csv(os.path.join(raw_dir, 'RAW_CLUSTER.csv'))
+
+    slim = df.drop(columns=[col for col in DIMENSION_COLUMNS if col in df.columns])
+    slim.insert(0, 'cluster_key', df['cluster_name'].map(cluster.set_index('cluster_name')['cluster_key']).astype('Int64')
+                if 'cluster_name' in df.columns else pd.NA)
+    slim.insert(0, 'olt_key', df['olt_id'].map(olt.set_index('olt_id')['olt_key']).astype('Int64'))
+    return slim
+
+def send_csv_to_kafka(csv_path, interval=1, slim=SLIM_MESSAGES or VALUE_FORMAT == 'binary'):
     """
-    Read CSV and send each row to Kafka as JSON
+    Read CSV and send each row to Kafka as JSON (slim: keys instead of dimension strings)
     """
     try:
         # Read CSV file
         print(f"📖 Reading CSV file: {csv_path}")
         df = pd.read_csv(csv_path)
         print(f"✅ Found {len(df)} rows to send")
+        olt_ids = df['olt_id'].astype(str)
+        if slim:
+            dropped = [col for col in DIMENSION_COLUMNS if col in df.columns]
+            df = slim_rows(df)
+            print(f"✂️  Slim messages: olt_key, cluster_key instead of {', '.join(dropped)}")
+        sent_bytes = 0
         
         # Send each row
         for index, row in df.iterrows():
             # Convert row to dictionary and clean NaN values
             data = {key: clean_data(value) for key, value in row.to_dict().items()}
             
-            # Add metadata
-            data['sent_at'] = datetime.now().isoformat()
+            # Add metadata (UTC with offset so lag can be measured across hosts)
+            data['sent_at'] = datetime.now(timezone.utc).isoformat()
             data['row_index'] = index
             
-            # Send to Kafka
-            producer.send(KAFKA_TOPIC, value=data)
+            # Send to Kafka, keyed by OLT so all hours of an OLT land on the same partition
+            # (the scoring consumers keep per-OLT rolling state by partition)
+            key = olt_ids[index].encode('utf-8')
+            future = producer.send(KAFKA_TOPIC, key=key, value=data)
             producer.flush()
+            sent_bytes += future.get().serialized_value_size
             
-            cluster_name = data.get('cluster_name', 'N/A')
-            print(f"✅ Sent row {index + 1}/{len(df)} - Cluster: {cluster_name}")
+            cluster_name = data.get('cluster_name', data.get('cluster_key', 'N/A'))
+            print(f"✅ Sent row {index + 1}/{len(df)} - Cluster: {cluster_name} ({sent_bytes / (index + 1):.0f} bytes/message)")
             
             # Wait before sending next row
             time.sleep(interval)
@@ -74,7 +178,10 @@ if __name__ == "__main__":
     print(f"📡 Broker: {KAFKA_BROKER}")
     print(f"📢 Topic: {KAFKA_TOPIC}")
     print(f"📄 CSV File: {CSV_FILE}")
-    print(f"⏱️  Interval: {SEND_INTERVAL} seconds\n")
+    print(f"⏱️  Interval: {SEND_INTERVAL} seconds")
+    if VALUE_FORMAT == 'binary':
+        print(f"📦 Format: binary, schema {value_serializer.schema['subject']} v{value_serializer.schema['version']}")
+    print()
     
     # Start sending
     send_csv_to_kafka(CSV_FILE, SEND_INTERVAL)
\ No newline at end of file
@@ -1,7 +1,11 @@
 import streamlit as st
 from utils import data_prep
 from utils import batch_prediction
+from utils import perf
+from utils import profiler
 
+@perf.timed("page.prediction")
+@profiler.profiled("network_page")
 def network_page():
     """Main function to handle the network incident prediction page"""
     try:
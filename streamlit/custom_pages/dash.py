@@ -1,11 +1,15 @@
 import pandas as pd
 import streamlit as st
 from utils import dash_sup
+from utils import perf
 
+@perf.timed("page.dashboard")
 def dashboard_page():
     st.title("📊 Network Incident Dashboard")
     st.markdown("<br>", unsafe_allow_html=True)
 
     dash_sup.show_model_metrics()
+    dash_sup.show_backtest_metrics()
     dash_sup.show_feature_importance()
+    dash_sup.show_importance_job()
     dash_sup.show_outage_distribution()
\ No newline at end of file
@@ -5,6 +5,25 @@ from datetime import datetime
 import pytz
 from snowflake.snowpark.context import get_active_session
 from utils import data_prep_sup
+from utils import dimensions
+from utils import drift
+from utils import explain
+from utils import horizons
+from utils import message_codec
+from utils import perf
+from utils import profiler
+from utils import model_cache
+from utils import model_set
+from utils import prediction_cache
+from utils import lag_tracker
+from utils import alert_state
+from utils import stream_consumer
+
+SOURCE_SNOWFLAKE = "Snowflake Kafka table"
+SOURCE_STREAM = "Stream consumer results"
+
+# Dimension columns shown on the page, filled from the dimension cache
+LIVE_DIMENSIONS = ['olt_id', 'cluster_name', 'city', 'region']
 
 def get_session():
     """Get active Snowflake session"""
@@ -14,6 +33,7 @@ def get_session():
         st.error(f"Failed to get Snowflake session: {e}")
         return None
 
+@perf.timed("live.fetch_live_data_from_kafka")
 def fetch_live_data_from_kafka(session, limit=10):
     """
     Fetch live data from Kafka table in Snowflake
@@ -33,7 +53,8 @@ def fetch_live_data_from_kafka(session, limit=10):
         """
 
         try:
-            count_df = session.sql(count_query).to_pandas()
+            with perf.timer("live.query.count"):
+                count_df = session.sql(count_query).to_pandas()
             total_count = int(count_df['TOTAL_COUNT'].iloc[0])
         except Exception as e:
             st.warning(f"Could not get total count: {e}")
@@ -46,7 +67,8 @@ def fetch_live_data_from_kafka(session, limit=10):
         """
 
         try:
-            sample_df = session.sql(check_query).to_pandas()
+            with perf.timer("live.query.sample"):
+                sample_df = session.sql(check_query).to_pandas()
             st.info(f"📊 Table columns: {list(sample_df.columns)}")
 
             # If RECORD_CONTENT exists, show its structure
@@ -57,13 +79,16 @@ def fetch_live_data_from_kafka(session, limit=10):
 
         # Query to fetch live data from Kafka table
         # Try to parse JSON from RECORD_CONTENT
+        # Dimensions come from the dimension cache: only keys are fetched, plus the
+        # olt_id/cluster_name of full (non-slim) messages that carry no keys
         query = f"""
         SELECT
             RECORD_CONTENT:timestamp_1h::TIMESTAMP_NTZ AS timestamp_1h,
-            RECORD_CONTENT:cluster_name::STRING AS cluster_name,
-            RECORD_CONTENT:city::STRING AS city,
-            RECORD_CONTENT:region::STRING AS region,
-            RECORD_CONTENT:olt_id::STRING AS olt_id,
+            RECORD_CONTENT:olt_key::INT AS olt_key,
+            RECORD_CONTENT:cluster_key::INT AS cluster_key,
+            IFF(RECORD_CONTENT:olt_key IS NULL, RECORD_CONTENT:olt_id::STRING, NULL) AS olt_id,
+            IFF(RECORD_CONTENT:cluster_key IS NULL, RECORD_CONTENT:cluster_name::STRING, NULL) AS cluster_name,
+            IFF(IS_OBJECT(RECORD_CONTENT), NULL, RECORD_CONTENT::STRING) AS record_binary,
             RECORD_CONTENT:hour_of_day::INT AS hour_of_day,
             RECORD_CONTENT:is_maintenance_window::INT AS is_maintenance_window,
             RECORD_CONTENT:offline_ont_now::INT AS offline_ont_now,
@@ -80,6 +105,7 @@ def fetch_live_data_from_kafka(session, limit=10):
             RECORD_CONTENT:sent_at::STRING AS sent_at,
             RECORD_CONTENT:row_index::INT AS row_index,
             TO_TIMESTAMP_NTZ(RECORD_METADATA:CreateTime::NUMBER / 1000) AS ingested_time,
+            RECORD_METADATA:SnowflakeConnectorPushTime::NUMBER AS connector_push_time,
             RECORD_METADATA
         FROM HACKATHON.RAW.KAFKA_RAW_ML_FEATURES
         ORDER BY RECORD_METADATA:CreateTime DESC
@@ -87,7 +113,10 @@ def fetch_live_data_from_kafka(session, limit=10):
         """
 
         # Execute query and convert to Pandas
-        df = session.sql(query).to_pandas()
+        with perf.timer("live.query.records"):
+            df = session.sql(query).to_pandas()
+        fetched_at = pd.Timestamp.now(tz='UTC')
+        perf.count("live_rows_fetched", len(df))
 
         # Drop metadata column if it exists
         if 'RECORD_METADATA' in df.columns:
@@ -95,6 +124,16 @@ def fetch_live_data_from_kafka(session, limit=10):
 
         # Convert all column names to lowercase for consistency
         df.columns = df.columns.str.lower()
+        perf.count("live_fetch_bytes", int(df.memory_usage(deep=True, index=False).sum()))
+
+        # Schema-encoded binary messages (VALUE_FORMAT=binary) land as text, not as a JSON object
+        if 'record_binary' in df.columns:
+            with perf.timer("live.decode_binary"):
+                df = message_codec.decode_column(df, 'record_binary')
+
+        # OLT, cluster, city and region by vectorized lookup of the keys
+        with perf.timer("live.enrich"):
+            df = dimensions.enrich(df, LIVE_DIMENSIONS)
 
         # Fix ingested_time if it's in epoch format (milliseconds)
         if 'ingested_time' in df.columns:
@@ -108,6 +147,8 @@ def fetch_live_data_from_kafka(session, limit=10):
             indonesia_tz = pytz.timezone('Asia/Jakarta')
             df['ingested_time'] = df['ingested_time'].dt.tz_localize('UTC').dt.tz_convert(indonesia_tz)
 
+        df['fetched_at'] = fetched_at
+
         return df, total_count
 
     except Exception as e:
@@ -116,12 +157,14 @@ def fetch_live_data_from_kafka(session, limit=10):
         st.error(traceback.format_exc())
         return pd.DataFrame(), None
 
-def process_and_predict(df):
+@perf.timed("live.process_and_predict")
+def process_and_predict(df, ensemble=False):
     """
     Process live data and make predictions
 
     Args:
         df: DataFrame with raw live data
+        ensemble: Use the weighted ensemble of the model set instead of the primary model
 
     Returns:
         pd.DataFrame: DataFrame with predictions
@@ -164,65 +207,66 @@ def process_and_predict(df):
             st.write("Available columns:", list(df.columns))
             return df
 
-        # Process data with same pipeline as batch prediction
-        df_processed = data_prep_sup.handling_skewness(df.copy())
-        df_processed = data_prep_sup.add_time_feats(df_processed)
-        df_processed = data_prep_sup.add_roll_delta(df_processed, group_key="olt_id", windows=(6, 24))
-
-        # Drop temp_anomaly_score due to multicollinearity
-        if 'temp_anomaly_score' in df_processed.columns:
-            df_processed = df_processed.drop(columns=['temp_anomaly_score'])
-
-        # Build feature list
-        num_base = [
-            'offline_ont_ratio', 'trap_trend_score', 'fault_rate',
-            'snr_avg', 'rx_power_avg_dbm', 'temperature_avg_c',
-            'hour_sin', 'hour_cos', 'is_maintenance_window'
-        ]
-
-        ROLL_KEYS = [
-            'link_loss_count_log', 'bad_rsl_count_log', 'high_temp_count_log',
-            'dying_gasp_count_log', 'offline_ont_now_log'
-        ]
-
-        roll_cols = [
-            c for c in df_processed.columns
-            if any(s in c for s in ["_delta_1h", "_roll6h_mean", "_roll24h_mean"])
-            and any(c.startswith(k.replace('_log', '')) for k in ROLL_KEYS)
-        ]
-
-        feature_cols_all = [c for c in num_base if c in df_processed.columns] + roll_cols
-
-        # Select only features needed
-        df_features = df_processed[feature_cols_all].copy()
-
-        # Handle NaN values
-        df_features = df_features.replace([float('inf'), float('-inf')], float('nan')).fillna(0.0).astype(float)
-
-        # Validate and reorder columns
-        df_features = data_prep_sup.validate_and_reorder_columns(df_features)
+        # Process data with same pipeline as single prediction
+        df_features = data_prep_sup.build_feature_matrix(df.copy())
 
-        # Make predictions for all rows
-        predictions = []
-        probabilities = []
-
-        for idx in range(len(df_features)):
-            # Get single row for prediction
-            df_row = df_features.iloc[[idx]].copy()
-
-            # Make prediction
+        # Score only rows not seen before (same OLT, hour, features and model version),
+        # in one call; shadow and horizon models run alongside the primary
+        try:
+            models = model_set.get_model_set(ensemble=ensemble)
+            horizon_set = horizons.get_horizon_set()
+            columns = horizon_set.probability_columns()
+
+            def score_and_observe(X):
+                # Only rows not seen before reach the scorer, so each row feeds the drift monitor once
+                proba = horizon_set.score(X, models.score).to_numpy()
+                drift.observe(X, df, df.loc[X.index, 'region'] if 'region' in df.columns else None)
+                return proba[:, 0] if len(columns) == 1 else proba
+
+            probabilities, scored_rows = prediction_cache.score_with_cache(
+                df_features,
+                olt_ids=df.loc[df_features.index, 'olt_id'],
+                timestamps=df.loc[df_features.index, 'timestamp_1h'],
+                scorer=score_and_observe,
+                model_version=models.version_key() + (f"|{horizon_set.version_key()}" if len(columns) > 1 else ''),
+                width=len(columns),
+            )
+            perf.count("live_rows_scored", scored_rows)
+            cache_info = prediction_cache.get_prediction_cache().snapshot()
+            st.caption(f"🧠 Scored {scored_rows} new rows, {len(df_features) - scored_rows} served from prediction cache "
+                       f"(hit rate {cache_info['hit_rate']:.1%}, {cache_info['size']} cached)")
+            predictions = horizon_set.with_labels(pd.DataFrame(probabilities.reshape(len(df_features), -1),
+                                                               index=df_features.index, columns=columns))
+            for col in predictions.columns:
+                df[col] = predictions[col]
+            df['predicted_at'] = pd.Timestamp.now(tz='UTC')
+        except Exception as e:
+            st.warning(f"⚠️ Error predicting live rows: {str(e)}")
+            df['label_outage_1h'] = None
+            df['outage_probability'] = None
+            models = None
+
+        # Per-row SHAP contributions of the primary model, cached like the predictions;
+        # dropped first so a failed refresh never shows the previous refresh's rows
+        st.session_state.pop('live_contributions', None)
+        if models is not None:
             try:
-                prediction, probability = data_prep_sup.make_prediction(df_row, threshold=0.4753)
-                predictions.append(prediction)
-                probabilities.append(probability[0])
+                contrib, explained_rows = explain.explain_with_cache(
+                    df_features,
+                    olt_ids=df.loc[df_features.index, 'olt_id'],
+                    timestamps=df.loc[df_features.index, 'timestamp_1h'],
+                    model=models.primary_model(),
+                    model_version=models.primary_version_key(),
+                )
+                df['top_factors'] = explain.top_factors(contrib)
+                st.session_state['live_contributions'] = contrib.assign(
+                    olt_id=df.loc[contrib.index, 'olt_id'], timestamp_1h=df.loc[contrib.index, 'timestamp_1h'])
+                perf.count("live_rows_explained", explained_rows)
             except Exception as e:
-                st.warning(f"⚠️ Error predicting row {idx + 1}: {str(e)}")
-                predictions.append(None)
-                probabilities.append(None)
+                st.caption(f"No per-row explanations: {e}")
 
-        # Add predictions to original dataframe
-        df['label_outage_1h'] = predictions
-        df['outage_probability'] = probabilities
+        # Produce -> ingest -> fetch -> prediction lag, recorded once per record
+        df = lag_tracker.record(df)
 
         # Sort by ingested_time (descending - latest first) for display
         if 'ingested_time' in df.columns:
@@ -234,8 +278,10 @@ def process_and_predict(df):
         st.error(f"Error processing data: {e}")
         return df
 
+@profiler.profiled("live_prediction_page")
 def live_prediction_page():
     """Live Prediction page - fetch and predict on streaming data from Kafka"""
+    page_started = time.perf_counter()
     st.title("📡 Live Network Prediction from Kafka Stream")
 
     st.write("""
@@ -247,14 +293,23 @@ def live_prediction_page():
     The predictions update automatically to help you monitor network health in real-time.
     """)
 
-    # Get Snowflake session
-    session = get_session()
-
-    if session is None:
-        st.error("❌ Cannot connect to Snowflake session. Please ensure you're running in Snowflake Streamlit.")
-        return
-
     # Controls
+    source = st.radio(
+        "Data source",
+        options=[SOURCE_SNOWFLAKE, SOURCE_STREAM],
+        horizontal=True,
+        help="Stream consumer results are scored by `python -m utils.stream_consumer` straight from the Kafka topic"
+    )
+
+    session = None
+    if source == SOURCE_SNOWFLAKE:
+        # Get Snowflake session
+        session = get_session()
+
+        if session is None:
+            st.error("❌ Cannot connect to Snowflake session. Please ensure you're running in Snowflake Streamlit.")
+            return
+
     col1, col2, col3 = st.columns([2, 2, 1])
 
     with col1:
@@ -262,6 +317,8 @@ def live_prediction_page():
 
     with col2:
         auto_refresh = st.checkbox("Auto-refresh (every 10 seconds)", value=False)
+        ensemble = st.checkbox("Weighted ensemble (CatBoost + XGBoost)", value=False,
+                               disabled=source == SOURCE_STREAM)
 
     with col3:
         if st.button("🔄 Refresh Now"):
@@ -270,22 +327,36 @@ def live_prediction_page():
     # Fetch and display live data
     st.subheader("📊 Live Data from Kafka Stream")
 
-    with st.spinner("Fetching live data from Kafka..."):
-        df, total_records_in_table = fetch_live_data_from_kafka(session, limit=num_records)
+    if source == SOURCE_STREAM:
+        # Already scored by the consumer service, only read the latest results
+        with perf.timer("live.read_stream_results"):
+            df_with_predictions = stream_consumer.read_results(stream_consumer.RESULTS_DIR, limit=num_records)
+        total_records_in_table = None
+
+        if df_with_predictions.empty:
+            st.warning(f"⚠️ No results in {stream_consumer.RESULTS_DIR}. "
+                       "Start the consumer with `python -m utils.stream_consumer` from the streamlit/ directory.")
+            return
+        st.info(f"📡 Displaying {len(df_with_predictions)} latest records scored by the stream consumer")
+        df_with_predictions = dimensions.enrich(df_with_predictions, LIVE_DIMENSIONS)
+        df_with_predictions = lag_tracker.record(df_with_predictions)
+    else:
+        with st.spinner("Fetching live data from Kafka..."):
+            df, total_records_in_table = fetch_live_data_from_kafka(session, limit=num_records)
 
-    if df.empty:
-        st.warning("⚠️ No data available in Kafka stream. Please ensure Kafka producer is sending data.")
-        return
+        if df.empty:
+            st.warning("⚠️ No data available in Kafka stream. Please ensure Kafka producer is sending data.")
+            return
 
-    # Display info about fetched records
-    if total_records_in_table is not None:
-        st.info(f"📡 Total records in Kafka table: {total_records_in_table} | Displaying latest {len(df)} records")
-    else:
-        st.info(f"📡 Displaying {len(df)} latest records from Kafka stream")
+        # Display info about fetched records
+        if total_records_in_table is not None:
+            st.info(f"📡 Total records in Kafka table: {total_records_in_table} | Displaying latest {len(df)} records")
+        else:
+            st.info(f"📡 Displaying {len(df)} latest records from Kafka stream")
 
-    # Process and predict
-    with st.spinner("Processing data and making predictions..."):
-        df_with_predictions = process_and_predict(df)
+        # Process and predict
+        with st.spinner("Processing data and making predictions..."):
+            df_with_predictions = process_and_predict(df, ensemble=ensemble)
 
     # Display results
     st.subheader("🔮 Predictions on Live Data")
@@ -319,6 +390,10 @@ def live_prediction_page():
     # Create a display dataframe with relevant columns
     display_cols = ['ingested_time', 'timestamp_1h', 'city', 'region', 'cluster_name', 'olt_id', 'offline_ont_now',
                     'temperature_avg_c', 'fault_rate', 'offline_ont_ratio', 'label_outage_1h', 'outage_probability']
+    # Longer horizons, when their models are deployed
+    for horizon in horizons.HORIZON_MODELS:
+        display_cols += [horizons.label_column(horizon), horizons.probability_column(horizon)]
+    display_cols += ['top_factors']
 
     display_df = df_with_predictions[[col for col in display_cols if col in df_with_predictions.columns]].copy()
 
@@ -329,9 +404,9 @@ def live_prediction_page():
     if 'timestamp_1h' in display_df.columns:
         display_df['timestamp_1h'] = pd.to_datetime(display_df['timestamp_1h']).dt.strftime('%Y-%m-%d %H:%M:%S')
 
-    # Format probability as percentage
-    if 'outage_probability' in display_df.columns:
-        display_df['outage_probability'] = display_df['outage_probability'].apply(lambda x: f"{x*100:.2f}%" if pd.notna(x) else "N/A")
+    # Format probabilities as percentages
+    for col in [c for c in display_df.columns if c.startswith('outage_probability')]:
+        display_df[col] = display_df[col].apply(lambda x: f"{x*100:.2f}%" if pd.notna(x) else "N/A")
 
     # Style the dataframe
     def highlight_outage(row):
@@ -340,24 +415,110 @@ def live_prediction_page():
         else:
             return ['background-color: #ccffcc'] * len(row)
 
-    styled_df = display_df.style.apply(highlight_outage, axis=1)
-
-    st.dataframe(styled_df, height=1000, use_container_width=True)
-
-    # Show alerts for predicted outages
-    if 'label_outage_1h' in df_with_predictions.columns:
-        outage_rows = df_with_predictions[df_with_predictions['label_outage_1h'] == 1]
-
-        if len(outage_rows) > 0:
-            st.error(f"⚠️ **ALERT:** {len(outage_rows)} potential outage(s) detected!")
-
-            for idx, row in outage_rows.iterrows():
-                cluster = row.get('cluster_name', 'Unknown')
-                olt = row.get('olt_id', 'Unknown')
-                prob = row.get('outage_probability', 0)
-                timestamp = row.get('timestamp_1h', 'Unknown')
+    # Styler work is lazy and runs inside st.dataframe, so time both together
+    with perf.timer("live.render_table"):
+        styled_df = display_df.style.apply(highlight_outage, axis=1)
+        st.dataframe(styled_df, height=1000, use_container_width=True)
+
+    # Why a row got its probability: SHAP contributions in log-odds
+    contributions = st.session_state.get('live_contributions') if source == SOURCE_SNOWFLAKE else None
+    if contributions is not None and not contributions.empty:
+        with st.expander("🧠 Why? Per-row feature contributions"):
+            labels = (contributions['olt_id'].astype(str) + " @ " + contributions['timestamp_1h'].astype(str)).tolist()
+            picked = st.selectbox("Prediction", options=range(len(labels)), format_func=labels.__getitem__,
+                                  key="live_explain_row")
+            row = contributions.iloc[picked].drop(['olt_id', 'timestamp_1h', explain.BASE_VALUE]).astype(float)
+            row = row[row.abs().sort_values(ascending=False).index[:10]]
+            st.bar_chart(row.rename("contribution (log-odds)"), horizontal=True)
+            st.caption(f"Base value {contributions[explain.BASE_VALUE].iloc[picked]:.3f} log-odds; "
+                       "positive contributions push towards an outage.")
+
+    # Show alerts for predicted outages: per-OLT state with hysteresis, fed only rows not seen before
+    if 'outage_probability' in df_with_predictions.columns:
+        tracker = alert_state.get_alert_tracker()
+        # A new session starts from now; currently open alerts are listed below anyway
+        st.session_state.setdefault('alert_seq', tracker.last_seq())
+        with perf.timer("live.alerts.update"):
+            tracker.update(df_with_predictions)
+
+        # Transitions since this session last looked (the tracker is shared by all sessions)
+        new_events = tracker.history(after_seq=st.session_state['alert_seq'])
+        st.session_state['alert_seq'] = tracker.last_seq()
+        for _, event in new_events.iterrows():
+            cluster = event.get('cluster_name', 'Unknown')
+            if event['event'] == 'opened':
+                st.warning(f"🔴 **{cluster}** - OLT: {event['olt_id']} | Time: {event['timestamp_1h']} | "
+                           f"Probability: {event['probability']*100:.2f}%")
+            else:
+                st.success(f"✅ **{cluster}** - OLT: {event['olt_id']} cleared at {event['timestamp_1h']} | "
+                           f"Open for {event['duration_h']:.0f}h, peak {event['peak_probability']*100:.2f}%")
+
+        open_alerts = tracker.open_alerts()
+        if len(open_alerts) > 0:
+            st.error(f"⚠️ **ALERT:** {len(open_alerts)} OLT(s) with an open outage alert!")
+            st.dataframe(open_alerts, hide_index=True, width="stretch")
+
+        with st.expander("📜 Alert History"):
+            st.caption(f"Alerts open at {tracker.enter_threshold:.2%} and close below {tracker.exit_threshold:.2%}.")
+            hist_col1, hist_col2 = st.columns(2)
+            with hist_col1:
+                olt_filter = st.text_input("OLT ID", value="", key="alert_history_olt")
+            with hist_col2:
+                event_filter = st.selectbox("Event", options=['all', 'opened', 'closed'], key="alert_history_event")
+            history = tracker.history(
+                olt_id=olt_filter.strip() or None,
+                event=None if event_filter == 'all' else event_filter,
+            )
+            if history.empty:
+                st.caption("No alert transitions yet.")
+            else:
+                st.dataframe(history.iloc[::-1], hide_index=True, width="stretch")
+                st.download_button(
+                    label="📥 Download alert history",
+                    data=history.to_csv(index=False),
+                    file_name="alert_history.csv",
+                    mime="text/csv"
+                )
+
+    # End-to-end pipeline lag per region
+    st.markdown("### ⏱️ Pipeline Lag by Region")
+    lag_summary = lag_tracker.summary()
+    if lag_summary.empty:
+        st.caption("No lag samples yet (records need sent_at and an ingest time).")
+    else:
+        breaches = lag_tracker.slo_breaches(lag_summary)
+        for _, breach in breaches.iterrows():
+            st.warning(f"🐢 **{breach['region']}**: p95 produce → prediction lag "
+                       f"{breach['produce_to_prediction_p95']:.0f}s exceeds the {lag_tracker.LAG_SLO_S:.0f}s SLO")
+
+        lag_cols = ['region', 'records'] + [f"{stage[:-2]}_{p}" for stage in lag_tracker.STAGES for p in ('p50', 'p95')]
+        st.dataframe(
+            lag_summary[lag_cols],
+            hide_index=True,
+            width="stretch",
+            column_config={col: st.column_config.NumberColumn(col.replace('_', ' ') + " (s)", format="%.1f")
+                           for col in lag_cols[2:]},
+        )
+        st.caption(f"Rolling window of the last {lag_tracker.WINDOW_SIZE} records seen by this server. "
+                   f"Ingest time is the connector push time when available, else the Kafka CreateTime.")
+
+    # Shadow/ensemble model comparison
+    with st.expander("🧪 Model Set Latency, Cache & Shadow Disagreement"):
+        try:
+            st.dataframe(model_set.get_model_set(ensemble=ensemble).latency_stats(), hide_index=True, width="stretch")
+            horizon_stats = horizons.get_horizon_set().latency_stats()
+            if not horizon_stats.empty:
+                st.dataframe(horizon_stats, hide_index=True, width="stretch")
+            st.caption(f"Model cache: {model_cache.cache_stats()}")
+            st.dataframe(model_cache.handles_info(), hide_index=True, width="stretch")
+            log_df = model_set.disagreement_log()
+            if not log_df.empty:
+                st.dataframe(log_df.tail(20).iloc[::-1], hide_index=True, width="stretch")
+        except Exception as e:
+            st.warning(f"Model set unavailable: {e}")
 
-                st.warning(f"🔴 **{cluster}** - OLT: {olt} | Time: {timestamp} | Probability: {prob*100:.2f}%")
+    # Page time excludes the auto-refresh wait below
+    perf.observe("page.live_prediction", time.perf_counter() - page_started)
 
     # Auto-refresh logic
     if auto_refresh:
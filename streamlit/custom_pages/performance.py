@@ -0,0 +1,125 @@
+import streamlit as st
+import plotly.express as px
+from utils import drift
+from utils import model_cache
+from utils import perf
+from utils import prediction_cache
+
+def show_feature_drift():
+    """Drift of the live model inputs against the training baseline, overall and per region"""
+    st.subheader("📐 Feature Drift")
+    monitor = drift.get_monitor()
+    if monitor is None:
+        st.info(f"No training baseline at {drift.BASELINE_PATH}. Build it with "
+                "`python -m utils.drift fact_ml_features.parquet --start ... --end ...` over the training window.")
+        return
+
+    report = monitor.report()
+    overall = report[report['region'] == drift.ALL_REGIONS]
+    flags = drift.flagged(report)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Features monitored", len(monitor.features))
+    col2.metric("Rows observed", f"{monitor.rows_seen:,}")
+    col3.metric("Drifting", int((overall['status'] == 'drift').sum()))
+    col4.metric("Flags incl. regions", len(flags))
+    st.caption(f"Recent traffic (half-life {drift.HALF_LIFE_ROWS:,.0f} rows) vs. the {monitor.baseline['rows']:,} "
+               f"training rows of the baseline. PSI ≥ {drift.PSI_WATCH} is flagged 'watch', ≥ {drift.PSI_DRIFT} "
+               f"'drift'; a KS gap ≥ {drift.KS_WATCH} significant at α={drift.KS_ALPHA} is flagged 'watch'.")
+
+    if overall['status'].eq('too few rows').all():
+        st.info(f"Fewer than {drift.MIN_ROWS:,} rows observed so far; drift is reported once enough are scored.")
+        return
+
+    for row in flags[flags['status'] == 'drift'].head(5).itertuples(index=False):
+        st.warning(f"⚠️ {row.feature} has drifted in {row.region} (PSI {row.psi:.2f}, KS {row.ks:.2f})")
+
+    if not flags.empty:
+        st.dataframe(
+            flags,
+            hide_index=True,
+            width="stretch",
+            column_config={
+                "rows": st.column_config.NumberColumn("Rows", format="%.0f"),
+                "psi": st.column_config.NumberColumn("PSI", format="%.3f"),
+                "ks": st.column_config.NumberColumn("KS", format="%.3f"),
+                "ks_critical": st.column_config.NumberColumn("KS critical", format="%.3f"),
+            },
+        )
+
+    psi = report.pivot(index='feature', columns='region', values='psi')
+    fig = px.imshow(psi, color_continuous_scale='OrRd', zmin=0, zmax=drift.PSI_DRIFT * 2, aspect='auto',
+                    height=max(300, 22 * len(psi)))
+    fig.update_layout(xaxis_title='', yaxis_title='', margin=dict(t=20, b=0), coloraxis_colorbar_title='PSI')
+    st.plotly_chart(fig, use_container_width=True)
+
+    if st.button("🧹 Reset drift histograms"):
+        monitor.reset()
+        st.rerun()
+
+def performance_page():
+    """Performance page - process-wide latency per stage and hot-path counters"""
+    st.title("📟 Performance")
+
+    st.write("""
+    Latency of every instrumented stage (Kafka queries, feature pipeline, model scoring, rendering and page runs),
+    aggregated over all sessions since the server process started. Percentiles use the most recent samples of each stage.
+    """)
+
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        if st.button("🔄 Refresh"):
+            st.rerun()
+    with col2:
+        if st.button("🧹 Reset metrics"):
+            perf.reset()
+            st.rerun()
+
+    summary = perf.stage_summary()
+    if summary.empty:
+        st.info("No samples yet. Open the Prediction, Dashboard or Live Prediction page to collect timings.")
+    else:
+        st.subheader("⏱️ Stage Latency")
+        st.dataframe(
+            summary,
+            hide_index=True,
+            width="stretch",
+            column_config={
+                "p50_ms": st.column_config.NumberColumn("p50 (ms)", format="%.1f"),
+                "p95_ms": st.column_config.NumberColumn("p95 (ms)", format="%.1f"),
+                "p99_ms": st.column_config.NumberColumn("p99 (ms)", format="%.1f"),
+                "mean_ms": st.column_config.NumberColumn("Mean (ms)", format="%.1f"),
+                "total_s": st.column_config.NumberColumn("Total (s)", format="%.2f"),
+            },
+        )
+
+        fig = px.bar(
+            summary.sort_values('p95_ms'),
+            x='p95_ms',
+            y='stage',
+            orientation='h',
+            height=max(300, 28 * len(summary)),
+        )
+        fig.update_layout(
+            xaxis_title='p95 latency (ms)',
+            yaxis_title='',
+            plot_bgcolor='rgba(0,0,0,0)',
+            margin=dict(t=20, b=0)
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    show_feature_drift()
+
+    st.subheader("🔢 Counters")
+    counters = perf.counters()
+    counters.update({f"prediction_cache_{k}": v for k, v in prediction_cache.get_prediction_cache().snapshot().items()})
+    counters.update({f"model_cache_{k}": v for k, v in model_cache.cache_stats().items()})
+    st.json(counters)
+
+    st.subheader("📤 Export")
+    st.caption("Prometheus text format. Set PERF_METRICS_PORT to also serve it at http://<host>:<port>/metrics for scraping.")
+    st.download_button(
+        label="📥 Download metrics",
+        data=perf.prometheus_text(),
+        file_name="netmon_metrics.txt",
+        mime="text/plain"
+    )
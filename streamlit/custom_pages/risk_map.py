@@ -0,0 +1,97 @@
+import time
+import numpy as np
+import streamlit as st
+from streamlit_folium import st_folium
+from utils import alert_state
+from utils import perf
+from utils import risk_map
+from utils import stream_consumer
+
+SOURCE_LIVE = "Live page predictions"
+SOURCE_STREAM = "Stream consumer results"
+
+# Rows read from the stream results to find every OLT's latest prediction
+STREAM_ROWS = 50_000
+
+def _latest_predictions(source: str):
+    if source == SOURCE_STREAM:
+        results = stream_consumer.read_results(stream_consumer.RESULTS_DIR, limit=STREAM_ROWS)
+        if results.empty:
+            return results
+        return results[['olt_id', 'timestamp_1h', 'outage_probability']]
+    return alert_state.get_alert_tracker().latest()
+
+@perf.timed("page.risk_map")
+def risk_map_page():
+    """Risk Map page - latest predicted outage risk per OLT, aggregated per city/region"""
+    st.title("🗺️ Outage Risk Map")
+
+    st.write("""
+    Latest predicted outage risk of every OLT, clustered by location, with the worst risk per city or region.
+    Markers update in place as new predictions arrive; zoom in to see individual OLTs.
+    """)
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        source = st.radio("Risk source", options=[SOURCE_LIVE, SOURCE_STREAM], horizontal=True,
+                          help="Live page predictions are shared by every session that opened the Live Prediction page")
+    with col2:
+        level = st.radio("Aggregate by", options=["city", "region"], horizontal=True)
+    with col3:
+        auto_refresh = st.checkbox("Auto-refresh (every 10 seconds)", value=False)
+        if st.button("🔄 Refresh Now"):
+            st.rerun()
+
+    geometry = risk_map.build_geometry()
+    risk = risk_map.align_risk(geometry, _latest_predictions(source))
+
+    # Keyframe + deltas: the base map's rows are only serialized again when a new keyframe is taken
+    state = st.session_state.setdefault('risk_map', {'keyframe': None, 'keyframes': 0, 'source': None, 'rows': None})
+    keyframe = state['keyframe']
+    changed = risk_map.changed_since(keyframe, risk) if keyframe is not None and len(keyframe) == len(risk) else None
+    started = time.perf_counter()
+    if changed is None or state['source'] != source or len(changed) > risk_map.KEYFRAME_CHANGED_SHARE * len(risk):
+        keyframe = state['keyframe'] = risk.copy()
+        state['keyframes'] += 1
+        state['source'] = source
+        with perf.timer("map.keyframe"):
+            state['rows'] = risk_map.keyframe_rows(geometry, keyframe)
+        changed = np.array([], dtype=int)
+
+    with perf.timer("map.build"):
+        m = risk_map.base_map(state['rows'])
+        summary = risk_map.aggregate(geometry, risk, level)
+        layers = [risk_map.aggregate_layer(summary, level), risk_map.delta_layer(geometry, risk, changed)]
+    build_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with perf.timer("map.render"):
+        st_folium(m, key="risk_map", feature_group_to_add=layers, height=600, use_container_width=True,
+                  returned_objects=[])
+    render_ms = (time.perf_counter() - started) * 1000
+
+    predicted = int((~np.isnan(risk)).sum())
+    high = int((risk >= risk_map.HIGH_RISK).sum())
+    metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+    metric_col1.metric("OLTs on map", len(geometry))
+    metric_col2.metric("With a prediction", predicted)
+    metric_col3.metric("High risk", high)
+    metric_col4.metric("Changed since keyframe", len(changed))
+    st.caption(f"⏱️ Map built in {build_ms:.0f} ms, rendered in {render_ms:.0f} ms. "
+               f"Keyframe #{state['keyframes']}; this refresh pushed {len(changed)} marker update(s) "
+               f"and {len(summary)} {level} aggregate(s).")
+
+    st.subheader(f"Risk by {level}")
+    st.dataframe(
+        summary.drop(columns=['lat', 'lon']).sort_values(['high_risk', 'max_risk'], ascending=False),
+        hide_index=True,
+        width="stretch",
+        column_config={
+            "mean_risk": st.column_config.NumberColumn("Mean risk", format="%.3f"),
+            "max_risk": st.column_config.NumberColumn("Max risk", format="%.3f"),
+        },
+    )
+
+    if auto_refresh:
+        time.sleep(10)
+        st.rerun()
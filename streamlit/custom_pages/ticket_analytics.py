@@ -0,0 +1,110 @@
+import time
+import streamlit as st
+import plotly.express as px
+from utils import perf
+from utils import ticket_rollups
+
+METRICS = {
+    "Tickets": "tickets",
+    "Open tickets": "ticket_open",
+    "Close rate": "close_rate",
+    "Avg holding time (hr)": "avg_holding_time_hr",
+    "Avg downtime (hr)": "avg_downtime_hr",
+    "Avg rating": "avg_rating",
+    "Avg satisfaction": "avg_satisfaction",
+    "Negative share": "negative_share",
+}
+
+def _refresh_controls():
+    if st.button("🔄 Refresh cube", help="Process ticket days newer than the cube's watermark"):
+        with st.spinner("Refreshing ticket cube..."):
+            stats = ticket_rollups.refresh()
+        st.session_state.ticket_cube_refresh = stats
+        st.rerun()
+    stats = st.session_state.get('ticket_cube_refresh')
+    if stats:
+        st.caption(f"Last refresh: {stats['mode']}, {stats['ticket_rows']:,} ticket row(s) over {stats['days']} day(s) "
+                   f"read in {stats['seconds']:.2f}s; cube has {stats['cells']:,} cells up to {stats['watermark']}.")
+
+@perf.timed("page.ticket_analytics")
+def ticket_analytics_page():
+    """Ticket Analytics page - slice tickets and customer feedback from the pre-aggregated rollup cube"""
+    st.title("🎫 Ticket Analytics")
+
+    st.write("""
+    Tickets and customer feedback per day, city, region, root-cause category and severity, answered from a
+    pre-aggregated rollup cube. Severity is derived from the number of urgency visits.
+    """)
+
+    cube = ticket_rollups.get_ticket_cube()
+    if cube is None:
+        st.info("The ticket cube has not been built yet. Build it here or with `python -m utils.ticket_rollups`.")
+        _refresh_controls()
+        return
+
+    start, end = cube.values('date')
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        dates = st.date_input("Date range", value=(start.date(), end.date()), min_value=start.date(),
+                              max_value=end.date())
+        regions = st.multiselect("Region", options=cube.values('region'))
+    with col2:
+        cities = st.multiselect("City", options=cube.values('city'))
+        categories = st.multiselect("Category", options=cube.values('category'))
+    with col3:
+        severities = st.multiselect("Severity", options=cube.values('severity'))
+        group_by = st.selectbox("Break down by", options=['region', 'city', 'category', 'severity'])
+    grain = st.radio("Time grain", options=list(ticket_rollups.TIME_GRAINS), index=2, horizontal=True)
+    metric_label = st.selectbox("Metric", options=list(METRICS))
+    metric = METRICS[metric_label]
+
+    filters = {'region': regions, 'city': cities, 'category': categories, 'severity': severities}
+    if isinstance(dates, tuple) and len(dates) == 2:
+        filters['date'] = dates
+
+    started = time.perf_counter()
+    with perf.timer("rollups.query"):
+        totals = cube.query(filters)
+        breakdown = cube.query(filters, [group_by])
+        trend = cube.query(filters, ['date', group_by], grain)
+    query_ms = (time.perf_counter() - started) * 1000
+
+    if not totals['tickets'].iloc[0]:
+        st.warning("No tickets match the filters.")
+        _refresh_controls()
+        return
+
+    overall = totals.iloc[0]
+    metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+    metric_col1.metric("Tickets", f"{int(overall['tickets']):,}")
+    metric_col2.metric("Close rate", f"{overall['close_rate']:.1%}")
+    metric_col3.metric("Avg rating", f"{overall['avg_rating']:.2f}")
+    metric_col4.metric("Negative sentiment", f"{overall['negative_share']:.1%}")
+    st.caption(f"⏱️ Answered from {len(cube.cells):,} cube cells in {query_ms:.1f} ms "
+               f"(cube up to {cube.meta.get('watermark', '?')}).")
+
+    st.subheader(f"{metric_label} over time by {group_by}")
+    fig = px.line(trend, x='date', y=metric, color=group_by, height=400)
+    fig.update_layout(xaxis_title='', yaxis_title=metric_label, plot_bgcolor='rgba(0,0,0,0)', margin=dict(t=20, b=0))
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader(f"By {group_by}")
+    st.dataframe(
+        breakdown[[group_by, 'tickets', 'ticket_open', 'ticket_closed', 'close_rate', 'avg_holding_time_hr',
+                   'avg_downtime_hr', 'avg_rating', 'avg_satisfaction', 'positive_share', 'neutral_share',
+                   'negative_share']].sort_values('tickets', ascending=False),
+        hide_index=True,
+        width="stretch",
+        column_config={
+            "close_rate": st.column_config.NumberColumn("Close rate", format="%.3f"),
+            "avg_holding_time_hr": st.column_config.NumberColumn("Avg holding (hr)", format="%.1f"),
+            "avg_downtime_hr": st.column_config.NumberColumn("Avg downtime (hr)", format="%.1f"),
+            "avg_rating": st.column_config.NumberColumn("Avg rating", format="%.2f"),
+            "avg_satisfaction": st.column_config.NumberColumn("Avg satisfaction", format="%.3f"),
+            "positive_share": st.column_config.NumberColumn("Positive", format="%.3f"),
+            "neutral_share": st.column_config.NumberColumn("Neutral", format="%.3f"),
+            "negative_share": st.column_config.NumberColumn("Negative", format="%.3f"),
+        },
+    )
+
+    _refresh_controls()
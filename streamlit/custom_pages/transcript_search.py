@@ -0,0 +1,79 @@
+import time
+import pandas as pd
+import streamlit as st
+from utils import perf
+from utils import transcript_search
+
+def _refresh_controls():
+    if st.button("🔄 Index new transcripts", help="Index transcripts added since the last refresh"):
+        try:
+            with st.spinner("Indexing transcripts..."):
+                st.session_state.transcript_index_refresh = transcript_search.refresh()
+        except FileNotFoundError as e:
+            # Warehouse unavailable: keep serving the index already on disk
+            st.session_state.transcript_index_refresh = {'error': str(e)}
+        st.rerun()
+    stats = st.session_state.get('transcript_index_refresh')
+    if stats and 'error' in stats:
+        st.warning(f"Could not refresh the index, searching the existing one. {stats['error']}")
+    elif stats:
+        st.caption(f"Last refresh: {stats['mode']}, {stats['indexed']:,} new transcript(s) in {stats['seconds']:.2f}s; "
+                   f"{stats['docs']:,} indexed in {stats['segments']} segment(s).")
+
+@perf.timed("page.transcript_search")
+def transcript_search_page():
+    """Transcript Search page - BM25 search over operator transcripts from the local index"""
+    st.title("🔎 Transcript Search")
+
+    st.write("""
+    Search NOC operator transcripts by keyword, ranked by relevance, and narrow them down by OLT, cluster,
+    severity and time. Answers come from a local index, so search keeps working without the warehouse.
+    Leave the query empty to list the newest matching transcripts.
+    """)
+
+    index = transcript_search.get_transcript_index()
+    if index is None:
+        st.info("The transcript index has not been built yet. Build it here or with "
+                "`python -m utils.transcript_search refresh`.")
+        _refresh_controls()
+        return
+
+    query = st.text_input("Search transcripts", placeholder="e.g. link loss low optical power")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        olt_ids = st.multiselect("OLT", options=index.values('olt_id'))
+        severities = st.multiselect("Severity", options=index.values('severity_bucket'))
+    with col2:
+        cluster_ids = st.multiselect("Cluster", options=index.values('cluster_id'))
+        limit = st.slider("Results", min_value=10, max_value=200, value=20, step=10)
+    with col3:
+        use_dates = st.checkbox("Filter by date", value=False)
+        start = end = None
+        if use_dates:
+            first, last = index.time_range()
+            dates = st.date_input("Date range", value=(first.date(), last.date()), min_value=first.date(),
+                                  max_value=last.date())
+            if isinstance(dates, tuple) and len(dates) == 2:
+                start, end = pd.Timestamp(dates[0]), pd.Timestamp(dates[1]) + pd.Timedelta(hours=23)
+
+    started = time.perf_counter()
+    results, total = index.search(query, olt_ids, cluster_ids, severities, start, end, limit)
+    search_ms = (time.perf_counter() - started) * 1000
+
+    st.caption(f"⏱️ {total:,} matching transcript(s) among {index.docs:,}, searched in {search_ms:.1f} ms "
+               f"across {len(index.segments)} segment(s).")
+    if results.empty:
+        st.info("No transcripts match.")
+    else:
+        st.dataframe(
+            results,
+            hide_index=True,
+            width="stretch",
+            column_config={
+                "score": st.column_config.NumberColumn("Score", format="%.2f"),
+                "timestamp_1h": st.column_config.DatetimeColumn("Time", format="YYYY-MM-DD HH:mm"),
+                "event_transcript": st.column_config.TextColumn("Transcript", width="large"),
+            },
+        )
+
+    _refresh_controls()
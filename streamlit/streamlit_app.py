@@ -1,6 +1,8 @@
 import streamlit as st
 import sys
 import importlib
+from utils import perf
+from utils import profiler
 
 # Adjusting the page
 st.set_page_config(
@@ -41,11 +43,18 @@ def main():
         "📈 Prediction",
         "📊 Dashboard",
         "📡 Live Prediction",
+        "🗺️ Risk Map",
+        "🎫 Ticket Analytics",
+        "🔎 Transcript Search",
+        "📟 Performance",
     ]
 
     # Load CSS
     load_css()
 
+    # Optional /metrics scrape endpoint (PERF_METRICS_PORT)
+    perf.maybe_start_metrics_server()
+
     # Sidebar navigation
     with st.sidebar:
         st.markdown(
@@ -58,6 +67,9 @@ def main():
                 st.session_state.current_page = option
                 st.rerun()
 
+        # On-demand profiler (also armed by ?profile=1 / ?profile=cprofile)
+        profiler.sidebar_controls()
+
     # Load JS with current page
     load_js(st.session_state.current_page)
 
@@ -71,6 +83,18 @@ def main():
     elif st.session_state.current_page == "📡 Live Prediction":
         from custom_pages.live_prediction import live_prediction_page
         live_prediction_page()
+    elif st.session_state.current_page == "🗺️ Risk Map":
+        from custom_pages.risk_map import risk_map_page
+        risk_map_page()
+    elif st.session_state.current_page == "🎫 Ticket Analytics":
+        from custom_pages.ticket_analytics import ticket_analytics_page
+        ticket_analytics_page()
+    elif st.session_state.current_page == "🔎 Transcript Search":
+        from custom_pages.transcript_search import transcript_search_page
+        transcript_search_page()
+    elif st.session_state.current_page == "📟 Performance":
+        from custom_pages.performance import performance_page
+        performance_page()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
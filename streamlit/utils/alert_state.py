@@ -0,0 +1,170 @@
+"""
+Per-OLT outage alert state machine for the live page.
+
+Each OLT is either closed or open. An alert opens when the predicted
+probability reaches ENTER_THRESHOLD and only closes once it drops below
+EXIT_THRESHOLD, so an OLT hovering around the decision threshold doesn't flap.
+Only transitions (opened / closed) are emitted into the alert history.
+
+update() is incremental: every OLT keeps a watermark (the last timestamp_1h
+it processed) and only rows newer than that go through the state machine, so
+the live page's overlapping re-fetches cost O(new rows). Rows that arrive
+older than the OLT's watermark are ignored.
+"""
+import threading
+from collections import deque
+import pandas as pd
+import streamlit as st
+from utils import data_prep_sup
+
+ENTER_THRESHOLD = data_prep_sup.THRESHOLD
+EXIT_THRESHOLD = 0.40
+
+HISTORY_SIZE = 10_000
+
+CONTEXT_COLS = ['cluster_name', 'city', 'region']
+
+
+class AlertTracker:
+    """Thread-safe alert state per OLT plus a bounded history of transitions."""
+
+    def __init__(self, enter_threshold: float = ENTER_THRESHOLD, exit_threshold: float = EXIT_THRESHOLD,
+                 history_size: int = HISTORY_SIZE):
+        if exit_threshold > enter_threshold:
+            raise ValueError("exit_threshold must not be above enter_threshold")
+        self.enter_threshold = enter_threshold
+        self.exit_threshold = exit_threshold
+        self._state = {}
+        self._watermark = {}
+        self._latest = {}
+        self._history = deque(maxlen=history_size)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _emit(self, event: str, olt_id, state: dict, ts, proba: float, context: dict):
+        self._seq += 1
+        self._history.append({
+            'seq': self._seq,
+            'event': event,
+            'olt_id': olt_id,
+            'timestamp_1h': ts,
+            'probability': proba,
+            'peak_probability': state['peak_probability'],
+            'first_seen': state['first_seen'],
+            'duration_h': (ts - state['first_seen']) / pd.Timedelta(hours=1),
+            **context,
+            'recorded_at': pd.Timestamp.now(tz='UTC'),
+        })
+
+    def update(self, df: pd.DataFrame) -> int:
+        """
+        Feed scored live rows; rows not newer than their OLT's watermark are skipped.
+
+        Args:
+            df: Rows with olt_id, timestamp_1h and outage_probability
+                (cluster_name, city and region are kept on events when present)
+
+        Returns:
+            int: Number of transitions emitted
+        """
+        if df.empty or 'outage_probability' not in df.columns:
+            return 0
+
+        cols = ['olt_id', 'timestamp_1h', 'outage_probability'] + [c for c in CONTEXT_COLS if c in df.columns]
+        rows = df[cols].copy()
+        rows['outage_probability'] = pd.to_numeric(rows['outage_probability'], errors='coerce')
+        rows['timestamp_1h'] = pd.to_datetime(rows['timestamp_1h'], errors='coerce')
+        rows = rows.dropna(subset=['olt_id', 'timestamp_1h', 'outage_probability'])
+
+        with self._lock:
+            watermark = pd.to_datetime(rows['olt_id'].map(self._watermark))
+            new = rows[watermark.isna() | (rows['timestamp_1h'] > watermark)]
+            if new.empty:
+                return 0
+
+            seq_before = self._seq
+            for row in new.sort_values('timestamp_1h').to_dict('records'):
+                olt_id, ts, proba = row['olt_id'], row['timestamp_1h'], row['outage_probability']
+                context = {c: row[c] for c in CONTEXT_COLS if c in row}
+                self._watermark[olt_id] = ts
+                self._latest[olt_id] = (ts, proba)
+                state = self._state.get(olt_id)
+
+                if state is None or state['status'] == 'closed':
+                    if proba >= self.enter_threshold:
+                        state = self._state[olt_id] = {
+                            'status': 'open',
+                            'first_seen': ts,
+                            'last_seen': ts,
+                            'peak_probability': proba,
+                            'last_probability': proba,
+                            **context,
+                        }
+                        self._emit('opened', olt_id, state, ts, proba, context)
+                    elif state is not None:
+                        state['last_probability'] = proba
+                    continue
+
+                state['last_probability'] = proba
+                if proba < self.exit_threshold:
+                    state['status'] = 'closed'
+                    self._emit('closed', olt_id, state, ts, proba, context)
+                else:
+                    state['last_seen'] = ts
+                    state['peak_probability'] = max(state['peak_probability'], proba)
+
+            return self._seq - seq_before
+
+    def open_alerts(self) -> pd.DataFrame:
+        """Currently open alerts, highest peak probability first."""
+        with self._lock:
+            rows = [{'olt_id': olt, **state} for olt, state in self._state.items() if state['status'] == 'open']
+        if not rows:
+            return pd.DataFrame()
+        return pd.DataFrame(rows).drop(columns='status').sort_values('peak_probability', ascending=False)
+
+    def latest(self) -> pd.DataFrame:
+        """Newest timestamp_1h and outage_probability of every OLT seen, open or not."""
+        with self._lock:
+            items = list(self._latest.items())
+        return pd.DataFrame([(olt, ts, proba) for olt, (ts, proba) in items],
+                            columns=['olt_id', 'timestamp_1h', 'outage_probability'])
+
+    def history(self, olt_id=None, event: str = None, since=None, after_seq: int = None) -> pd.DataFrame:
+        """
+        Query the transition history.
+
+        Args:
+            olt_id: Only this OLT
+            event: 'opened' or 'closed'
+            since: Only transitions at or after this timestamp_1h
+            after_seq: Only transitions with a sequence number above this (e.g. what a session last saw)
+
+        Returns:
+            pd.DataFrame: Matching transitions, oldest first
+        """
+        with self._lock:
+            history = pd.DataFrame(list(self._history))
+        if history.empty:
+            return history
+
+        mask = pd.Series(True, index=history.index)
+        if olt_id is not None:
+            mask &= history['olt_id'] == olt_id
+        if event is not None:
+            mask &= history['event'] == event
+        if since is not None:
+            mask &= history['timestamp_1h'] >= pd.to_datetime(since)
+        if after_seq is not None:
+            mask &= history['seq'] > after_seq
+        return history[mask]
+
+    def last_seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+
+@st.cache_resource
+def get_alert_tracker() -> AlertTracker:
+    """Process-wide tracker shared by every session."""
+    return AlertTracker()
@@ -0,0 +1,241 @@
+"""
+Historical backtest of the production scoring path.
+
+Replays labelled FACT_ML_FEATURES rows through data_prep_sup.build_feature_matrix
+and the deployed model (same features.csv ordering and threshold as the
+Prediction and Live pages) and reports recall, precision and alert lead time
+per region, cluster and week.
+
+Work is sharded by olt_id across processes so every shard holds complete
+per-OLT histories and the rolling features match what live scoring computed.
+
+Usage (run from the streamlit/ directory):
+    python -m utils.backtest fact_ml_features.parquet --start 2023-01-01 --end 2024-12-31
+    python -m utils.backtest --snowflake --start 2024-01-01    # read the window from Snowflake
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from utils import data_prep_sup
+from utils import dimensions
+from utils.dimensions import RAW_DIR
+from utils.feature_store import read_table
+
+LABEL_COL = 'label_outage_1h'
+DEFAULT_OUTPUT_DIR = 'data/backtest'
+
+# Breakdown name -> grouping column in the scored frame
+BREAKDOWNS = {
+    'region': 'region',
+    'cluster': 'cluster_name',
+    'week': 'week',
+}
+
+
+def fetch_fact_ml_features(session, start=None, end=None) -> pd.DataFrame:
+    """
+    Load a labelled window of FACT_ML_FEATURES from Snowflake.
+
+    Args:
+        session: Snowflake session
+        start: Inclusive start timestamp (optional)
+        end: Inclusive end timestamp (optional)
+
+    Returns:
+        pd.DataFrame: Rows with lower-case column names
+    """
+    filters = []
+    if start is not None:
+        filters.append(f"TIMESTAMP_1H >= '{pd.Timestamp(start)}'")
+    if end is not None:
+        filters.append(f"TIMESTAMP_1H <= '{pd.Timestamp(end)}'")
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+
+    df = session.sql(f"SELECT * FROM HACKATHON.DATAMART.FACT_ML_FEATURES {where}").to_pandas()
+    df.columns = df.columns.str.lower()
+    df['timestamp_1h'] = pd.to_datetime(df['timestamp_1h'], errors='coerce')
+    return df
+
+
+def attach_region(df: pd.DataFrame, raw_dir: str = RAW_DIR) -> pd.DataFrame:
+    """Add city/region from the dimension cache when the rows don't carry them."""
+    if 'region' in df.columns:
+        return df
+    return dimensions.enrich(df, ['city', 'region'], raw_dir=raw_dir)
+
+
+def shard_by_olt(df: pd.DataFrame, n_shards: int) -> list:
+    """Split rows into n_shards frames, keeping each OLT's rows together and balancing row counts."""
+    sizes = df.groupby('olt_id').size().sort_values(ascending=False)
+    loads = [0] * n_shards
+    owner = {}
+    # Greedy: biggest OLT goes to the least loaded shard
+    for olt, size in sizes.items():
+        i = int(np.argmin(loads))
+        owner[olt] = i
+        loads[i] += size
+
+    shard_ids = df['olt_id'].map(owner)
+    return [part for _, part in df.groupby(shard_ids, sort=True)]
+
+
+def score_shard(shard: pd.DataFrame, threshold: float = data_prep_sup.THRESHOLD) -> pd.DataFrame:
+    """
+    Run the production feature pipeline and model over one shard.
+
+    Returns:
+        pd.DataFrame: Input rows (without raw features) plus outage_probability and prediction
+    """
+    X = data_prep_sup.build_feature_matrix(shard.copy())
+    proba = data_prep_sup.predict_proba(X)
+
+    keep = [c for c in ['timestamp_1h', 'olt_id', 'cluster_name', 'city', 'region', LABEL_COL] if c in shard.columns]
+    scored = shard.loc[X.index, keep].copy()
+    scored['outage_probability'] = proba
+    scored['prediction'] = (proba >= threshold).astype(int)
+    return scored
+
+
+def add_event_lead_time(scored: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mark outage events and the alert lead time for each.
+
+    An event starts on a row where label_outage_1h turns 1 for an OLT. It counts
+    as detected when the model already predicts 1 on that row; the lead time is
+    one hour (the label horizon) plus how long the alert had been raised
+    continuously before the event started.
+    """
+    f = scored.sort_values(['olt_id', 'timestamp_1h'], kind='mergesort').copy()
+    grp = f.groupby('olt_id', sort=False)
+
+    prev_label = grp[LABEL_COL].shift(fill_value=0)
+    f['event_start'] = (f[LABEL_COL] == 1) & (prev_label != 1)
+
+    # Start time of the current run of identical predictions
+    run_id = (f['prediction'] != grp['prediction'].shift()).cumsum()
+    run_start = f.groupby(run_id)['timestamp_1h'].transform('min')
+
+    f['event_detected'] = f['event_start'] & (f['prediction'] == 1)
+    lead = (f['timestamp_1h'] - run_start) / pd.Timedelta(hours=1) + 1
+    f['lead_time_h'] = lead.where(f['event_detected'])
+    return f
+
+
+def summarize(scored: pd.DataFrame, by: str) -> pd.DataFrame:
+    """Recall, precision and lead-time statistics grouped by one column."""
+    f = scored.assign(
+        tp=(scored['prediction'] == 1) & (scored[LABEL_COL] == 1),
+        fp=(scored['prediction'] == 1) & (scored[LABEL_COL] == 0),
+        fn=(scored['prediction'] == 0) & (scored[LABEL_COL] == 1),
+    )
+    out = f.groupby(by, dropna=False).agg(
+        rows=(LABEL_COL, 'size'),
+        positives=(LABEL_COL, 'sum'),
+        tp=('tp', 'sum'),
+        fp=('fp', 'sum'),
+        fn=('fn', 'sum'),
+        events=('event_start', 'sum'),
+        events_detected=('event_detected', 'sum'),
+        lead_time_mean_h=('lead_time_h', 'mean'),
+        lead_time_median_h=('lead_time_h', 'median'),
+    ).reset_index()
+
+    out['recall'] = out['tp'] / (out['tp'] + out['fn']).replace(0, np.nan)
+    out['precision'] = out['tp'] / (out['tp'] + out['fp']).replace(0, np.nan)
+    out['event_recall'] = out['events_detected'] / out['events'].replace(0, np.nan)
+    return out
+
+
+def run_backtest(df: pd.DataFrame, workers: int = None, threshold: float = data_prep_sup.THRESHOLD) -> dict:
+    """
+    Score a labelled history and compute the metric breakdowns.
+
+    Args:
+        df: Labelled raw rows (FACT_ML_FEATURES schema)
+        workers: Number of processes (defaults to the CPU count)
+        threshold: Decision threshold for the prediction column
+
+    Returns:
+        dict: 'scored' rows plus one metrics frame per entry in BREAKDOWNS
+    """
+    if LABEL_COL not in df.columns:
+        raise ValueError(f"Backtest input needs the '{LABEL_COL}' column")
+
+    df = attach_region(df)
+    workers = workers or os.cpu_count() or 1
+    shards = shard_by_olt(df, min(workers, df['olt_id'].nunique()))
+
+    if len(shards) == 1:
+        parts = [score_shard(shards[0], threshold)]
+    else:
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            parts = list(pool.map(score_shard, shards, [threshold] * len(shards)))
+
+    scored = add_event_lead_time(pd.concat(parts, ignore_index=True))
+    scored['week'] = scored['timestamp_1h'].dt.to_period('W').dt.start_time
+
+    results = {'scored': scored, 'overall': summarize(scored.assign(scope='all'), 'scope')}
+    for name, col in BREAKDOWNS.items():
+        if col in scored.columns:
+            results[name] = summarize(scored, col)
+    return results
+
+
+def write_results(results: dict, output_dir: str = DEFAULT_OUTPUT_DIR, include_rows: bool = False):
+    """Write each metrics frame as <output_dir>/metrics_<name>.parquet for the dashboard."""
+    os.makedirs(output_dir, exist_ok=True)
+    for name, frame in results.items():
+        if name == 'scored':
+            if include_rows:
+                frame.to_parquet(os.path.join(output_dir, 'scored_rows.parquet'), index=False)
+            continue
+        frame.to_parquet(os.path.join(output_dir, f"metrics_{name}.parquet"), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the production model on labelled history")
+    parser.add_argument('input', nargs='?', help="Parquet/CSV export of FACT_ML_FEATURES")
+    parser.add_argument('--snowflake', action='store_true',
+                        help="Read the window from HACKATHON.DATAMART.FACT_ML_FEATURES instead of a file")
+    parser.add_argument('--start', help="Inclusive start timestamp")
+    parser.add_argument('--end', help="Inclusive end timestamp")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--include-rows', action='store_true', help="Also write every scored row")
+    args = parser.parse_args()
+    if bool(args.input) == args.snowflake:
+        parser.error("give either an input file or --snowflake")
+
+    if args.snowflake:
+        try:
+            from snowflake.snowpark.context import get_active_session
+            session = get_active_session()
+        except Exception as e:
+            parser.error(f"--snowflake needs an active Snowflake session: {e}")
+        # The window is filtered in the warehouse, so only those rows are transferred
+        df = fetch_fact_ml_features(session, args.start, args.end)
+    else:
+        df = read_table(args.input)
+        if args.start:
+            df = df[df['timestamp_1h'] >= pd.Timestamp(args.start)]
+        if args.end:
+            df = df[df['timestamp_1h'] <= pd.Timestamp(args.end)]
+    print(f"📖 Replaying {len(df)} rows for {df['olt_id'].nunique()} OLTs")
+
+    started = time.perf_counter()
+    results = run_backtest(df, workers=args.workers)
+    elapsed = time.perf_counter() - started
+    write_results(results, args.output_dir, args.include_rows)
+
+    overall = results['overall'].iloc[0]
+    print(f"✅ Scored {len(df)} rows in {elapsed:.1f}s ({len(df) / max(elapsed, 1e-9):,.0f} rows/s)")
+    print(f"📊 Recall {overall['recall']:.1%} | Precision {overall['precision']:.1%} | "
+          f"Event recall {overall['event_recall']:.1%} | Mean lead time {overall['lead_time_mean_h']:.1f}h")
+    print(f"💾 Results written to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,15 @@ import pandas as pd
 import numpy as np
 import streamlit as st
 from utils import data_prep_sup
+from utils import explain
+from utils import horizons
+from utils import model_set
+from utils import perf
+from utils import profiler
 
 
+@perf.timed("batch.process_batch_excel")
+@profiler.profiled("process_batch_excel")
 def process_batch_excel(uploaded_file):
     """
     Process uploaded Excel file with batch predictions.
@@ -19,6 +26,7 @@ def process_batch_excel(uploaded_file):
         df = pd.read_excel(uploaded_file)
 
         st.info(f"📊 Loaded {len(df)} rows from Excel file")
+        perf.count("batch_rows", len(df))
 
         # Required columns for prediction
         required_cols = [
@@ -44,80 +52,36 @@ def process_batch_excel(uploaded_file):
             df = df.sort_values("timestamp_1h").reset_index(drop=True)
 
         # Process data with same pipeline as single prediction
-        df_processed = data_prep_sup.handling_skewness(df.copy())
-        df_processed = data_prep_sup.add_time_feats(df_processed)
-        df_processed = data_prep_sup.add_roll_delta(df_processed, group_key="olt_id", windows=(6, 24))
-
-        # Drop temp_anomaly_score due to multicollinearity
-        if 'temp_anomaly_score' in df_processed.columns:
-            df_processed = df_processed.drop(columns=['temp_anomaly_score'])
-
-        # Build feature list
-        num_base = [
-            'offline_ont_ratio', 'trap_trend_score', 'fault_rate',
-            'snr_avg', 'rx_power_avg_dbm', 'temperature_avg_c',
-            'hour_sin', 'hour_cos', 'is_maintenance_window'
-        ]
-
-        ROLL_KEYS = [
-            'link_loss_count_log', 'bad_rsl_count_log', 'high_temp_count_log',
-            'dying_gasp_count_log', 'offline_ont_now_log'
-        ]
-
-        roll_cols = [
-            c for c in df_processed.columns
-            if any(s in c for s in ["_delta_1h", "_roll6h_mean", "_roll24h_mean"])
-            and any(c.startswith(k.replace('_log', '')) for k in ROLL_KEYS)
-        ]
-
-        feature_cols_all = [c for c in num_base if c in df_processed.columns] + roll_cols
-
-        # Select only features needed
-        df_features = df_processed[feature_cols_all].copy()
-
-        # Handle NaN values
-        df_features = df_features.replace([float('inf'), float('-inf')], float('nan')).fillna(0.0).astype(float)
-
-        # Validate and reorder columns
-        df_features = data_prep_sup.validate_and_reorder_columns(df_features)
-
-        # Make predictions for all rows
-        predictions = []
-        probabilities = []
-
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-
-        for idx in range(len(df_features)):
-            status_text.text(f"Processing row {idx + 1}/{len(df_features)}...")
-            progress_bar.progress((idx + 1) / len(df_features))
-
-            # Get single row for prediction
-            df_row = df_features.iloc[[idx]].copy()
-
-            # Make prediction
-            try:
-                prediction, probability = data_prep_sup.make_prediction(df_row, threshold=0.4753)
-                predictions.append(prediction)
-                probabilities.append(probability[0])
-            except Exception as e:
-                st.warning(f"⚠️ Error predicting row {idx + 1}: {str(e)}")
-                predictions.append(None)
-                probabilities.append(None)
-
-        progress_bar.empty()
-        status_text.empty()
-
-        # Add predictions to original dataframe
-        df['label_outage_1h'] = predictions
-        df['outage_probability'] = probabilities
+        df_features = data_prep_sup.build_feature_matrix(df.copy())
+
+        # Every row and horizon in one pass over the shared feature matrix; results are
+        # aligned by index since the feature pipeline re-sorts rows by (timestamp_1h, olt_id)
+        predictions = horizons.get_horizon_set().predict(df_features, data_prep_sup.predict_proba)
+        for col in predictions.columns:
+            df[col] = predictions[col]
+
+        # Top contributing features per row (SHAP of the primary model), batched and cached like live
+        try:
+            models = model_set.get_model_set()
+            contrib, _ = explain.explain_with_cache(
+                df_features,
+                olt_ids=df.loc[df_features.index, 'olt_id'],
+                timestamps=df.loc[df_features.index, 'timestamp_1h'],
+                model=models.primary_model(),
+                model_version=models.primary_version_key(),
+            )
+            df['top_factors'] = explain.top_factors(contrib)
+        except Exception as e:
+            st.caption(f"No per-row explanations: {e}")
 
         st.success(f"✅ Successfully processed {len(df)} rows!")
 
         # Display summary
-        if None not in predictions:
-            outage_count = sum(predictions)
+        if len(predictions):
+            outage_count = int(predictions['label_outage_1h'].sum())
             st.info(f"📊 Prediction Summary: {outage_count} outages predicted out of {len(predictions)} rows ({outage_count/len(predictions)*100:.1f}%)")
+            for horizon in [h for h in predictions.columns if h.startswith('label_outage_') and h != 'label_outage_1h']:
+                st.caption(f"Within {horizon.rsplit('_', 1)[1]}: {int(predictions[horizon].sum())} outages predicted")
 
         return df
 
@@ -150,7 +114,9 @@ def batch_prediction_ui():
     - `rx_power_avg_dbm`: RX power average (dBm)
     - `trap_trend_score`: Trap trend score
 
-    The output will include `label_outage_1h` (prediction) and `outage_probability` columns.
+    The output will include `label_outage_1h` (prediction), `outage_probability` and `top_factors`
+    (the three largest SHAP contributions, in log-odds) columns, plus `label_outage_3h` /
+    `outage_probability_3h` (and 6h) when the longer-horizon models are deployed.
     """)
 
     uploaded_file = st.file_uploader(
@@ -0,0 +1,160 @@
+"""
+Headless bulk scoring of raw feature exports.
+
+Reads a Parquet or CSV file of raw rows (FACT_ML_FEATURES / producer schema),
+shards it by olt_id across a process pool (each shard holds whole OLT
+histories, so rolling features are the same as scoring the file in one go),
+scores every shard with the production pipeline and writes a partitioned
+Parquet dataset:
+
+    <output>/date=2024-12-31/part-<shard>-0.parquet
+    ...
+
+Rows keep timestamp_1h, olt_id and the dimension columns they carry, plus
+outage_probability and label_outage_1h like every other prediction path. An
+observed label_outage_1h in the input is kept as observed_label_outage_1h.
+
+For Parquet input the parent only reads the olt_id column to plan the
+shards; every worker reads its own OLTs with a filter, so the input is never
+pickled across processes. Each worker writes its own files, so nothing but
+row counts and timings comes back.
+
+Usage (run from the streamlit/ directory):
+    python -m utils.bulk_score fact_ml_features.parquet scored/ --workers 8
+    python -m utils.bulk_score input.csv scored/ --partition-by region
+"""
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pyarrow.parquet as pq
+from utils import data_prep_sup
+from utils.backtest import LABEL_COL, attach_region, score_shard, shard_by_olt
+from utils.feature_store import read_table
+
+PARTITION_CHOICES = ('date', 'region', 'none')
+
+
+def _plan_shards(olt_ids: pd.Series, n_shards: int) -> list:
+    """OLT ids of each shard, balanced by row count."""
+    shards = shard_by_olt(pd.DataFrame({'olt_id': olt_ids}), n_shards)
+    return [part['olt_id'].unique().tolist() for part in shards]
+
+
+def _read_olts(path: str, olt_col: str, olts: list) -> pd.DataFrame:
+    df = pd.read_parquet(path, filters=[(olt_col, 'in', olts)])
+    df.columns = [str(c).lower() for c in df.columns]
+    df['timestamp_1h'] = pd.to_datetime(df['timestamp_1h'], errors='coerce')
+    return df
+
+
+def score_and_write(shard_id: int, output_dir: str, partition_by: str = 'date', rows: pd.DataFrame = None,
+                    path: str = None, olt_col: str = 'olt_id', olts: list = None, with_region: bool = False,
+                    threshold: float = data_prep_sup.THRESHOLD) -> dict:
+    """
+    Score one shard and write it under output_dir (runs in a worker process).
+
+    Args:
+        shard_id: Used in the file names so shards never overwrite each other
+        output_dir: Dataset root
+        partition_by: 'date', 'region' or 'none'
+        rows: Shard rows (CSV input), or
+        path, olt_col, olts: Parquet input, its olt_id column and the OLTs to read from it
+        with_region: Attach city/region from the RAW dimension files (implied by partition_by 'region')
+        threshold: Decision threshold for the prediction column
+
+    Returns:
+        dict: shard, rows, read_s, score_s, write_s
+    """
+    started = time.perf_counter()
+    shard = rows if rows is not None else _read_olts(path, olt_col, olts)
+    if with_region or partition_by == 'region':
+        shard = attach_region(shard)
+        if partition_by == 'region' and 'region' not in shard.columns:
+            raise ValueError("partition_by='region' needs a region column or the RAW dimension tables")
+    read_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scored = score_shard(shard, threshold)
+    # Same column names as batch, live, stream and service predictions
+    scored = scored.rename(columns={LABEL_COL: f"observed_{LABEL_COL}", 'prediction': LABEL_COL})
+    score_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    basename = f"part-{shard_id:04d}-{{i}}.parquet"
+    if partition_by == 'none':
+        scored.to_parquet(os.path.join(output_dir, basename.format(i=0)), index=False)
+    else:
+        if partition_by == 'date':
+            scored['date'] = scored['timestamp_1h'].dt.strftime('%Y-%m-%d')
+        scored[partition_by] = scored[partition_by].fillna('Unknown')
+        scored.to_parquet(output_dir, index=False, partition_cols=[partition_by],
+                          basename_template=basename, existing_data_behavior='overwrite_or_ignore')
+    write_s = time.perf_counter() - started
+
+    return {'shard': shard_id, 'rows': len(scored), 'read_s': read_s, 'score_s': score_s, 'write_s': write_s}
+
+
+def bulk_score(input_path: str, output_dir: str, workers: int = None, partition_by: str = 'date',
+               with_region: bool = False, overwrite: bool = False) -> pd.DataFrame:
+    """
+    Score a whole file into a partitioned Parquet dataset.
+
+    Returns:
+        pd.DataFrame: One row per shard with its row count and read/score/write seconds
+    """
+    if partition_by not in PARTITION_CHOICES:
+        raise ValueError(f"partition_by must be one of {PARTITION_CHOICES}")
+    if os.path.exists(output_dir) and os.listdir(output_dir):
+        if not overwrite:
+            raise FileExistsError(f"{output_dir} is not empty (use --overwrite)")
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    common = {'output_dir': output_dir, 'partition_by': partition_by, 'with_region': with_region}
+
+    if input_path.endswith('.parquet'):
+        # Snowflake exports may use OLT_ID
+        olt_col = next(c for c in pq.ParquetFile(input_path).schema_arrow.names if c.lower() == 'olt_id')
+        olt_ids = pd.read_parquet(input_path, columns=[olt_col])[olt_col]
+        shards = _plan_shards(olt_ids, min(workers, olt_ids.nunique()))
+        jobs = [dict(common, path=input_path, olt_col=olt_col, olts=olts) for olts in shards]
+    else:
+        df = read_table(input_path)
+        jobs = [dict(common, rows=part) for part in shard_by_olt(df, min(workers, df['olt_id'].nunique()))]
+
+    if len(jobs) == 1:
+        stats = [score_and_write(0, **jobs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = [pool.submit(score_and_write, i, **job) for i, job in enumerate(jobs)]
+            stats = [f.result() for f in futures]
+    return pd.DataFrame(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a Parquet/CSV file of raw rows into partitioned Parquet")
+    parser.add_argument('input', help="Parquet/CSV of raw feature rows")
+    parser.add_argument('output', help="Output dataset directory")
+    parser.add_argument('--workers', type=int, default=None, help="Processes (defaults to the CPU count)")
+    parser.add_argument('--partition-by', choices=PARTITION_CHOICES, default='date')
+    parser.add_argument('--with-region', action='store_true',
+                        help="Attach city/region from dataset/RAW (implied by --partition-by region)")
+    parser.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stats = bulk_score(args.input, args.output, args.workers, args.partition_by, args.with_region, args.overwrite)
+    elapsed = time.perf_counter() - started
+
+    rows = int(stats['rows'].sum())
+    print(stats.to_string(index=False))
+    print(f"✅ Scored {rows} rows in {len(stats)} shard(s) in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    print(f"💾 Written to {args.output} (partitioned by {args.partition_by})")
+
+
+if __name__ == '__main__':
+    main()
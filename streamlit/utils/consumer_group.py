@@ -0,0 +1,500 @@
+"""
+Scale-out scoring: several stream_consumer workers sharing raw_ml_features_topic.
+
+OLTs are spread over workers by consistent hashing. The producer keys every
+message by olt_id, so an OLT always lands on the same partition, and
+partitions are placed on a hash ring of the workers (HashRing). Adding or
+removing a worker therefore only moves the partitions whose ring owner
+changed (about 1/n of them) instead of reshuffling everything.
+
+A worker keeps the last hours of every OLT it scores (the rolling-window
+context of StreamScorer). When a partition moves, the old owner writes that
+context and the partition's offset to a checkpoint (CheckpointStore) and the
+new owner loads it before consuming, so rolling features stay continuous
+across rebalances. Workers also checkpoint periodically so a crashed worker's
+partitions can be picked up from the last checkpoint.
+
+The benchmark runs every worker as its own process, as in production: the
+topic is written once to a file-backed log (one file per partition, see
+write_log) and each process loads only the partitions it owns on the ring
+into its own broker stand-in, so workers share no interpreter or GIL. The
+rebalance check hands partitions over between workers of one process.
+
+Usage (run from the streamlit/ directory):
+    # one process per worker against Kafka; restart all with the new list to rebalance
+    python -m utils.consumer_group worker --worker-id w1 --workers w1,w2,w3
+    # benchmark (one process per worker) and rebalance check with the broker stand-in
+    python -m utils.consumer_group bench --input history.parquet --workers 1,2,4
+"""
+import argparse
+import bisect
+import hashlib
+import multiprocessing
+import os
+import pickle
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from utils import data_prep_sup
+from utils import stream_consumer
+from utils.stream_consumer import CONTEXT_ROWS, GROUP_ID, INPUT_TOPIC, KAFKA_BROKER
+
+CHECKPOINT_DIR = 'data/consumer_checkpoints'
+VIRTUAL_NODES = 128
+CHECKPOINT_EVERY = 20
+
+# Partitions of the benchmark topic (the real topic's count is read from the broker)
+BENCH_PARTITIONS = 32
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring of workers, each with VIRTUAL_NODES points."""
+
+    def __init__(self, workers, vnodes: int = VIRTUAL_NODES):
+        if not workers:
+            raise ValueError("HashRing needs at least one worker")
+        points = sorted((_hash(f"{worker}#{i}"), worker) for worker in workers for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._workers = [w for _, w in points]
+
+    def owner(self, key: str) -> str:
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._workers[i]
+
+    def assignment(self, partitions) -> dict:
+        """Partitions owned by each worker."""
+        owned = {}
+        for p in partitions:
+            owned.setdefault(self.owner(f"partition-{p}"), []).append(p)
+        return owned
+
+
+class CheckpointStore:
+    """One file per partition with its offset and the context rows of its OLTs."""
+
+    def __init__(self, path: str = CHECKPOINT_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, partition: int) -> str:
+        return os.path.join(self.path, f"partition-{partition}.pkl")
+
+    def save(self, partition: int, offset: int, context: dict):
+        tmp = self._file(partition) + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'offset': offset, 'context': context, 'saved_at': time.time()}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._file(partition))
+
+    def load(self, partition: int):
+        """(offset, {olt_id: [rows]}) or None when the partition was never checkpointed."""
+        try:
+            with open(self._file(partition), 'rb') as f:
+                checkpoint = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        return checkpoint['offset'], checkpoint['context']
+
+
+class KafkaPartitionConsumer:
+    """kafka-python consumer with manually assigned partitions, addressed by partition number."""
+
+    def __init__(self, broker: str = KAFKA_BROKER, topic: str = INPUT_TOPIC, group_id: str = GROUP_ID):
+        from kafka import KafkaConsumer, TopicPartition
+        self.topic = topic
+        self._tp = lambda p: TopicPartition(topic, p)
+        self.consumer = KafkaConsumer(
+            bootstrap_servers=[broker],
+            group_id=group_id,
+            enable_auto_commit=False,
+            auto_offset_reset='earliest',
+        )
+
+    def partition_count(self) -> int:
+        return len(self.consumer.partitions_for_topic(self.topic) or ())
+
+    def assign(self, partitions):
+        self.consumer.assign([self._tp(p) for p in partitions])
+
+    def seek(self, partition: int, offset: int):
+        self.consumer.seek(self._tp(partition), offset)
+
+    def position(self, partition: int) -> int:
+        return self.consumer.position(self._tp(partition))
+
+    def poll(self, timeout_ms: int = 0, max_records: int = stream_consumer.MAX_BATCH_ROWS) -> dict:
+        return self.consumer.poll(timeout_ms=timeout_ms, max_records=max_records)
+
+    def commit(self):
+        self.consumer.commit()
+
+    def close(self):
+        self.consumer.close()
+
+
+class GroupWorker:
+    """A StreamScorer that owns a set of partitions and hands their OLT context over on rebalance."""
+
+    def __init__(self, worker_id: str, consumer, sinks, checkpoints: CheckpointStore, model=None,
+                 checkpoint_every: int = CHECKPOINT_EVERY, **scorer_kwargs):
+        self.worker_id = worker_id
+        self.consumer = consumer
+        self.checkpoints = checkpoints
+        self.checkpoint_every = checkpoint_every
+        self.scorer = stream_consumer.StreamScorer(consumer, sinks, model=model, **scorer_kwargs)
+        self.owned = set()
+        self.batches = 0
+        self.stats = {'checkpoints_saved': 0, 'checkpoints_loaded': 0, 'olts_handed_over': 0, 'handoff_s': 0.0}
+
+    def _context_by_partition(self, partitions) -> dict:
+        # Context rows carry the partition they were consumed from
+        grouped = {p: {} for p in partitions}
+        for olt, rows in self.scorer.context.items():
+            if rows:
+                p = rows[-1]['kafka_partition']
+                if p in grouped:
+                    grouped[p][olt] = list(rows)
+        return grouped
+
+    def checkpoint(self, partitions=None):
+        started = time.perf_counter()
+        partitions = self.owned if partitions is None else partitions
+        for p, context in self._context_by_partition(partitions).items():
+            self.checkpoints.save(p, self.consumer.position(p), context)
+            self.stats['checkpoints_saved'] += 1
+        self.stats['handoff_s'] += time.perf_counter() - started
+
+    def release(self, partitions):
+        """Checkpoint and forget partitions that move to another worker."""
+        partitions = set(partitions) & self.owned
+        if not partitions:
+            return
+        self.checkpoint(partitions)
+        for context in self._context_by_partition(partitions).values():
+            for olt in context:
+                del self.scorer.context[olt]
+        self.owned -= partitions
+        self.consumer.assign(self.owned)
+
+    def acquire(self, partitions):
+        """Take over partitions, resuming from their checkpoint when there is one."""
+        partitions = set(partitions) - self.owned
+        if not partitions:
+            return
+        started = time.perf_counter()
+        self.owned |= partitions
+        self.consumer.assign(self.owned)
+        for p in partitions:
+            checkpoint = self.checkpoints.load(p)
+            if checkpoint is None:
+                continue
+            offset, context = checkpoint
+            self.consumer.seek(p, offset)
+            for olt, rows in context.items():
+                self.scorer.context[olt] = deque(rows, maxlen=CONTEXT_ROWS)
+            self.stats['checkpoints_loaded'] += 1
+            self.stats['olts_handed_over'] += len(context)
+        self.stats['handoff_s'] += time.perf_counter() - started
+
+    def step(self) -> int:
+        """Score one micro-batch; returns the number of rows scored."""
+        if not self.owned:
+            return 0
+        records = self.scorer.poll_batch()
+        if not records:
+            return 0
+        results = self.scorer.process(records)
+        self.batches += 1
+        if self.batches % self.checkpoint_every == 0:
+            self.checkpoint()
+        return len(results)
+
+    def close(self):
+        self.checkpoint()
+        self.consumer.close()
+
+
+class MemorySink:
+    """Keeps scored batches in memory (benchmarks and checks)."""
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, results: pd.DataFrame):
+        self.frames.append(results)
+
+    def results(self) -> pd.DataFrame:
+        return pd.concat(self.frames, ignore_index=True) if self.frames else pd.DataFrame()
+
+
+class ConsumerGroup:
+    """In-process group of GroupWorkers on a LocalBroker, rebalanced with a HashRing."""
+
+    def __init__(self, broker: stream_consumer.LocalBroker, sinks, checkpoint_dir: str, model=None,
+                 topic: str = INPUT_TOPIC, group_id: str = GROUP_ID, **worker_kwargs):
+        self.broker = broker
+        self.sinks = sinks
+        self.checkpoints = CheckpointStore(checkpoint_dir)
+        self.model = model
+        self.topic = topic
+        self.group_id = group_id
+        self.worker_kwargs = worker_kwargs
+        self.workers = {}
+
+    def scale_to(self, worker_ids) -> dict:
+        """Rebalance onto worker_ids; returns how many partitions moved and the handoff time."""
+        started = time.perf_counter()
+        target = {w: set(ps) for w, ps in HashRing(worker_ids).assignment(range(self.broker.partitions)).items()}
+
+        # Old owners checkpoint first so new owners can load the handed-over context
+        moved = 0
+        for worker_id, worker in list(self.workers.items()):
+            lost = worker.owned - target.get(worker_id, set())
+            moved += len(lost)
+            worker.release(lost)
+            if worker_id not in target:
+                worker.consumer.close()
+                del self.workers[worker_id]
+
+        for worker_id in worker_ids:
+            if worker_id not in self.workers:
+                consumer = self.broker.consumer(self.topic, self.group_id, partitions=[])
+                self.workers[worker_id] = GroupWorker(worker_id, consumer, self.sinks, self.checkpoints,
+                                                      model=self.model, **self.worker_kwargs)
+            self.workers[worker_id].acquire(target.get(worker_id, set()))
+
+        return {'workers': len(worker_ids), 'moved_partitions': moved, 'rebalance_s': time.perf_counter() - started}
+
+    def run_round(self, pool: ThreadPoolExecutor = None) -> int:
+        """One micro-batch per worker (in parallel when a pool is given)."""
+        if pool is None:
+            return sum(worker.step() for worker in self.workers.values())
+        return sum(pool.map(GroupWorker.step, self.workers.values()))
+
+    def drain(self, max_rows: int = None, parallel: bool = True) -> int:
+        """Run rounds until the topic is consumed (or max_rows were scored)."""
+        total = 0
+        with ThreadPoolExecutor(max_workers=len(self.workers)) as pool:
+            while max_rows is None or total < max_rows:
+                scored = self.run_round(pool if parallel else None)
+                if scored == 0:
+                    break
+                total += scored
+        return total
+
+
+def write_log(broker: stream_consumer.LocalBroker, path: str, topic: str = INPUT_TOPIC):
+    """Write every partition of a topic to its own file under path (the log worker processes read)."""
+    os.makedirs(path, exist_ok=True)
+    for p, end in broker.end_offsets(topic).items():
+        with open(os.path.join(path, f"partition-{p}.pkl"), 'wb') as f:
+            pickle.dump(broker.read(topic, p, 0, end), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_log(path: str, partitions: int, owned, topic: str = INPUT_TOPIC) -> stream_consumer.LocalBroker:
+    """A broker stand-in holding only the owned partitions of a log written by write_log."""
+    broker = stream_consumer.LocalBroker(partitions=partitions)
+    for p in owned:
+        with open(os.path.join(path, f"partition-{p}.pkl"), 'rb') as f:
+            records = pickle.load(f)
+        # Keys hash to the same partition, so offsets come out as they were written
+        for record in records:
+            broker.append(topic, record.value, key=record.key, timestamp_ms=record.timestamp)
+    return broker
+
+
+def _bench_process(worker_id: str, workers: list, log_dir: str, partitions: int, model, max_batch_rows: int,
+                   checkpoint_dir: str, ready, results):
+    """One benchmark worker process: load its partitions, wait for the others, then drain them."""
+    owned = HashRing(workers).assignment(range(partitions)).get(worker_id, [])
+    broker = read_log(log_dir, partitions, owned)
+    worker = GroupWorker(worker_id, broker.consumer(INPUT_TOPIC, partitions=[]), [MemorySink()],
+                         CheckpointStore(checkpoint_dir), model=model, max_batch_rows=max_batch_rows, max_wait_s=0.01)
+    worker.acquire(owned)
+    # Loading the log and the model isn't part of the measurement
+    ready.wait()
+    started = time.perf_counter()
+    scored = 0
+    while True:
+        batch = worker.step()
+        if batch == 0:
+            break
+        scored += batch
+    results.put({'worker': worker_id, 'partitions': len(owned), 'rows': scored,
+                 'seconds': time.perf_counter() - started, 'finished_at': time.time()})
+
+
+def benchmark_processes(log_dir: str, workers: int, partitions: int, model, max_batch_rows: int,
+                        checkpoint_dir: str) -> list:
+    """
+    Drain a log written by write_log with `workers` worker processes.
+
+    Returns:
+        list: One dict per process (worker, partitions, rows, seconds, rows_per_s) and a last
+            one for the group ('all'), whose seconds run from the common start to the last finish
+    """
+    ctx = multiprocessing.get_context('spawn')
+    worker_ids = [f"w{i}" for i in range(workers)]
+    ready, results = ctx.Barrier(workers + 1), ctx.Queue()
+    processes = [ctx.Process(target=_bench_process, args=(w, worker_ids, log_dir, partitions, model, max_batch_rows,
+                                                          checkpoint_dir, ready, results))
+                 for w in worker_ids]
+    for process in processes:
+        process.start()
+    ready.wait()
+    started = time.time()
+    stats = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    stats.sort(key=lambda s: s['worker'])
+    rows = sum(s['rows'] for s in stats)
+    seconds = max(s['finished_at'] for s in stats) - started
+    out = [{k: v for k, v in s.items() if k != 'finished_at'} for s in stats]
+    out.append({'worker': 'all', 'partitions': partitions, 'rows': rows, 'seconds': seconds})
+    for s in out:
+        s['rows_per_s'] = s['rows'] / s['seconds'] if s['seconds'] else np.nan
+    return out
+
+
+def benchmark(df: pd.DataFrame, worker_counts=(1, 2, 4), partitions: int = BENCH_PARTITIONS, model=None,
+              max_batch_rows: int = stream_consumer.MAX_BATCH_ROWS, checkpoint_dir: str = CHECKPOINT_DIR) -> pd.DataFrame:
+    """
+    Throughput per group size (one process per worker), plus a mid-stream rebalance checked against a single worker.
+
+    Args:
+        df: Raw feature rows (olt_id, timestamp_1h and the measured features)
+        worker_counts: Group sizes to measure
+        partitions: Partitions of the stand-in topic
+        model: Model to score with (defaults to the production model)
+        max_batch_rows: Micro-batch size per worker
+        checkpoint_dir: Scratch directory for the log and checkpoints (one subdirectory per run)
+
+    Returns:
+        pd.DataFrame: One row per worker process and one per group ('all', with its scaling over
+            the smallest group) for every group size, then the rebalance run
+    """
+    model = model if model is not None else data_prep_sup.load_model(data_prep_sup.MODEL_FILENAME)
+    df = df.sort_values('timestamp_1h')
+    rows = []
+
+    def new_group(run: str):
+        broker = stream_consumer.LocalBroker(partitions=partitions)
+        stream_consumer.produce_local(broker, df)
+        sink = MemorySink()
+        group = ConsumerGroup(broker, [sink], os.path.join(checkpoint_dir, run), model=model,
+                              max_batch_rows=max_batch_rows, max_wait_s=0.01)
+        return group, sink
+
+    # The topic is produced once; every group size drains the same log
+    group, sink = new_group("bench-log")
+    log_dir = os.path.join(checkpoint_dir, 'log')
+    write_log(group.broker, log_dir)
+
+    smallest = None
+    for n in worker_counts:
+        stats = benchmark_processes(log_dir, n, partitions, model, max_batch_rows, os.path.join(checkpoint_dir, f"bench-{n}"))
+        smallest = smallest or stats[-1]['rows_per_s']
+        for s in stats:
+            rows.append({'run': f"{n} process(es)", 'workers': n, **s,
+                         'scaling': s['rows_per_s'] / smallest if s['worker'] == 'all' else np.nan})
+
+    # Single-worker scores, the reference for the rebalance check
+    group.scale_to(['w0'])
+    group.drain()
+    baseline = sink.results()
+
+    # Rebalance check: 2 workers for the first half, then scale to 3 and finish
+    group, sink = new_group("rebalance")
+    group.scale_to(['w0', 'w1'])
+    started = time.perf_counter()
+    scored = group.drain(max_rows=len(df) // 2)
+    rebalance = group.scale_to(['w0', 'w1', 'w2'])
+    scored += group.drain()
+    elapsed = time.perf_counter() - started
+
+    key = ['olt_id', 'timestamp_1h']
+    merged = sink.results().merge(baseline[key + ['outage_probability']], on=key, suffixes=('', '_baseline'))
+    handed_over = sum(w.stats['olts_handed_over'] for w in group.workers.values())
+    rows.append({
+        'run': "2 -> 3 workers mid-stream",
+        'workers': 3,
+        'worker': 'all',
+        'rows': scored,
+        'seconds': elapsed,
+        'rows_per_s': scored / elapsed if elapsed else np.nan,
+        'moved_partitions': rebalance['moved_partitions'],
+        'olts_handed_over': handed_over,
+        'rebalance_ms': rebalance['rebalance_s'] * 1000,
+        'max_abs_diff_vs_single_worker': (merged['outage_probability'] - merged['outage_probability_baseline']).abs().max(),
+    })
+    return pd.DataFrame(rows)
+
+
+def run_worker(worker_id: str, workers: list, broker: str, topic: str, group_id: str, checkpoint_dir: str, sinks):
+    """Kafka worker owning its ring share of the topic's partitions until interrupted."""
+    consumer = KafkaPartitionConsumer(broker, topic, group_id)
+    partitions = consumer.partition_count()
+    owned = HashRing(workers).assignment(range(partitions)).get(worker_id, [])
+    if not owned:
+        # Nothing to poll: staying up would only spin (more workers than partitions)
+        consumer.close()
+        print(f"💤 {worker_id}: owns none of the {partitions} partitions of {topic} "
+              f"with {len(workers)} workers; exiting")
+        return
+    print(f"👷 {worker_id}: partitions {owned}")
+
+    worker = GroupWorker(worker_id, consumer, sinks, CheckpointStore(checkpoint_dir),
+                         model=data_prep_sup.load_model(data_prep_sup.MODEL_FILENAME))
+    worker.acquire(owned)
+    try:
+        while True:
+            worker.step()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Leave a checkpoint for whoever owns these partitions after the restart
+        worker.close()
+        print(f"👋 {worker_id}: {worker.scorer.stats} {worker.stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scale-out scoring consumers with consistent-hash partition ownership")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    w = sub.add_parser('worker', help="Run one worker against Kafka")
+    w.add_argument('--worker-id', required=True)
+    w.add_argument('--workers', required=True, help="Comma-separated ids of every worker in the group")
+    w.add_argument('--broker', default=KAFKA_BROKER)
+    w.add_argument('--topic', default=INPUT_TOPIC)
+    w.add_argument('--group-id', default=GROUP_ID)
+    w.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR, help="Must be shared by all workers")
+    w.add_argument('--results-dir', default=stream_consumer.RESULTS_DIR)
+
+    b = sub.add_parser('bench', help="Benchmark with the in-process broker stand-in")
+    b.add_argument('--input', required=True, help="CSV/Parquet of raw feature rows")
+    b.add_argument('--workers', default='1,2,4')
+    b.add_argument('--partitions', type=int, default=BENCH_PARTITIONS)
+    b.add_argument('--max-batch-rows', type=int, default=stream_consumer.MAX_BATCH_ROWS)
+    b.add_argument('--checkpoint-dir', default=os.path.join(CHECKPOINT_DIR, 'bench'))
+
+    args = parser.parse_args()
+    if args.command == 'worker':
+        run_worker(args.worker_id, args.workers.split(','), args.broker, args.topic, args.group_id,
+                   args.checkpoint_dir, [stream_consumer.ParquetSink(args.results_dir)])
+    else:
+        from utils.feature_store import read_table
+        result = benchmark(read_table(args.input), [int(n) for n in args.workers.split(',')],
+                           partitions=args.partitions, max_batch_rows=args.max_batch_rows,
+                           checkpoint_dir=args.checkpoint_dir)
+        print(result.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
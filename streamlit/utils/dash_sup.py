@@ -1,6 +1,8 @@
+import os
 import pandas as pd
 import streamlit as st
 import plotly.express as px
+from utils import explain
 
 def show_model_metrics():
     """
@@ -50,6 +52,68 @@ def show_model_metrics():
     # Render table
     st.markdown(df.to_html(index=False, escape=False), unsafe_allow_html=True)
 
+def show_backtest_metrics(results_dir="data/backtest"):
+    """
+    Displays backtest recall/precision per region and per week, as written by utils/backtest.py.
+    """
+    st.subheader('🧪 Backtest Performance')
+
+    region_path = os.path.join(results_dir, "metrics_region.parquet")
+    week_path = os.path.join(results_dir, "metrics_week.parquet")
+    if not os.path.exists(region_path):
+        st.info("No backtest results yet. Run `python -m utils.backtest <FACT_ML_FEATURES export>` to generate them.")
+        return
+
+    try:
+        by_region = pd.read_parquet(region_path)
+        by_week = pd.read_parquet(week_path) if os.path.exists(week_path) else None
+    except Exception as e:
+        st.error(f"Error loading backtest results: {str(e)}")
+        return
+
+    cols = ['region', 'rows', 'events', 'recall', 'precision', 'event_recall', 'lead_time_mean_h']
+    st.dataframe(
+        by_region[[c for c in cols if c in by_region.columns]].sort_values('recall'),
+        hide_index=True,
+        width="stretch",
+        column_config={
+            "recall": st.column_config.NumberColumn("Recall", format="percent"),
+            "precision": st.column_config.NumberColumn("Precision", format="percent"),
+            "event_recall": st.column_config.NumberColumn("Event Recall", format="percent"),
+            "lead_time_mean_h": st.column_config.NumberColumn("Mean Lead Time (h)", format="%.1f"),
+        },
+    )
+
+    if by_week is not None and not by_week.empty:
+        weekly = by_week.melt(id_vars='week', value_vars=['recall', 'precision'], var_name='metric')
+        fig = px.line(weekly, x='week', y='value', color='metric', height=350)
+        fig.update_layout(
+            xaxis_title='',
+            yaxis_title='',
+            yaxis_tickformat='.0%',
+            plot_bgcolor='rgba(0,0,0,0)',
+            margin=dict(t=20, b=0)
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+def show_importance_job():
+    """Status and trigger of the background global-importance job"""
+    job = explain.get_importance_job()
+    info = job.info()
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        if st.button("🔄 Recompute importance", disabled=job.running(),
+                     help=f"Mean |SHAP| over up to {explain.IMPORTANCE_SAMPLE_ROWS:,} rows of {explain.IMPORTANCE_INPUT}"):
+            job.start()
+            info = job.info()
+    with col2:
+        if info['state'] == 'running':
+            st.caption(f"⏳ Computing in the background since {info['started_at']:%H:%M:%S}; reload to see the result.")
+        elif info['state'] == 'done':
+            st.caption(f"✅ Recomputed from {info['rows']:,} rows in {info['seconds']:.1f}s at {info['finished_at']:%H:%M:%S}.")
+        elif info['state'] == 'failed':
+            st.caption(f"❌ Last recompute failed: {info['error']}")
+
 def show_feature_importance(csv_path="data/feature_importance.csv"):
     """
     Displays an interactive horizontal bar chart of top 5 feature importances
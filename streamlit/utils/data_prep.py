@@ -1,137 +1,222 @@
+import time
 import pandas as pd
+import plotly.express as px
 import streamlit as st
 from utils import data_prep_sup
-
-def dt_prep():
-    st.subheader("Input Features")
-
-    left, right = st.columns(2)
-
-    with left:
-        hour_of_day = st.number_input("Hour of Day (0–23)", min_value=0, max_value=23, value=22, step=1)
-        is_maintenance_window = st.selectbox("Is Maintenance Window?", options=["No", "Yes"], index=0)
-        offline_ont_now = st.number_input("Offline ONT Now", min_value=0, max_value=500, value=0, step=1)
-
-        temperature_avg_c = st.number_input("Temperature Avg (°C)", min_value=25.00, max_value=70.00, value=38.06, step=0.01, format="%.2f")
-        link_loss_count = st.number_input("Link Loss Count", min_value=0, max_value=1_000, value=1, step=1)
-        bad_rsl_count = st.number_input("Bad RSL Count", min_value=0, max_value=1_000, value=0, step=1)
-        high_temp_count = st.number_input("High Temperature Count", min_value=0, max_value=1_000, value=0, step=1)
-
-    with right:
-        dying_gasp_count = st.number_input("Dying Gasp Count", min_value=0, max_value=1_000, value=0, step=1)
-        offline_ont_ratio = st.number_input("Offline ONT Ratio (0–1)", min_value=0.000000, max_value=1.000000, value=0.000371, step=0.000001, format="%.6f")
-        fault_rate = st.number_input("Fault Rate (0–1)", min_value=0.000000, max_value=1.000000, value=0.001311, step=0.000001, format="%.6f")
-        snr_avg = st.number_input("SNR Average (dB)", min_value=10.000, max_value=50.000, value=25.836, step=0.001, format="%.3f")
-        rx_power_avg_dbm = st.number_input("RX Power Avg (dBm)", min_value=-40.000, max_value=-10.000, value=-19.243, step=0.001, format="%.3f")
-        trap_trend_score = st.number_input("Trap Trend Score", min_value=0.000000, max_value=2.000000, value=0.007864, step=0.000001, format="%.6f")
-
-    is_maintenance_window_flag = 1 if is_maintenance_window == "Yes" else 0
-
-    # Construct a single-row frame
-    df_current = pd.DataFrame({
-        "timestamp_1h": [pd.Timestamp.now().floor("h")],  # tz-naive timestamp
-        "olt_id": ["abc"],
-        "hour_of_day": [hour_of_day],
-        "is_maintenance_window": [is_maintenance_window_flag],
-        "offline_ont_now": [offline_ont_now],
-        "temperature_avg_c": [temperature_avg_c],
-        "link_loss_count": [link_loss_count],
-        "bad_rsl_count": [bad_rsl_count],
-        "high_temp_count": [high_temp_count],
-        "dying_gasp_count": [dying_gasp_count],
-        "offline_ont_ratio": [offline_ont_ratio],
-        "fault_rate": [fault_rate],
-        "snr_avg": [snr_avg],
-        "rx_power_avg_dbm": [rx_power_avg_dbm],
-        "trap_trend_score": [trap_trend_score],
-    })
-
-    # Determine which historical data to load based on user input
-    # Check if user values match the "No Outage Sample"
-    if (hour_of_day == 22 and is_maintenance_window_flag == 0 and offline_ont_now == 0
-        and abs(temperature_avg_c - 38.06) < 0.1 and link_loss_count == 1
-        and bad_rsl_count == 0 and high_temp_count == 0 and dying_gasp_count == 0):
-        sample_type = 'no_outage'
-    # Check if user values match the "Outage Sample"
-    elif (hour_of_day == 19 and is_maintenance_window_flag == 0 and offline_ont_now == 16
-          and abs(temperature_avg_c - 38.63) < 0.1 and link_loss_count == 0
-          and bad_rsl_count == 0 and high_temp_count == 0 and dying_gasp_count == 0):
-        sample_type = 'outage'
+from utils import horizons
+from utils import olt_history
+from utils import perf
+from utils import what_if
+
+INPUT_MANUAL = "Manual input"
+INPUT_REAL_OLT = "Real OLT (last 24h)"
+
+def real_olt_prep():
+    """Predict for a real OLT from its last 24 hours of features"""
+    index = olt_history.get_olt_history_index()
+    try:
+        catalog = olt_history.olt_catalog()
+    except FileNotFoundError:
+        # Deployments without dataset/RAW: offer the OLTs the index already holds
+        olts = sorted(set(index.snapshot) | set(index.store.olts() if index.store is not None else []))
+        catalog = pd.DataFrame({'olt_id': olts, 'city': None, 'region': None, 'clusters': '', 'label': olts})
+
+    if catalog.empty:
+        st.info("No OLTs available. Set OLT_SNAPSHOT_PATH or FEATURE_STORE_DIR, or connect to Snowflake.")
+        return None
+
+    labels = dict(zip(catalog['olt_id'], catalog['label']))
+    olt_id = st.selectbox("OLT", options=catalog['olt_id'].tolist(), format_func=labels.get)
+    clusters = catalog.loc[catalog['olt_id'] == olt_id, 'clusters'].iloc[0]
+    if clusters:
+        st.caption(f"Clusters: {clusters}")
+
+    requested_at = time.perf_counter()
+    lookup_started = time.monotonic()
+    with st.spinner("Loading the OLT's last 24 hours..."):
+        entry = index.get(olt_id)
+    if entry['source'] is None:
+        st.warning(f"No feature history found for {olt_id} in: {', '.join(index.sources())}")
+        return None
+
+    # Score all hours in one call; the last row is the current prediction
+    rows, X = entry['rows'], entry['X']
+    predictions = horizons.get_horizon_set().predict(X, data_prep_sup.predict_proba)
+    probability = predictions['outage_probability'].to_numpy()
+    latency_s = time.perf_counter() - requested_at
+    perf.observe("prediction.real_olt", latency_s)
+    lookup = "index hit" if entry['loaded_at'] < lookup_started else f"loaded from {entry['source']}"
+
+    st.subheader("📊 Prediction Result")
+    st.write(f"Latest hour: **{rows['timestamp_1h'].iloc[-1]}**")
+    st.write(f"Predicted Probability (Threshold = 0.475): **{probability[-1]:.4f}**")
+    st.caption(f"⏱️ {latency_s * 1000:.0f} ms ({lookup}, {len(rows)} hours scored)")
+    if probability[-1] >= data_prep_sup.THRESHOLD:
+        st.error("⚠️ A network outage is **likely** within the next hour. Please take preventive action!")
     else:
-        sample_type = 'default'
-
-    # Load historical data and append current row
-    df_historical = data_prep_sup.historical_data(sample_type)
-    if not df_historical.empty:
-        df = pd.concat([df_historical, df_current], ignore_index=True)
+        st.success("✅ The network is **stable** for the next hour. No outage expected.")
+    show_horizons(predictions.iloc[-1])
+
+    trend = predictions.filter(like='outage_probability').set_axis(rows['timestamp_1h'])
+    trend['threshold'] = data_prep_sup.THRESHOLD
+    st.line_chart(trend)
+    with st.expander(f"Last {len(rows)} hours of {olt_id}"):
+        st.dataframe(pd.concat([rows.reset_index(drop=True), predictions.reset_index(drop=True)], axis=1),
+                     use_container_width=True)
+
+    return X.iloc[[-1]]
+
+def show_horizons(prediction: pd.Series):
+    """The longer horizons of one prediction (nothing when only the 1h model is deployed)"""
+    horizon_set = horizons.get_horizon_set()
+    extra = horizon_set.horizons[1:]
+    if not extra:
+        return
+    for col, horizon in zip(st.columns(len(extra)), extra):
+        label = "Outage" if prediction[horizons.label_column(horizon)] == 1 else "No outage"
+        col.metric(f"Within {horizon}", f"{prediction[horizons.probability_column(horizon)]:.4f}",
+                   delta=f"{label} (threshold {horizon_set.thresholds[horizon]:.3f})", delta_color="off")
+
+def single_row_frame(inputs: dict):
+    """The form's row preceded by the matching sample's history; returns (rows, sample_type)"""
+    df_current = pd.DataFrame([{
+        "timestamp_1h": pd.Timestamp.now().floor("h"),  # tz-naive timestamp
+        "olt_id": "abc",
+        **inputs,
+    }])
+
+    # Historical rows of the matching sample (cached per sample type) that feed this row's rolling features
+    sample_type = data_prep_sup.detect_sample_type(inputs)
+    df_context = data_prep_sup.history_context(sample_type, df_current['olt_id'].iloc[0])
+    df = pd.concat([df_context, df_current], ignore_index=True) if not df_context.empty else df_current
+    return df, sample_type
+
+def what_if_prep(inputs: dict):
+    """Sweep one or two inputs around the submitted form values, scoring the whole grid at once"""
+    st.subheader("🔬 What-if Sweep")
+    features = st.multiselect("Features to sweep (one or two)", options=list(what_if.SWEEP_FEATURES),
+                              default=["offline_ont_now"], max_selections=2)
+    if not features:
+        return
+
+    with st.form("what_if_form"):
+        ranges = {}
+        for feature in features:
+            low, high = what_if.SWEEP_FEATURES[feature]
+            ranges[feature] = st.slider(f"{feature} range", min_value=float(low), max_value=float(high),
+                                        value=(float(low), float(high)))
+        steps = st.slider("Steps per feature", min_value=5, max_value=what_if.MAX_STEPS, value=50)
+        run = st.form_submit_button("📈 Run Sweep")
+
+    if not run:
+        return
+
+    df, _ = single_row_frame(inputs)
+    axes = {feature: what_if.axis_values(feature, *ranges[feature], steps) for feature in features}
+    with st.spinner("Scoring the grid..."):
+        result = what_if.sweep(df, axes)
+
+    probability = result['probability']
+    st.caption(f"⏱️ {result['rows']} rows scored in {result['seconds'] * 1000:.0f} ms "
+               f"(current inputs: {result['base_probability']:.4f})")
+
+    if len(features) == 1:
+        values = result['axes'][features[0]]
+        fig = px.line(x=values, y=probability, labels={'x': features[0], 'y': 'Outage probability'}, height=350)
+        fig.add_hline(y=data_prep_sup.THRESHOLD, line_dash="dash", annotation_text="threshold")
+        st.plotly_chart(fig, use_container_width=True)
+        flips = what_if.crossings(values, probability)
+        if flips:
+            st.write("Risk crosses the threshold at " + ", ".join(f"**{features[0]} ≈ {v:.4g}**" for v in flips))
+        else:
+            st.write("Risk does not cross the threshold in this range.")
     else:
-        df = df_current
-
-    if "timestamp_1h" in df.columns:
-        df = df.sort_values("timestamp_1h")
-
-    df = data_prep_sup.handling_skewness(df)
-    df = data_prep_sup.add_time_feats(df)
-    df = data_prep_sup.add_roll_delta(df, group_key="olt_id", windows=(6, 24))
-
-    # Drop temp_anomaly_score due to multicollinearity (matches notebook)
-    if 'temp_anomaly_score' in df.columns:
-        df = df.drop(columns=['temp_anomaly_score'])
+        y_name, x_name = features
+        fig = px.imshow(probability, x=result['axes'][x_name], y=result['axes'][y_name], origin='lower', aspect='auto',
+                        zmin=0, zmax=1, color_continuous_scale='RdYlGn_r', height=450,
+                        labels={'x': x_name, 'y': y_name, 'color': 'Outage probability'})
+        st.plotly_chart(fig, use_container_width=True)
+        st.write(f"**{(probability >= data_prep_sup.THRESHOLD).mean():.0%}** of the grid is above the threshold.")
 
-    # Build feature list matching the notebook approach
-    # Base numeric features (no raw IDs or original skewed features)
-    num_base = [
-        'offline_ont_ratio', 'trap_trend_score', 'fault_rate',
-        'snr_avg', 'rx_power_avg_dbm', 'temperature_avg_c',
-        'hour_sin', 'hour_cos', 'is_maintenance_window'
-    ]
-
-    # Rolling/delta features from log-transformed columns
-    ROLL_KEYS = [
-        'link_loss_count_log', 'bad_rsl_count_log', 'high_temp_count_log',
-        'dying_gasp_count_log', 'offline_ont_now_log'
-    ]
-
-    roll_cols = [
-        c for c in df.columns
-        if any(s in c for s in ["_delta_1h", "_roll6h_mean", "_roll24h_mean"])
-        and any(c.startswith(k.replace('_log', '')) for k in ROLL_KEYS)
-    ]
-
-    # Combine: base features + rolling features
-    feature_cols_all = [c for c in num_base if c in df.columns] + roll_cols
+def dt_prep():
+    mode = st.radio("Input", [INPUT_MANUAL, INPUT_REAL_OLT], horizontal=True)
+    if mode == INPUT_REAL_OLT:
+        return real_olt_prep()
 
-    # Select only the features needed for prediction
-    df = df[feature_cols_all].copy()
+    st.subheader("Input Features")
 
-    # Handle NaN values introduced by logs/diffs/rolling (matches notebook)
-    df = df.replace([float('inf'), float('-inf')], float('nan')).fillna(0.0).astype(float)
+    # Inputs only take effect on submit, so editing a field doesn't rerun the pipeline
+    with st.form("single_prediction_form"):
+        left, right = st.columns(2)
+
+        with left:
+            hour_of_day = st.number_input("Hour of Day (0–23)", min_value=0, max_value=23, value=22, step=1)
+            is_maintenance_window = st.selectbox("Is Maintenance Window?", options=["No", "Yes"], index=0)
+            offline_ont_now = st.number_input("Offline ONT Now", min_value=0, max_value=500, value=0, step=1)
+
+            temperature_avg_c = st.number_input("Temperature Avg (°C)", min_value=25.00, max_value=70.00, value=38.06, step=0.01, format="%.2f")
+            link_loss_count = st.number_input("Link Loss Count", min_value=0, max_value=1_000, value=1, step=1)
+            bad_rsl_count = st.number_input("Bad RSL Count", min_value=0, max_value=1_000, value=0, step=1)
+            high_temp_count = st.number_input("High Temperature Count", min_value=0, max_value=1_000, value=0, step=1)
+
+        with right:
+            dying_gasp_count = st.number_input("Dying Gasp Count", min_value=0, max_value=1_000, value=0, step=1)
+            offline_ont_ratio = st.number_input("Offline ONT Ratio (0–1)", min_value=0.000000, max_value=1.000000, value=0.000371, step=0.000001, format="%.6f")
+            fault_rate = st.number_input("Fault Rate (0–1)", min_value=0.000000, max_value=1.000000, value=0.001311, step=0.000001, format="%.6f")
+            snr_avg = st.number_input("SNR Average (dB)", min_value=10.000, max_value=50.000, value=25.836, step=0.001, format="%.3f")
+            rx_power_avg_dbm = st.number_input("RX Power Avg (dBm)", min_value=-40.000, max_value=-10.000, value=-19.243, step=0.001, format="%.3f")
+            trap_trend_score = st.number_input("Trap Trend Score", min_value=0.000000, max_value=2.000000, value=0.007864, step=0.000001, format="%.6f")
+
+        submitted = st.form_submit_button("🔮 Predict Network Incident")
+
+    inputs = {
+        "hour_of_day": hour_of_day,
+        "is_maintenance_window": 1 if is_maintenance_window == "Yes" else 0,
+        "offline_ont_now": offline_ont_now,
+        "temperature_avg_c": temperature_avg_c,
+        "link_loss_count": link_loss_count,
+        "bad_rsl_count": bad_rsl_count,
+        "high_temp_count": high_temp_count,
+        "dying_gasp_count": dying_gasp_count,
+        "offline_ont_ratio": offline_ont_ratio,
+        "fault_rate": fault_rate,
+        "snr_avg": snr_avg,
+        "rx_power_avg_dbm": rx_power_avg_dbm,
+        "trap_trend_score": trap_trend_score,
+    }
+
+    df_predict = None
+    if submitted:
+        submitted_at = time.perf_counter()
+        df, sample_type = single_row_frame(inputs)
 
-    # Final validation and column reordering
-    df = data_prep_sup.validate_and_reorder_columns(df)
+        with st.spinner("Analyzing network data... please wait."):
+            # Same feature pipeline as batch and live prediction; predict only the current (last) row
+            df_features = data_prep_sup.build_feature_matrix(df)
+            df_predict = df_features.loc[[df.index[-1]]]
+            predictions = horizons.get_horizon_set().predict(df_predict, data_prep_sup.predict_proba)
+            prediction = int(predictions['label_outage_1h'].iloc[0])
+            probability = predictions['outage_probability'].to_numpy()
 
-    # Extract only the LAST row (current input) for prediction
-    # Historical rows were only needed for calculating rolling features
-    df_predict = df.tail(1).copy()
+        latency_s = time.perf_counter() - submitted_at
+        perf.observe("prediction.single_submit", latency_s)
 
-    # Button to make a prediction
-    if st.button("🔮 Predict Network Incident"):
-        with st.spinner("Analyzing network data... please wait."):
-            # Get the prediction and probability (only on the last row)
-            prediction, probability = data_prep_sup.make_prediction(df_predict, threshold=0.4753)
-            
         # Display the result
         st.subheader("📊 Prediction Result")
         st.write(f"The model predicts: **{'Network Outage (1)' if prediction == 1 else 'No Outage (0)'}**")
         st.write(f"Predicted Probability (Threshold = 0.475): **{probability[0]:.4f}**")
+        st.caption(f"⏱️ Submit to result: {latency_s * 1000:.0f} ms (history sample: {sample_type})")
 
         # Add feedback for the user
         if prediction == 1:
             st.error("⚠️ A network outage is **likely** within the next hour. Please take preventive action!")
         else:
-            st.success("✅ The network is **stable** for the next hour. No outage expected.")  
-  
+            st.success("✅ The network is **stable** for the next hour. No outage expected.")
+        show_horizons(predictions.iloc[0])
+
+    what_if_prep(inputs)
+
     # show sample data
     data_prep_sup.display_sample_data_table()
 
-    return df
\ No newline at end of file
+    return df_predict
@@ -1,16 +1,61 @@
-import os
-import joblib
 import numpy as np
 import pandas as pd
 import streamlit as st
 from snowflake.snowpark.context import get_active_session
 from snowflake.ml.registry import Registry
+from utils import model_cache
+from utils import perf
 
 ROLL_KEYS = [
     "link_loss_count_log", "bad_rsl_count_log", "high_temp_count_log",
     "dying_gasp_count_log", "offline_ont_now_log"
 ]
 
+# Base numeric features (no raw IDs or original skewed features), matches the notebook
+NUM_BASE = [
+    'offline_ont_ratio', 'trap_trend_score', 'fault_rate',
+    'snr_avg', 'rx_power_avg_dbm', 'temperature_avg_c',
+    'hour_sin', 'hour_cos', 'is_maintenance_window'
+]
+
+# Measured inputs of a raw row (besides olt_id and timestamp_1h), as uploaded, fetched or streamed
+RAW_FEATURES = [
+    'hour_of_day', 'is_maintenance_window', 'offline_ont_now', 'temperature_avg_c',
+    'link_loss_count', 'bad_rsl_count', 'high_temp_count', 'dying_gasp_count',
+    'offline_ont_ratio', 'fault_rate', 'snr_avg', 'rx_power_avg_dbm', 'trap_trend_score'
+]
+
+ROLL_WINDOWS = (6, 24)
+
+# Decision threshold tuned in the training notebook
+THRESHOLD = 0.4753
+
+# Local fallback when the Snowflake Model Registry is unavailable
+MODEL_FILENAME = 'best_model_CatBoost.joblib'
+
+# Rows of history needed for the deltas/rolling means of the newest row
+CONTEXT_ROWS = max(ROLL_WINDOWS) - 1
+
+# Single-prediction inputs of the two documented samples (shown in the sample table)
+SAMPLE_INPUTS = {
+    'no_outage': {
+        'hour_of_day': 22, 'is_maintenance_window': 0, 'offline_ont_now': 0, 'temperature_avg_c': 38.06,
+        'link_loss_count': 1, 'bad_rsl_count': 0, 'high_temp_count': 0, 'dying_gasp_count': 0,
+        'offline_ont_ratio': 0.000371, 'fault_rate': 0.001311, 'snr_avg': 25.836,
+        'rx_power_avg_dbm': -19.243, 'trap_trend_score': 0.007864,
+    },
+    'outage': {
+        'hour_of_day': 19, 'is_maintenance_window': 0, 'offline_ont_now': 16, 'temperature_avg_c': 38.63,
+        'link_loss_count': 0, 'bad_rsl_count': 0, 'high_temp_count': 0, 'dying_gasp_count': 0,
+        'offline_ont_ratio': 0.043431, 'fault_rate': 0.0, 'snr_avg': 24.452,
+        'rx_power_avg_dbm': -20.044, 'trap_trend_score': 0.650829,
+    },
+}
+
+# Half the finest input step (0.000001), so a value typed into the form matches its sample exactly
+SAMPLE_ATOL = 5e-7
+
+@st.cache_data(show_spinner=False)
 def historical_data(sample_type='default', _session=None):
     """
     Load historical data based on sample type.
@@ -66,6 +111,27 @@ def historical_data(sample_type='default', _session=None):
         st.error(f"Error loading historical data: {str(e)}")
         return pd.DataFrame()
 
+def detect_sample_type(inputs: dict) -> str:
+    """'no_outage' / 'outage' when every input equals that sample (within SAMPLE_ATOL), else 'default'."""
+    for sample_type, sample in SAMPLE_INPUTS.items():
+        if all(np.isclose(float(inputs[k]), v, rtol=0, atol=SAMPLE_ATOL) for k, v in sample.items()):
+            return sample_type
+    return 'default'
+
+def history_context(sample_type: str, olt_id: str) -> pd.DataFrame:
+    """
+    The rows of the (cached) historical sample that feed the rolling features of a new row of olt_id.
+
+    Rolling/delta features are computed per olt_id, so only that OLT's last
+    CONTEXT_ROWS rows matter; other OLTs' rows never change the result.
+    """
+    df_historical = historical_data(sample_type)
+    if df_historical.empty or 'olt_id' not in df_historical.columns:
+        return df_historical
+    rows = df_historical[df_historical['olt_id'].astype(str) == str(olt_id)]
+    return rows.sort_values('timestamp_1h').tail(CONTEXT_ROWS)
+
+@perf.timed("features.handling_skewness")
 def handling_skewness(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
     skewed_feats = [
@@ -82,6 +148,7 @@ def handling_skewness(df: pd.DataFrame) -> pd.DataFrame:
     df.drop(columns=[c for c in skewed_feats if c in df.columns], inplace=True)
     return df
 
+@perf.timed("features.add_time_feats")
 def add_time_feats(df):
     df = df.copy()
     df['hour_sin'] = np.sin(2*np.pi * df['hour_of_day']/24.0)
@@ -96,6 +163,7 @@ def _safe_numeric(df: pd.DataFrame, cols) -> pd.DataFrame:
     f.replace([np.inf, -np.inf], np.nan, inplace=True)
     return f
 
+@perf.timed("features.add_roll_delta")
 def add_roll_delta(f: pd.DataFrame, group_key: str | None = None, windows=(6, 24)) -> pd.DataFrame:
     f = _safe_numeric(f, ROLL_KEYS).copy()
 
@@ -135,6 +203,7 @@ def add_roll_delta(f: pd.DataFrame, group_key: str | None = None, windows=(6, 24
 
     return f
 
+@perf.timed("features.validate_and_reorder_columns")
 def validate_and_reorder_columns(df, feature_columns_path='data/features.csv', _session=None):
     """
     Validate and reorder columns based on reference features.csv file.
@@ -169,6 +238,63 @@ def validate_and_reorder_columns(df, feature_columns_path='data/features.csv', _
         st.warning(f"Could not validate columns: {e}. Returning original DataFrame.")
         return df
 
+def engineer_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Run the feature engineering steps shared by single, batch and live prediction.
+
+    Args:
+        df: Raw rows with timestamp_1h, olt_id and the measured features
+
+    Returns:
+        pd.DataFrame: Rows with *_log, hour_sin/cos, deltas and rolling means added.
+            The original index is kept so results can be aligned back to df.
+    """
+    f = handling_skewness(df)
+    f = add_time_feats(f)
+    f = add_roll_delta(f, group_key="olt_id", windows=ROLL_WINDOWS)
+
+    # Drop temp_anomaly_score due to multicollinearity (matches notebook)
+    if 'temp_anomaly_score' in f.columns:
+        f = f.drop(columns=['temp_anomaly_score'])
+    return f
+
+def select_model_features(f: pd.DataFrame) -> pd.DataFrame:
+    """
+    Select and order the model inputs from an engineered frame.
+
+    Args:
+        f: Output of engineer_features
+
+    Returns:
+        pd.DataFrame: Float feature matrix in features.csv order
+    """
+    # Rolling/delta features from log-transformed columns
+    roll_cols = [
+        c for c in f.columns
+        if any(s in c for s in ["_delta_1h", "_roll6h_mean", "_roll24h_mean"])
+        and any(c.startswith(k.replace('_log', '')) for k in ROLL_KEYS)
+    ]
+
+    # Combine: base features + rolling features
+    feature_cols_all = [c for c in NUM_BASE if c in f.columns] + roll_cols
+    X = f[feature_cols_all].copy()
+
+    # Handle NaN values introduced by logs/diffs/rolling (matches notebook)
+    X = X.replace([float('inf'), float('-inf')], float('nan')).fillna(0.0).astype(float)
+
+    # Final validation and column reordering
+    return validate_and_reorder_columns(X)
+
+@perf.timed("features.build_feature_matrix")
+def build_feature_matrix(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Raw rows -> model feature matrix, indexed like the input rows.
+
+    Note: add_roll_delta re-sorts by (timestamp_1h, olt_id), so align results
+    back to the raw frame by index rather than by position.
+    """
+    return select_model_features(engineer_features(df))
+
 @st.cache_resource
 def get_registry(_session=None):
     """Get Snowflake Model Registry"""
@@ -183,68 +309,95 @@ def get_registry(_session=None):
         return Registry(session=_session)
     return None
 
-@st.cache_resource
-def load_model(model_filename: str = None, model_name: str = "catboost_outage_predictor", version: str = "v1", _session=None):
+def get_model_handle(model_filename: str = None, model_name: str = "catboost_outage_predictor", version: str = "v1", _session=None):
     """
-    Load model from Snowflake Model Registry or fallback to local file.
+    Get the process-wide handle for a model.
+
+    The handle loads from the local artifact cache when possible, otherwise from
+    the Snowflake Model Registry (writing through to the cache), otherwise from
+    trained_models/<model_filename>. It keeps checking the registry in the
+    background and swaps in newer versions. See utils/model_cache.py.
 
     Args:
         model_filename: Local model file (for backward compatibility)
         model_name: Model name in Snowflake Registry
-        version: Model version in Snowflake Registry
+        version: Model version in Snowflake Registry, or 'default' / 'latest'
         _session: Snowflake session (optional)
 
     Returns:
-        Loaded model
+        model_cache.ModelHandle
     """
-    # Try loading from Snowflake Model Registry first
+    registry = None
     try:
         registry = get_registry(_session=_session)
-        if registry is not None:
-            model = registry.get_model(model_name)
-            model_version = model.version(version)
-            return model_version.load(force=True)
     except Exception as e:
-        st.warning(f"Could not load from Snowflake Registry: {e}. Trying local fallback...")
+        st.warning(f"Could not connect to Snowflake Registry: {e}. Using cached or local model...")
 
-    # Fallback to local file loading
-    if model_filename is not None:
-        model_path = f'trained_models/{model_filename}'
+    return model_cache.get_handle(model_name, version, fallback_filename=model_filename, registry=registry)
 
-        if os.path.exists(model_path):
-            try:
-                return joblib.load(model_path)
-            except Exception as e:
-                raise ValueError(f"Error loading model from {model_path}: {e}")
-        else:
-            raise FileNotFoundError(f"No model found at {model_path}")
-    else:
-        raise ValueError("No model source available (neither Registry nor local file)")
+def load_model(model_filename: str = None, model_name: str = "catboost_outage_predictor", version: str = "v1", _session=None):
+    """
+    Load model from the local cache, Snowflake Model Registry or local file.
+
+    Args:
+        model_filename: Local model file (for backward compatibility)
+        model_name: Model name in Snowflake Registry
+        version: Model version in Snowflake Registry
+        _session: Snowflake session (optional)
+
+    Returns:
+        Loaded model (the currently active version, call again to pick up swaps)
+    """
+    return get_model_handle(model_filename, model_name, version, _session).model
+
+@perf.timed("model.predict_proba")
+def predict_proba(df: pd.DataFrame, model=None) -> np.ndarray:
+    """
+    Outage probability for every row of a feature matrix in one model call.
+
+    Args:
+        df: Feature matrix from build_feature_matrix
+        model: Model to score with (defaults to load_model's production model)
 
-def make_prediction(df: pd.DataFrame, threshold: float = 0.4753):
-    model_filename = 'best_model_CatBoost.joblib'
-    model = load_model(model_filename)
+    Returns:
+        np.ndarray: Probability of label_outage_1h == 1 per row
+    """
+    if model is None:
+        model = load_model(MODEL_FILENAME)
     if model is None:
         # Safe fallback
-        proba = np.array([0.0])
-        label = int(proba[0] >= threshold)
-        return label, proba
+        return np.zeros(len(df))
 
     # Some CatBoost models expose predict_proba; others need .predict + .predict_proba
     try:
-        proba = model.predict_proba(df)[:, 1]
+        return np.asarray(model.predict_proba(df))[:, 1]
     except AttributeError:
         # last resort: try decision_function; if not, 0.0
         try:
             raw = model.decision_function(df)
             # squash to (0,1)
-            proba = 1 / (1 + np.exp(-np.asarray(raw)))
+            return 1 / (1 + np.exp(-np.asarray(raw)))
         except Exception:
-            proba = np.zeros(len(df))
+            return np.zeros(len(df))
+
+def make_prediction(df: pd.DataFrame, threshold: float = THRESHOLD):
+    proba = predict_proba(df)
+    if len(proba) == 0:
+        proba = np.array([0.0])
 
     label = int(proba[0] >= threshold)
     return label, proba
 
+def _sample_column(sample_type: str, label: int) -> list:
+    """Values of a sample in the sample table's row order (inputs, then the target)."""
+    sample = SAMPLE_INPUTS[sample_type]
+    values = [sample['hour_of_day'], "Yes" if sample['is_maintenance_window'] else "No"]
+    values += [sample[k] for k in [
+        'offline_ont_now', 'temperature_avg_c', 'link_loss_count', 'bad_rsl_count', 'high_temp_count',
+        'dying_gasp_count', 'offline_ont_ratio', 'fault_rate', 'snr_avg', 'rx_power_avg_dbm', 'trap_trend_score',
+    ]]
+    return values + [label]
+
 def display_sample_data_table():
     try:
         st.markdown("<br>", unsafe_allow_html=True)
@@ -269,38 +422,8 @@ def display_sample_data_table():
                 "Trap Trend Score",
                 "Outage in the next hour",  # target
             ],
-            'No Outage Sample': [
-                22,            # hour_of_day
-                "No",          # is_maintenance_window
-                0,             # offline_ont_now
-                38.06,         # temperature_avg_c
-                1,             # link_loss_count
-                0,             # bad_rsl_count
-                0,             # high_temp_count
-                0,             # dying_gasp_count
-                0.000371,      # offline_ont_ratio
-                0.001311,      # fault_rate
-                25.836,        # snr_avg
-                -19.243,       # rx_power_avg_dbm
-                0.007864,      # trap_trend_score
-                0,             # label_outage_1h
-            ],
-            'Outage Sample': [
-                19,             # hour_of_day
-                "No",           # is_maintenance_window
-                16,             # offline_ont_now
-                38.63,          # temperature_avg_c
-                0,              # link_loss_count
-                0,              # bad_rsl_count
-                0,              # high_temp_count
-                0,              # dying_gasp_count
-                0.043431,       # offline_ont_ratio
-                0.000000,       # fault_rate
-                24.452,         # snr_avg
-                -20.044,        # rx_power_avg_dbm
-                0.650829,       # trap_trend_score
-                1,              # label_outage_1h
-            ]
+            'No Outage Sample': _sample_column('no_outage', label=0),
+            'Outage Sample': _sample_column('outage', label=1),
         }
 
         # Force string dtype for Arrow/Styler compatibility in Streamlit
@@ -0,0 +1,255 @@
+"""
+In-memory dimension cache: OLT, cluster, city and region by integer key.
+
+The static attributes of an OLT (olt_id, city, province, region) and of a
+cluster (cluster_id, cluster_name, its OLT) come from RAW_OLT, RAW_CLUSTER and
+RAW_CITY: the CSVs under RAW_DIR, or the HACKATHON.RAW tables when the CSVs are
+not there and a Snowflake session is active. They are loaded once into arrays
+indexed by the tables' integer keys, so a batch of rows is enriched with one
+take per column instead of every Kafka message and every fetched row carrying
+the strings.
+
+With SLIM_MESSAGES=1 the producer (snowpipe/kafka_producer.py) sends olt_key
+and cluster_key instead of DIMENSION_COLUMNS. enrich() restores the strings
+from the keys, or from olt_id/cluster_name for full messages, so both kinds of
+rows can sit in the same topic and table.
+
+Usage (run from the streamlit/ directory):
+    python -m utils.dimensions input.csv    # bytes per message and per fetch, full vs slim
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+RAW_DIR = '../dataset/RAW'
+DIMENSION_TABLES = ('RAW_OLT', 'RAW_CLUSTER', 'RAW_CITY')
+
+# String columns restored from the keys; slim messages don't carry them
+DIMENSION_COLUMNS = ['olt_id', 'cluster_id', 'cluster_name', 'city', 'province', 'region']
+KEY_COLUMNS = ['olt_key', 'cluster_key']
+
+
+def read_dimension_tables(raw_dir: str = RAW_DIR) -> dict:
+    """RAW_OLT, RAW_CLUSTER and RAW_CITY as frames with lower-case columns, from CSV or Snowflake."""
+    paths = {table: os.path.join(raw_dir, f'{table}.csv') for table in DIMENSION_TABLES}
+    if all(os.path.exists(path) for path in paths.values()):
+        return {table: pd.read_csv(path) for table, path in paths.items()}
+
+    try:
+        from snowflake.snowpark.context import get_active_session
+        session = get_active_session()
+    except Exception:
+        raise FileNotFoundError(f"No {', '.join(DIMENSION_TABLES)} CSVs in {raw_dir} and no Snowflake session")
+    tables = {}
+    for table in DIMENSION_TABLES:
+        df = session.table(f"HACKATHON.RAW.{table}").to_pandas()
+        df.columns = df.columns.str.lower()
+        tables[table] = df
+    return tables
+
+
+def _by_key(frame: pd.DataFrame, key: str, columns: list, fill) -> dict:
+    """
+    Lookup arrays of columns indexed by an integer key.
+
+    Arrays have one extra trailing slot holding fill, so an unknown key coded as
+    -1 looks up fill without a mask.
+    """
+    keys = frame[key].to_numpy(dtype=np.int64)
+    size = int(keys.max()) + 2 if len(keys) else 1
+    arrays = {}
+    for column in columns:
+        values = frame[column].to_numpy()
+        array = np.full(size, fill, dtype=object if fill is None else np.int64)
+        array[keys] = values
+        arrays[column] = array
+    return arrays
+
+
+class DimensionCache:
+    """OLT, cluster and city attributes in key-indexed arrays, for vectorized enrichment."""
+
+    def __init__(self, olt: pd.DataFrame, cluster: pd.DataFrame, city: pd.DataFrame):
+        self.sizes = {'olts': len(olt), 'clusters': len(cluster), 'cities': len(city)}
+        self._olt = {**_by_key(olt, 'olt_key', ['olt_id'], None), **_by_key(olt, 'olt_key', ['city_key'], -1)}
+        self._cluster = {**_by_key(cluster, 'cluster_key', ['cluster_id', 'cluster_name'], None),
+                         **_by_key(cluster, 'cluster_key', ['olt_key'], -1)}
+        self._city = _by_key(city, 'city_key', ['city', 'province', 'region'], None)
+
+        # Natural id -> key, for full rows
+        self._olt_ids = pd.Index(olt['olt_id'].astype(str))
+        self._olt_keys = np.append(olt['olt_key'].to_numpy(dtype=np.int64), -1)
+        self._cluster_names = pd.Index(cluster['cluster_name'].astype(str))
+        self._cluster_keys = np.append(cluster['cluster_key'].to_numpy(dtype=np.int64), -1)
+
+    @classmethod
+    def load(cls, raw_dir: str = RAW_DIR) -> 'DimensionCache':
+        tables = read_dimension_tables(raw_dir)
+        return cls(tables['RAW_OLT'], tables['RAW_CLUSTER'], tables['RAW_CITY'])
+
+    @staticmethod
+    def _codes(values, size: int) -> np.ndarray:
+        """Keys as int64, with missing or unknown keys as -1."""
+        codes = pd.to_numeric(pd.Series(values), errors='coerce').fillna(-1).to_numpy(dtype=np.int64, copy=True)
+        codes[(codes < 0) | (codes >= size - 1)] = -1
+        return codes
+
+    def keys(self, df: pd.DataFrame) -> tuple:
+        """
+        olt_key and cluster_key of every row (-1 where unknown).
+
+        Key columns are used where present; otherwise the key is looked up from
+        olt_id / cluster_name, and an OLT is taken from its cluster as a last resort.
+        """
+        n = len(df)
+        cluster_key = np.full(n, -1, dtype=np.int64)
+        if 'cluster_key' in df.columns:
+            cluster_key = self._codes(df['cluster_key'], len(self._cluster['olt_key']))
+        if 'cluster_name' in df.columns:
+            found = self._cluster_keys[self._cluster_names.get_indexer(df['cluster_name'].astype(str))]
+            cluster_key = np.where(cluster_key < 0, found, cluster_key)
+
+        olt_key = np.full(n, -1, dtype=np.int64)
+        if 'olt_key' in df.columns:
+            olt_key = self._codes(df['olt_key'], len(self._olt['olt_id']))
+        if 'olt_id' in df.columns:
+            found = self._olt_keys[self._olt_ids.get_indexer(df['olt_id'].astype(str))]
+            olt_key = np.where(olt_key < 0, found, olt_key)
+        olt_key = np.where(olt_key < 0, self._cluster['olt_key'][cluster_key], olt_key)
+        return olt_key, cluster_key
+
+    def lookup(self, olt_key: np.ndarray, cluster_key: np.ndarray) -> dict:
+        """DIMENSION_COLUMNS for the given keys, one array each (None where unknown)."""
+        city_key = self._olt['city_key'][olt_key]
+        return {
+            'olt_id': self._olt['olt_id'][olt_key],
+            'cluster_id': self._cluster['cluster_id'][cluster_key],
+            'cluster_name': self._cluster['cluster_name'][cluster_key],
+            'city': self._city['city'][city_key],
+            'province': self._city['province'][city_key],
+            'region': self._city['region'][city_key],
+        }
+
+    def enrich(self, df: pd.DataFrame, columns: list = DIMENSION_COLUMNS) -> pd.DataFrame:
+        """
+        Fill dimension columns that are missing, or null on some rows, from the keys.
+
+        Returns:
+            pd.DataFrame: df itself when nothing is missing, otherwise a copy with the columns filled
+        """
+        wanted = [c for c in columns if c not in df.columns or df[c].isna().any()]
+        if df.empty or not wanted:
+            return df
+        values = self.lookup(*self.keys(df))
+        df = df.copy()
+        for column in wanted:
+            if column in df.columns:
+                df[column] = df[column].where(df[column].notna(), values[column])
+            else:
+                df[column] = values[column]
+        return df
+
+    def olts(self) -> pd.DataFrame:
+        """
+        Every OLT with its dimensions, in olt_id order.
+
+        Returns:
+            pd.DataFrame: olt_key, olt_id, city, province, region, clusters (count) and
+                cluster_names (comma-separated, sorted)
+        """
+        olt_key = np.flatnonzero(pd.notna(self._olt['olt_id']))
+        city_key = self._olt['city_key'][olt_key]
+        cluster_key = np.flatnonzero(pd.notna(self._cluster['cluster_name']))
+        owner = self._cluster['olt_key'][cluster_key]
+        names = (pd.Series(self._cluster['cluster_name'][cluster_key].astype(str))
+                 .groupby(owner).agg(lambda n: ', '.join(sorted(n))))
+        catalog = pd.DataFrame({
+            'olt_key': olt_key,
+            'olt_id': self._olt['olt_id'][olt_key],
+            'city': self._city['city'][city_key],
+            'province': self._city['province'][city_key],
+            'region': self._city['region'][city_key],
+            'clusters': np.bincount(owner[owner >= 0], minlength=len(self._olt['olt_id']))[olt_key],
+        })
+        catalog['cluster_names'] = catalog['olt_key'].map(names).fillna('')
+        return catalog.sort_values('olt_id').reset_index(drop=True)
+
+    def slim(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Full rows -> olt_key, cluster_key and the other columns, without DIMENSION_COLUMNS."""
+        olt_key, cluster_key = self.keys(df)
+        slim = df.drop(columns=[c for c in DIMENSION_COLUMNS + KEY_COLUMNS if c in df.columns])
+        slim.insert(0, 'cluster_key', pd.array(np.where(cluster_key < 0, None, cluster_key), dtype='Int64'))
+        slim.insert(0, 'olt_key', pd.array(np.where(olt_key < 0, None, olt_key), dtype='Int64'))
+        return slim
+
+
+@st.cache_resource(show_spinner=False)
+def get_dimension_cache(raw_dir: str = RAW_DIR) -> DimensionCache:
+    """Process-wide dimension cache, loaded once."""
+    return DimensionCache.load(raw_dir)
+
+
+def enrich(df: pd.DataFrame, columns: list = DIMENSION_COLUMNS, raw_dir: str = RAW_DIR) -> pd.DataFrame:
+    """Fill missing dimension columns with the shared cache; rows are returned unchanged without dimension tables."""
+    try:
+        cache = get_dimension_cache(raw_dir)
+    except FileNotFoundError:
+        return df
+    return cache.enrich(df, columns)
+
+
+def message_bytes(df: pd.DataFrame) -> np.ndarray:
+    """Size of each row as a producer JSON message (NaN -> null, plus sent_at and row_index)."""
+    sizes = []
+    for index, line in enumerate(df.to_json(orient='records', lines=True, date_format='iso').splitlines()):
+        data = json.loads(line)
+        data['sent_at'] = datetime.now(timezone.utc).isoformat()
+        data['row_index'] = index
+        sizes.append(len(json.dumps(data).encode('utf-8')))
+    return np.array(sizes)
+
+
+def fetch_bytes(df: pd.DataFrame) -> int:
+    """Size of rows as an Arrow table, the format a Snowflake fetch transfers."""
+    import pyarrow as pa
+    return pa.Table.from_pandas(df, preserve_index=False).nbytes
+
+
+def report(df: pd.DataFrame, cache: DimensionCache) -> pd.DataFrame:
+    """Bytes per message and per fetch of df's rows, full rows vs slim rows."""
+    full = cache.enrich(df)
+    slim = cache.slim(full)
+    rows = []
+    for name, frame in (('full', full), ('slim', slim)):
+        sizes = message_bytes(frame)
+        rows.append({
+            'rows': name,
+            'columns': frame.shape[1],
+            'bytes_per_message': sizes.mean(),
+            'bytes_per_fetch': fetch_bytes(frame),
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    from utils.feature_store import read_table
+
+    parser = argparse.ArgumentParser(description="Compare full and slim (key-only) producer messages")
+    parser.add_argument('input', help="CSV/Parquet of feature rows, as sent by the producer")
+    parser.add_argument('--rows', type=int, default=1_000, help="Rows per fetch (live page limit)")
+    parser.add_argument('--raw-dir', default=RAW_DIR)
+    args = parser.parse_args()
+
+    df = read_table(args.input)
+    df.columns = df.columns.str.lower()
+    cache = DimensionCache.load(args.raw_dir)
+    print(f"Dimension cache: {cache.sizes}")
+    print(report(df.head(args.rows), cache).to_string(index=False, float_format=lambda v: f"{v:,.1f}"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""
+Feature drift of live inputs against the training distribution.
+
+The baseline (build_baseline) cuts every monitored feature of the training
+rows at its quantiles into at most BINS bins and stores the edges and the
+training counts per bin, overall and per region, in DRIFT_BASELINE_PATH.
+
+Every scored batch is added to a histogram on the same edges (observe): one
+searchsorted per feature and one bincount for all features and regions, so
+memory is fixed (regions x features x bins) however many rows are scored.
+Counts decay with a half-life of HALF_LIFE_ROWS rows, so the histograms
+describe recent traffic rather than everything since the server started.
+
+report() compares each histogram with its baseline:
+    psi   population stability index; >= PSI_WATCH is worth a look and
+          >= PSI_DRIFT is a shift the 0.4753 threshold wasn't tuned for
+    ks    largest gap between the two CDFs at the bin edges (a lower bound
+          of the exact KS statistic), flagged when significant at KS_ALPHA
+          and at least KS_WATCH
+
+Time-of-day features (hour_sin/hour_cos) aren't monitored: a short window of
+traffic covers only some hours by design.
+
+Usage (run from the streamlit/ directory):
+    python -m utils.drift fact_ml_features.parquet --start 2023-01-01 --end 2024-06-30
+"""
+import argparse
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+from utils import perf
+
+BASELINE_PATH = os.environ.get('DRIFT_BASELINE_PATH', 'data/drift_baseline.json')
+BASELINE_VERSION = 1
+
+BINS = 20
+HALF_LIFE_ROWS = float(os.environ.get('DRIFT_HALF_LIFE_ROWS', '20000'))
+
+PSI_WATCH = 0.1
+PSI_DRIFT = 0.25
+KS_ALPHA = 0.01
+# A significant KS gap only counts from this size (large windows make tiny gaps significant)
+KS_WATCH = 0.1
+# c(alpha) of the two-sample KS test at KS_ALPHA
+KS_C_ALPHA = np.sqrt(-np.log(KS_ALPHA / 2) / 2)
+
+# Fewer (decayed) rows than this are not compared
+MIN_ROWS = 1000
+
+# Smoothing of empty bins in PSI
+PSI_EPS = 1e-4
+
+# Raw counts monitored on the log scale the model's rolling features use
+LOG_COUNTS = ['link_loss_count', 'bad_rsl_count', 'high_temp_count', 'dying_gasp_count', 'offline_ont_now']
+EXCLUDED = {'hour_sin', 'hour_cos'}
+
+ALL_REGIONS = 'All'
+UNKNOWN_REGION = 'Unknown'
+
+
+def monitored_frame(X: pd.DataFrame, raw: pd.DataFrame = None) -> pd.DataFrame:
+    """Model features (without time of day) plus the *_log counts of raw rows aligned to X."""
+    columns = [c for c in X.columns if c not in EXCLUDED]
+    values = X[columns].to_numpy(dtype=float)
+    counts = [c for c in LOG_COUNTS if raw is not None and c in raw.columns]
+    if counts:
+        logs = np.log1p(np.clip(raw.loc[X.index, counts].to_numpy(dtype=float, na_value=np.nan), 0, None))
+        values = np.hstack([values, logs])
+        columns = columns + [f"{c}_log" for c in counts]
+    return pd.DataFrame(values, index=X.index, columns=columns)
+
+
+def _bins(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    return np.searchsorted(edges, values, side='right')
+
+
+def build_baseline(frame: pd.DataFrame, regions: pd.Series = None, bins: int = BINS) -> dict:
+    """
+    Quantile bin edges and training counts of every column of frame.
+
+    Args:
+        frame: monitored_frame of the training rows
+        regions: Region of every row (optional), for per-region baselines
+    """
+    regions = (regions if regions is not None else pd.Series(UNKNOWN_REGION, index=frame.index))
+    regions = regions.reindex(frame.index).fillna(UNKNOWN_REGION).astype(str)
+    features = {}
+    for column in frame.columns:
+        values = pd.to_numeric(frame[column], errors='coerce').to_numpy(dtype=float)
+        known = ~np.isnan(values)
+        # Interior quantiles; ties collapse, so discrete features get fewer bins
+        edges = np.unique(np.quantile(values[known], np.linspace(0, 1, bins + 1)[1:-1])) if known.any() else np.array([])
+        codes = _bins(values[known], edges)
+        counts = {ALL_REGIONS: np.bincount(codes, minlength=len(edges) + 1).tolist()}
+        for region, part in pd.Series(codes).groupby(regions.to_numpy()[known]):
+            counts[region] = np.bincount(part.to_numpy(), minlength=len(edges) + 1).tolist()
+        features[column] = {'edges': edges.tolist(), 'counts': counts}
+    return {
+        'version': BASELINE_VERSION,
+        'rows': len(frame),
+        'regions': sorted(set(regions.unique()) - {UNKNOWN_REGION}),
+        'features': features,
+        'built_at': pd.Timestamp.now(tz='UTC').isoformat(),
+    }
+
+
+def save_baseline(baseline: dict, path: str = BASELINE_PATH):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(baseline, f)
+    os.replace(tmp, path)
+
+
+def load_baseline(path: str = BASELINE_PATH):
+    """The stored baseline, or None when there is none (drift monitoring is then off)."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        baseline = json.load(f)
+    return baseline if baseline.get('version') == BASELINE_VERSION else None
+
+
+class DriftMonitor:
+    """Decayed histograms of live features per region, on the baseline's bin edges."""
+
+    def __init__(self, baseline: dict, half_life_rows: float = HALF_LIFE_ROWS):
+        self.baseline = baseline
+        self.half_life_rows = half_life_rows
+        self.features = list(baseline['features'])
+        self.regions = baseline['regions'] + [UNKNOWN_REGION]
+        self._region_index = pd.Index(baseline['regions'])
+        self._edges = [np.asarray(baseline['features'][f]['edges'], dtype=float) for f in self.features]
+        self.width = max(len(e) for e in self._edges) + 1
+        self._feature_offsets = np.arange(len(self.features)) * self.width
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = np.zeros((len(self.regions), len(self.features), self.width))
+            self.rows_seen = 0
+
+    def observe(self, frame: pd.DataFrame, regions=None):
+        """Add a batch of monitored_frame rows; columns the baseline doesn't have are ignored."""
+        n = len(frame)
+        if not n:
+            return
+        with perf.timer("drift.observe"):
+            if regions is None:
+                region_codes = np.full(n, len(self.regions) - 1)
+            else:
+                # A batch holds a few distinct regions: look those up, not every row
+                inverse, names = pd.factorize(np.asarray(regions, dtype=object), use_na_sentinel=False)
+                region_codes = self._region_index.get_indexer(names.astype(str))[inverse]
+                region_codes[region_codes < 0] = len(self.regions) - 1
+
+            # One row per feature, each binned with a searchsorted over its few edges
+            values = np.ascontiguousarray(frame.reindex(columns=self.features).to_numpy(dtype=float, na_value=np.nan).T)
+            codes = np.empty(values.shape, dtype=np.int64)
+            for f, edges in enumerate(self._edges):
+                codes[f] = _bins(values[f], edges)
+            cells = region_codes[None, :] * self._counts[0].size + self._feature_offsets[:, None] + codes
+            batch = np.bincount(cells[~np.isnan(values)], minlength=self._counts.size)
+
+            with self._lock:
+                self._counts *= 0.5 ** (n / self.half_life_rows)
+                self._counts += batch.reshape(self._counts.shape)
+                self.rows_seen += n
+
+    def report(self) -> pd.DataFrame:
+        """
+        Drift of every feature, overall ('All') and per region.
+
+        Returns:
+            pd.DataFrame: region, feature, rows (decayed live rows), psi, ks, ks_critical, status
+        """
+        with self._lock:
+            counts = self._counts.copy()
+        rows = []
+        regions = [(ALL_REGIONS, counts.sum(axis=0))] + [(r, counts[i]) for i, r in enumerate(self.regions)]
+        for region, region_counts in regions:
+            for f, feature in enumerate(self.features):
+                stored = self.baseline['features'][feature]['counts']
+                base = np.asarray(stored.get(region, stored[ALL_REGIONS]), dtype=float)
+                live = region_counts[f, :len(base)]
+                n, m = live.sum(), base.sum()
+                row = {'region': region, 'feature': feature, 'rows': n}
+                if n < MIN_ROWS or m == 0:
+                    rows.append({**row, 'psi': np.nan, 'ks': np.nan, 'ks_critical': np.nan,
+                                 'status': 'too few rows'})
+                    continue
+                p, q = live / n, base / m
+                ps, qs = np.maximum(p, PSI_EPS), np.maximum(q, PSI_EPS)
+                psi = float(np.sum((ps - qs) * np.log(ps / qs)))
+                ks = float(np.max(np.abs(np.cumsum(p) - np.cumsum(q))))
+                critical = float(KS_C_ALPHA * np.sqrt((n + m) / (n * m)))
+                status = 'drift' if psi >= PSI_DRIFT else 'watch' if psi >= PSI_WATCH or ks > max(critical, KS_WATCH) else 'ok'
+                rows.append({**row, 'psi': psi, 'ks': ks, 'ks_critical': critical, 'status': status})
+        return pd.DataFrame(rows)
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor(path: str = BASELINE_PATH):
+    """Process-wide monitor, or None without a baseline."""
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                baseline = load_baseline(path)
+                if baseline is None:
+                    return None
+                _monitor = DriftMonitor(baseline)
+    return _monitor
+
+
+def observe(X: pd.DataFrame, raw: pd.DataFrame = None, regions=None):
+    """
+    Add a scored batch to the process-wide monitor; a no-op without a baseline.
+
+    Args:
+        X: Feature matrix the batch was scored on
+        raw: Raw rows X was built from, for the *_log counts (optional)
+        regions: Region per row of X (optional)
+    """
+    monitor = get_monitor()
+    if monitor is None or X.empty:
+        return
+    try:
+        monitor.observe(monitored_frame(X, raw), None if regions is None else np.asarray(regions))
+    except Exception as e:
+        # Monitoring must never break scoring
+        print(f"Warning: drift monitor skipped a batch: {e}")
+
+
+def flagged(report: pd.DataFrame) -> pd.DataFrame:
+    """Features flagged 'drift' or 'watch': drift first, overall before regions, then by PSI."""
+    if report.empty:
+        return report
+    flags = report[report['status'].isin(['drift', 'watch'])]
+    order = pd.DataFrame({'status': flags['status'] != 'drift', 'region': flags['region'] != ALL_REGIONS,
+                          'psi': -flags['psi']})
+    return flags.loc[order.sort_values(['status', 'region', 'psi']).index]
+
+
+def main():
+    from utils import data_prep_sup
+    from utils.backtest import attach_region
+    from utils.feature_store import read_table
+
+    parser = argparse.ArgumentParser(description="Build the training baseline for the feature drift monitor")
+    parser.add_argument('input', help="Parquet/CSV of raw FACT_ML_FEATURES training rows")
+    parser.add_argument('--start', help="First timestamp_1h of the training window")
+    parser.add_argument('--end', help="Last timestamp_1h of the training window")
+    parser.add_argument('--output', default=BASELINE_PATH)
+    parser.add_argument('--bins', type=int, default=BINS)
+    args = parser.parse_args()
+
+    df = read_table(args.input)
+    if args.start:
+        df = df[df['timestamp_1h'] >= pd.Timestamp(args.start)]
+    if args.end:
+        df = df[df['timestamp_1h'] <= pd.Timestamp(args.end)]
+    df = attach_region(df.reset_index(drop=True))
+    X = data_prep_sup.build_feature_matrix(df.copy())
+    frame = monitored_frame(X, df)
+    baseline = build_baseline(frame, df.loc[X.index, 'region'] if 'region' in df.columns else None, bins=args.bins)
+    save_baseline(baseline, args.output)
+    print(f"✅ Baseline of {baseline['rows']:,} rows, {len(baseline['features'])} features and "
+          f"{len(baseline['regions'])} regions written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
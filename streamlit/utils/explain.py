@@ -0,0 +1,346 @@
+"""
+Per-row explanations (SHAP contributions) and global feature importance.
+
+Contributions are exact path-dependent TreeSHAP values in log-odds; each row's
+contributions plus its base value add up to the model's raw score.
+
+In a CatBoost oblivious tree the leaf a row lands in fixes the direction of
+every split, so the row's SHAP values in that tree depend only on the leaf.
+LeafShapTable computes them once per leaf of every tree (what CatBoost's
+UsePreCalc shap mode recomputes on every call), and explaining rows is then
+CatBoost's native leaf-index evaluation plus a sparse gather-sum, about the
+cost of scoring. Other models use their own TreeSHAP (XGBoost pred_contribs,
+LightGBM pred_contrib, CatBoost ShapValues).
+
+explain_with_cache() follows prediction_cache: rows are keyed by (olt_id,
+timestamp_1h, feature hash, model version), and only rows not seen before are
+explained, in batches.
+
+Global importance (mean |SHAP| over a large sample) is too slow for a page
+load. ImportanceJob runs it on a background thread and writes
+data/feature_importance.csv, which the dashboard reads. The job can also run
+from the command line:
+
+    python -m utils.explain --input data/fact_ml_features_snapshot.parquet
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from math import factorial
+import numpy as np
+import pandas as pd
+import streamlit as st
+from scipy import sparse
+from utils import data_prep_sup
+from utils import olt_history
+from utils import perf
+from utils import prediction_cache
+from utils.feature_store import read_table
+
+BASE_VALUE = 'base_value'
+EXPLAIN_BATCH_ROWS = 4096
+CONTRIBUTION_CACHE_ENTRIES = 50_000
+
+# Deeper trees fall back to CatBoost's own ShapValues (the table grows as 4^depth)
+LEAF_TABLE_MAX_DEPTH = 10
+LEAF_TABLES_KEPT = 4
+
+IMPORTANCE_PATH = 'data/feature_importance.csv'
+IMPORTANCE_INPUT = os.environ.get('IMPORTANCE_INPUT', olt_history.SNAPSHOT_PATH)
+IMPORTANCE_SAMPLE_ROWS = 50_000
+
+
+def _oblivious_tree_shap(tree: dict, flat_index: dict, n_features: int):
+    """
+    SHAP values of each leaf of one oblivious tree.
+
+    Split i decides bit i of the leaf index and the last split is the root.
+    With S the features known, the tree's expected value for a row in leaf L
+    sums the leaves that agree with L on the splits over S, each weighted by
+    the cover ratios of the splits not over S (path-dependent TreeSHAP).
+
+    Returns:
+        tuple: ((leaves, n_features) SHAP values, expected value of the tree)
+    """
+    splits = tree['splits']
+    depth = len(splits)
+    n_leaves = 1 << depth
+    leaves = np.arange(n_leaves)
+    values = np.asarray(tree['leaf_values'], dtype=float)
+    cover = np.asarray(tree['leaf_weights'], dtype=float)
+    split_features = np.array([flat_index[split['float_feature_index']] for split in splits], dtype=int)
+
+    # Cover ratio child/parent of each split for every leaf, walking from the root
+    ratio = np.ones((depth, n_leaves))
+    decided = 0
+    parent_cover = np.full(n_leaves, cover.sum())
+    for level in reversed(range(depth)):
+        decided |= 1 << level
+        keys = leaves & decided
+        child_cover = np.bincount(keys, weights=cover, minlength=n_leaves)[keys]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio[level] = np.where(parent_cover > 0, child_cover / parent_cover, 0.0)
+        parent_cover = child_cover
+
+    # Expected value given every subset S of the tree's features, for every leaf
+    features, player = np.unique(split_features, return_inverse=True)
+    n_players = len(features)
+    subsets = np.arange(1 << n_players)
+    known = ((subsets[:, None] >> player[None, :]) & 1).astype(bool)
+    weighted = values[None, :] * np.prod(np.where(known[:, :, None], 1.0, ratio[None]), axis=1)
+    keys = leaves[None, :] & (known * (1 << np.arange(depth))[None, :]).sum(axis=1)[:, None]
+    sums = np.bincount((subsets[:, None] * n_leaves + keys).ravel(), weights=weighted.ravel(),
+                       minlength=len(subsets) * n_leaves).reshape(len(subsets), n_leaves)
+    expected = np.take_along_axis(sums, keys, axis=1)
+
+    size = np.array([bin(subset).count('1') for subset in subsets])
+    shapley_weight = np.array([factorial(k) * factorial(n_players - k - 1) / factorial(n_players)
+                               for k in range(n_players)])
+    table = np.zeros((n_leaves, n_features))
+    for j, feature in enumerate(features):
+        without = subsets[((subsets >> j) & 1) == 0]
+        table[:, feature] = (shapley_weight[size[without]][:, None]
+                             * (expected[without | (1 << j)] - expected[without])).sum(axis=0)
+    return table, expected[0, 0]
+
+
+class LeafShapTable:
+    """Per-leaf SHAP values of every tree of a CatBoost model with numeric splits."""
+
+    def __init__(self, model):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model.json')
+            model.save_model(path, format='json')
+            with open(path) as f:
+                spec = json.load(f)
+
+        trees = spec.get('oblivious_trees') or []
+        if not trees or any('leaf_weights' not in tree or len(tree['splits']) > LEAF_TABLE_MAX_DEPTH
+                            or len(tree['leaf_values']) != 1 << len(tree['splits'])
+                            or any(split.get('split_type') != 'FloatFeature' for split in tree['splits'])
+                            for tree in trees):
+            raise TypeError("Only binary CatBoost models with numeric oblivious splits have leaf tables")
+
+        flat_index = {f['feature_index']: f['flat_feature_index'] for f in spec['features_info']['float_features']}
+        n_features = len(model.feature_names_)
+        scale, bias = spec.get('scale_and_bias', [1.0, [0.0]])
+        tables, expected = zip(*(_oblivious_tree_shap(tree, flat_index, n_features) for tree in trees))
+
+        self.model = model
+        self.table = np.vstack(tables) * scale
+        self.offsets = np.concatenate([[0], np.cumsum([len(t) for t in tables])[:-1]])
+        self.base_value = scale * float(np.sum(expected)) + float(np.sum(bias))
+
+    def contributions(self, X: pd.DataFrame) -> np.ndarray:
+        from catboost import Pool
+        leaf = np.asarray(self.model.calc_leaf_indexes(Pool(X)), dtype=np.int64) + self.offsets[None, :]
+        rows = np.repeat(np.arange(len(X)), leaf.shape[1])
+        onehot = sparse.csr_matrix((np.ones(leaf.size), (rows, leaf.ravel())), shape=(len(X), len(self.table)))
+        values = np.asarray(onehot @ self.table)
+        return np.hstack([values, np.full((len(X), 1), self.base_value)])
+
+
+_LEAF_TABLES = OrderedDict()
+_LEAF_TABLES_LOCK = threading.Lock()
+
+
+def leaf_shap_table(model):
+    """
+    Leaf table of a model, built once per model object (each new model version is a new object).
+
+    Returns:
+        LeafShapTable or None: None when the model's trees are not supported
+    """
+    with _LEAF_TABLES_LOCK:
+        entry = _LEAF_TABLES.get(id(model))
+        if entry is not None and entry[0] is model:
+            _LEAF_TABLES.move_to_end(id(model))
+            return entry[1]
+    with perf.timer("explain.leaf_table_build"):
+        try:
+            table = LeafShapTable(model)
+        except TypeError:
+            table = None
+    with _LEAF_TABLES_LOCK:
+        _LEAF_TABLES[id(model)] = (model, table)
+        while len(_LEAF_TABLES) > LEAF_TABLES_KEPT:
+            _LEAF_TABLES.popitem(last=False)
+    return table
+
+
+def native_contributions(model, X: pd.DataFrame) -> np.ndarray:
+    """
+    SHAP values from the model's native TreeSHAP.
+
+    Returns:
+        np.ndarray: (rows, features + 1) in log-odds; the last column is the base value
+
+    Raises:
+        TypeError: The model has no native SHAP implementation
+    """
+    library = type(model).__module__.split('.')[0]
+    if library == 'catboost':
+        table = leaf_shap_table(model)
+        if table is not None:
+            return table.contributions(X)
+        from catboost import Pool
+        return np.asarray(model.get_feature_importance(Pool(X), type='ShapValues'), dtype=float)
+    if library == 'xgboost':
+        import xgboost
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model
+        return np.asarray(booster.predict(xgboost.DMatrix(X), pred_contribs=True), dtype=float)
+    if library == 'lightgbm':
+        return np.asarray(model.predict(X, pred_contrib=True), dtype=float)
+    raise TypeError(f"No native SHAP path for {type(model).__name__}")
+
+
+@perf.timed("explain.contributions")
+def contributions(X: pd.DataFrame, model) -> pd.DataFrame:
+    """Contributions of every row of X, computed EXPLAIN_BATCH_ROWS at a time."""
+    parts = [native_contributions(model, X.iloc[start:start + EXPLAIN_BATCH_ROWS])
+             for start in range(0, len(X), EXPLAIN_BATCH_ROWS)]
+    values = np.vstack(parts) if parts else np.empty((0, X.shape[1] + 1))
+    return pd.DataFrame(values, index=X.index, columns=[*X.columns, BASE_VALUE])
+
+
+@st.cache_resource
+def get_contribution_cache() -> prediction_cache.PredictionCache:
+    """Process-wide contribution cache shared by every session."""
+    return prediction_cache.PredictionCache(max_entries=CONTRIBUTION_CACHE_ENTRIES)
+
+
+def explain_with_cache(X: pd.DataFrame, olt_ids, timestamps, model, model_version: str,
+                       cache: prediction_cache.PredictionCache = None):
+    """
+    Contributions of a feature matrix, computing only rows not explained before.
+
+    Args:
+        X: Feature matrix from data_prep_sup.build_feature_matrix
+        olt_ids: olt_id per row of X
+        timestamps: timestamp_1h per row of X
+        model: Tree model to explain
+        model_version: Identifier of model
+        cache: Cache to use (defaults to the process-wide one)
+
+    Returns:
+        tuple: (contributions indexed like X, number of rows actually explained)
+    """
+    cache = cache or get_contribution_cache()
+    keys = prediction_cache.cache_keys(X, olt_ids, timestamps)
+    cached = cache.get_values(keys, model_version)
+    miss = np.array([value is None for value in cached], dtype=bool)
+
+    values = np.empty((len(X), X.shape[1] + 1))
+    if (~miss).any():
+        values[~miss] = np.vstack([value for value in cached if value is not None])
+    if miss.any():
+        computed = contributions(X[miss], model).to_numpy()
+        values[miss] = computed
+        cache.put_values([key for key, m in zip(keys, miss) if m], [row.copy() for row in computed], model_version)
+    return pd.DataFrame(values, index=X.index, columns=[*X.columns, BASE_VALUE]), int(miss.sum())
+
+
+def top_factors(contrib: pd.DataFrame, k: int = 3) -> pd.Series:
+    """The k largest contributions of each row as text, e.g. 'trap_trend_score +1.21, snr_avg -0.30'."""
+    values = contrib.drop(columns=BASE_VALUE)
+    arr = values.to_numpy()
+    order = np.argsort(-np.abs(arr), axis=1)[:, :k]
+    names = values.columns.to_numpy()[order]
+    picked = np.take_along_axis(arr, order, axis=1)
+    return pd.Series(
+        [', '.join(f"{name} {value:+.2f}" for name, value in zip(row_names, row_values))
+         for row_names, row_values in zip(names, picked)],
+        index=contrib.index,
+    )
+
+
+def global_importance(X: pd.DataFrame, model, sample_rows: int = IMPORTANCE_SAMPLE_ROWS, seed: int = 0) -> pd.DataFrame:
+    """
+    Mean |SHAP| per feature over (a sample of) X, as shares that sum to 1.
+
+    Returns:
+        pd.DataFrame: feature, importance_mean (the data/feature_importance.csv format)
+    """
+    if len(X) > sample_rows:
+        X = X.sample(sample_rows, random_state=seed)
+    mean_abs = np.abs(contributions(X, model).drop(columns=BASE_VALUE).to_numpy()).mean(axis=0)
+    total = mean_abs.sum()
+    importance = pd.DataFrame({'feature': X.columns, 'importance_mean': mean_abs / total if total else mean_abs})
+    return importance.sort_values('importance_mean', ascending=False).reset_index(drop=True)
+
+
+def compute_importance_file(input_path: str = IMPORTANCE_INPUT, output_path: str = IMPORTANCE_PATH, model=None,
+                            sample_rows: int = IMPORTANCE_SAMPLE_ROWS) -> dict:
+    """Raw rows -> feature matrix -> global importance, written atomically to output_path."""
+    started = time.perf_counter()
+    X = data_prep_sup.build_feature_matrix(read_table(input_path))
+    if model is None:
+        model = data_prep_sup.load_model(data_prep_sup.MODEL_FILENAME)
+    importance = global_importance(X, model, sample_rows)
+
+    tmp_path = f"{output_path}.tmp"
+    importance.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, output_path)
+    return {'rows': min(len(X), sample_rows), 'seconds': time.perf_counter() - started, 'output': output_path}
+
+
+class ImportanceJob:
+    """Recomputes global importance on a background thread, one run at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.status = {'state': 'idle'}
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, input_path: str = IMPORTANCE_INPUT, output_path: str = IMPORTANCE_PATH, model=None) -> bool:
+        """Start a run unless one is in progress; returns whether it started."""
+        with self._lock:
+            if self.running():
+                return False
+            # Resolve the model on the calling thread (it may need the Streamlit runtime)
+            if model is None:
+                model = data_prep_sup.load_model(data_prep_sup.MODEL_FILENAME)
+            self.status = {'state': 'running', 'started_at': pd.Timestamp.now(), 'input': input_path}
+            self._thread = threading.Thread(target=self._run, args=(input_path, output_path, model),
+                                            name="global-importance", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, input_path: str, output_path: str, model):
+        try:
+            result = compute_importance_file(input_path, output_path, model)
+            status = {'state': 'done', **result}
+        except Exception as e:
+            status = {'state': 'failed', 'error': str(e)}
+        self.status = {**self.status, **status, 'finished_at': pd.Timestamp.now()}
+
+    def info(self) -> dict:
+        return dict(self.status)
+
+
+@st.cache_resource
+def get_importance_job() -> ImportanceJob:
+    """Process-wide job, so a run survives reruns and is shared by sessions."""
+    return ImportanceJob()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute global SHAP feature importance")
+    parser.add_argument('--input', default=IMPORTANCE_INPUT, help="Parquet/CSV of raw feature rows")
+    parser.add_argument('--output', default=IMPORTANCE_PATH)
+    parser.add_argument('--sample-rows', type=int, default=IMPORTANCE_SAMPLE_ROWS)
+    args = parser.parse_args()
+
+    result = compute_importance_file(args.input, args.output, sample_rows=args.sample_rows)
+    print(f"✅ Importance of {result['rows']} rows written to {result['output']} in {result['seconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
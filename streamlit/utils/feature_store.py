@@ -0,0 +1,359 @@
+"""
+On-disk feature store for the engineered model matrix.
+
+The store keeps the output of the data_prep_sup pipeline (the 24 model
+features plus the five *_log columns the rolling features are derived from)
+as one memory-mapped float32 file per column. Rows are sorted by olt_id, then
+timestamp_1h, and every OLT owns a contiguous block with some spare capacity,
+so reading the last N hours of an OLT is a zero-copy slice and new hours can
+be appended in place.
+
+Layout of a store directory:
+    meta.json           columns, total capacity and the OLT -> block index
+    timestamp_1h.i8     int64 nanoseconds since epoch
+    <column>.f32        one float32 array per feature column
+
+Usage (run from the streamlit/ directory):
+    python -m utils.feature_store build history.parquet feature_store/
+    python -m utils.feature_store append new_hours.csv feature_store/
+"""
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from utils import data_prep_sup
+
+META_FILE = 'meta.json'
+TIMESTAMP_FILE = 'timestamp_1h.i8'
+STORE_VERSION = 1
+
+# Spare rows reserved per OLT so hourly appends don't force a relayout (1 week)
+DEFAULT_SLACK_HOURS = 24 * 7
+
+# Rows of stored history needed to recompute deltas/rolling means for new hours
+CONTEXT_ROWS = max(data_prep_sup.ROLL_WINDOWS) - 1
+
+
+def read_table(path: str) -> pd.DataFrame:
+    """Read a Parquet, CSV or Excel export of raw feature rows."""
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+    elif path.endswith(('.xlsx', '.xls')):
+        df = pd.read_excel(path)
+    else:
+        df = pd.read_csv(path)
+
+    # Snowflake exports use upper-case column names
+    df.columns = [str(c).lower() for c in df.columns]
+    if 'timestamp_1h' in df.columns:
+        df['timestamp_1h'] = pd.to_datetime(df['timestamp_1h'], errors='coerce')
+    return df
+
+
+def _to_ns(ts) -> np.ndarray:
+    return pd.to_datetime(ts).astype('datetime64[ns]').to_numpy().view('i8')
+
+
+def _engineer(df: pd.DataFrame) -> pd.DataFrame:
+    """Engineered frame with olt_id, timestamp_1h, *_log and model features."""
+    engineered = data_prep_sup.engineer_features(df)
+    X = data_prep_sup.select_model_features(engineered)
+    keep = ['olt_id', 'timestamp_1h'] + [k for k in data_prep_sup.ROLL_KEYS if k in engineered.columns]
+    return X.join(engineered[keep])
+
+
+class FeatureStore:
+    """
+    Memory-mapped, columnar store of engineered features keyed by (olt_id, timestamp_1h).
+
+    Open an existing store with FeatureStore(path); create one with FeatureStore.build().
+    Slices returned by the read methods are views into the mapped files, so they are
+    only valid until the next append that triggers a relayout (call refresh() to remap).
+    """
+
+    def __init__(self, path: str, mode: str = 'r'):
+        self.path = path
+        self.mode = mode
+        self.refresh()
+
+    # ------------------------------------------------------------------ #
+    # Opening / metadata
+    # ------------------------------------------------------------------ #
+    def refresh(self):
+        """Reload the OLT index and remap the column files."""
+        with open(os.path.join(self.path, META_FILE)) as f:
+            meta = json.load(f)
+
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported feature store version: {meta.get('version')}")
+
+        self.columns = meta['columns']
+        self.feature_columns = meta['feature_columns']
+        self.capacity = meta['capacity']
+        self.index = {olt: tuple(block) for olt, block in meta['olts'].items()}
+
+        self._timestamps = self._map(TIMESTAMP_FILE, np.int64)
+        self._data = {col: self._map(f"{col}.f32", np.float32) for col in self.columns}
+
+    def _map(self, filename: str, dtype):
+        return np.memmap(os.path.join(self.path, filename), dtype=dtype, mode=self.mode, shape=(self.capacity,))
+
+    @staticmethod
+    def _write_meta(path, columns, feature_columns, capacity, index):
+        meta = {
+            'version': STORE_VERSION,
+            'columns': columns,
+            'feature_columns': feature_columns,
+            'capacity': int(capacity),
+            'olts': {olt: [int(v) for v in block] for olt, block in index.items()},
+        }
+        # Write to a temp file and swap so readers never see a half-written index
+        tmp_path = os.path.join(path, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, META_FILE))
+
+    def olts(self) -> list:
+        return list(self.index)
+
+    def __len__(self):
+        return sum(length for _, length, _ in self.index.values())
+
+    # ------------------------------------------------------------------ #
+    # Building
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def build(cls, path: str, raw_df: pd.DataFrame, slack_hours: int = DEFAULT_SLACK_HOURS) -> "FeatureStore":
+        """
+        Run the feature pipeline once over raw history and write a new store.
+
+        Args:
+            path: Store directory (created if missing, existing files are overwritten)
+            raw_df: Raw rows with timestamp_1h, olt_id and the 13 measured features
+            slack_hours: Spare rows reserved per OLT for appends
+
+        Returns:
+            FeatureStore: The new store opened read-only
+        """
+        os.makedirs(path, exist_ok=True)
+
+        frame = _engineer(raw_df).sort_values(['olt_id', 'timestamp_1h'], kind='mergesort')
+        feature_columns = [c for c in frame.columns if c not in ('olt_id', 'timestamp_1h') and c not in data_prep_sup.ROLL_KEYS]
+        columns = feature_columns + [k for k in data_prep_sup.ROLL_KEYS if k in frame.columns]
+
+        lengths = frame.groupby('olt_id', sort=True).size()
+        index, offset = {}, 0
+        for olt, length in lengths.items():
+            index[str(olt)] = (offset, int(length), int(length) + slack_hours)
+            offset += int(length) + slack_hours
+        capacity = offset
+
+        dest = cls._destinations(frame, index, base='offset')
+        cls._write_column(path, TIMESTAMP_FILE, np.int64, capacity, dest, _to_ns(frame['timestamp_1h']))
+        for col in columns:
+            cls._write_column(path, f"{col}.f32", np.float32, capacity, dest, frame[col].to_numpy(np.float32))
+
+        cls._write_meta(path, columns, feature_columns, capacity, index)
+        return cls(path)
+
+    @staticmethod
+    def _destinations(frame: pd.DataFrame, index: dict, base: str) -> np.ndarray:
+        """Row positions in the store for a frame sorted by (olt_id, timestamp_1h)."""
+        olt_ids = frame['olt_id'].astype(str)
+        if base == 'offset':
+            start = olt_ids.map({olt: block[0] for olt, block in index.items()})
+        else:
+            start = olt_ids.map({olt: block[0] + block[1] for olt, block in index.items()})
+        rank = frame.groupby(olt_ids, sort=False).cumcount()
+        return (start + rank).to_numpy(np.int64)
+
+    @staticmethod
+    def _write_column(path, filename, dtype, capacity, dest, values):
+        mm = np.memmap(os.path.join(path, filename), dtype=dtype, mode='w+', shape=(capacity,))
+        mm[dest] = values
+        mm.flush()
+        del mm
+
+    # ------------------------------------------------------------------ #
+    # Reading
+    # ------------------------------------------------------------------ #
+    def _block(self, olt_id: str):
+        if olt_id not in self.index:
+            raise KeyError(f"OLT not in feature store: {olt_id}")
+        offset, length, _ = self.index[olt_id]
+        return offset, offset + length
+
+    def _frame(self, start: int, stop: int, columns=None) -> pd.DataFrame:
+        columns = columns or self.columns
+        data = {'timestamp_1h': self._timestamps[start:stop].view('datetime64[ns]')}
+        data.update({col: self._data[col][start:stop] for col in columns})
+        # copy=False keeps every column a view into the memory map
+        return pd.DataFrame(data, copy=False)
+
+    def last_hours(self, olt_id: str, n: int = 24, columns=None) -> pd.DataFrame:
+        """Zero-copy view of the latest n hours stored for one OLT."""
+        start, stop = self._block(olt_id)
+        return self._frame(max(start, stop - n), stop, columns)
+
+    def olt_range(self, olt_id: str, start=None, end=None, columns=None) -> pd.DataFrame:
+        """Zero-copy view of one OLT's rows with start <= timestamp_1h <= end."""
+        lo, hi = self._block(olt_id)
+        ts = self._timestamps[lo:hi]
+        i = np.searchsorted(ts, _to_ns([start])[0], 'left') if start is not None else 0
+        j = np.searchsorted(ts, _to_ns([end])[0], 'right') if end is not None else len(ts)
+        return self._frame(lo + i, lo + j, columns)
+
+    def time_range(self, start=None, end=None, olt_ids=None, columns=None) -> pd.DataFrame:
+        """
+        Rows of many OLTs in a time range, with an olt_id column.
+
+        Each OLT's part is located with a binary search on its block; only the
+        concatenation of the selected rows is copied.
+        """
+        parts = []
+        for olt in (olt_ids if olt_ids is not None else self.olts()):
+            part = self.olt_range(olt, start, end, columns)
+            if len(part):
+                parts.append(part.assign(olt_id=olt))
+        if not parts:
+            return pd.DataFrame(columns=['timestamp_1h', 'olt_id'] + (columns or self.columns))
+        return pd.concat(parts, ignore_index=True)
+
+    def model_matrix(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Select the model inputs (features.csv order) from a slice."""
+        return frame[self.feature_columns]
+
+    # ------------------------------------------------------------------ #
+    # Appending
+    # ------------------------------------------------------------------ #
+    def append(self, raw_df: pd.DataFrame, slack_hours: int = DEFAULT_SLACK_HOURS) -> int:
+        """
+        Engineer and append new hourly rows.
+
+        Deltas and rolling means are computed from the stored *_log history of each
+        OLT, so the appended rows match what a full rebuild would produce. Rows
+        that are not newer than the last stored hour of their OLT are skipped.
+
+        Args:
+            raw_df: New raw rows (same schema as build)
+            slack_hours: Spare rows reserved when an OLT block has to grow
+
+        Returns:
+            int: Number of rows appended
+        """
+        if self.mode != 'r+':
+            raise ValueError("Open the feature store with mode='r+' to append")
+
+        new = raw_df.copy()
+        new['olt_id'] = new['olt_id'].astype(str)
+        new['timestamp_1h'] = pd.to_datetime(new['timestamp_1h'], errors='coerce')
+
+        # Drop hours we already have
+        last_ts = {
+            olt: pd.Timestamp(self._timestamps[off + length - 1])
+            for olt, (off, length, _) in self.index.items() if length
+        }
+        cutoff = pd.to_datetime(new['olt_id'].map(last_ts))
+        new = new[cutoff.isna() | (new['timestamp_1h'] > cutoff)]
+        if new.empty:
+            return 0
+
+        # Stored *_log history is the context for deltas/rolling means
+        log_cols = [k for k in data_prep_sup.ROLL_KEYS if k in self.columns]
+        context = []
+        for olt in new['olt_id'].unique():
+            if olt in self.index:
+                ctx = self.last_hours(olt, CONTEXT_ROWS, log_cols)
+                context.append(ctx.assign(olt_id=olt, __context__=True))
+
+        f = data_prep_sup.add_time_feats(data_prep_sup.handling_skewness(new))
+        f['__context__'] = False
+        if context:
+            f = pd.concat([pd.concat(context, ignore_index=True), f], ignore_index=True)
+        f = data_prep_sup.add_roll_delta(f, group_key='olt_id', windows=data_prep_sup.ROLL_WINDOWS)
+        f = f[~f['__context__'].astype(bool)]
+
+        X = data_prep_sup.select_model_features(f)
+        frame = X.join(f[['olt_id', 'timestamp_1h'] + log_cols]).sort_values(['olt_id', 'timestamp_1h'], kind='mergesort')
+
+        counts = frame.groupby('olt_id', sort=True).size()
+        needs_room = {
+            olt: n for olt, n in counts.items()
+            if olt not in self.index or self.index[olt][1] + n > self.index[olt][2]
+        }
+        if needs_room:
+            self._relayout(needs_room, slack_hours)
+
+        dest = self._destinations(frame, self.index, base='end')
+        self._timestamps[dest] = _to_ns(frame['timestamp_1h'])
+        for col in self.columns:
+            self._data[col][dest] = frame[col].to_numpy(np.float32)
+        self._flush()
+
+        # Publish the new lengths only after the data is on disk
+        for olt, n in counts.items():
+            offset, length, cap = self.index[olt]
+            self.index[olt] = (offset, length + int(n), cap)
+        self._write_meta(self.path, self.columns, self.feature_columns, self.capacity, self.index)
+        return len(frame)
+
+    def _flush(self):
+        self._timestamps.flush()
+        for mm in self._data.values():
+            mm.flush()
+
+    def _relayout(self, extra: dict, slack_hours: int):
+        """Rewrite the files with bigger blocks for OLTs that ran out of room."""
+        new_index, offset = {}, 0
+        for olt in sorted(set(self.index) | set(extra)):
+            _, length, cap = self.index.get(olt, (0, 0, 0))
+            if olt in extra:
+                cap = length + extra[olt] + slack_hours
+            new_index[olt] = (offset, length, cap)
+            offset += cap
+        capacity = offset
+
+        def rewrite(filename, dtype, old):
+            tmp = os.path.join(self.path, filename + '.tmp')
+            mm = np.memmap(tmp, dtype=dtype, mode='w+', shape=(capacity,))
+            for olt, (new_off, length, _) in new_index.items():
+                if olt in self.index and length:
+                    old_off = self.index[olt][0]
+                    mm[new_off:new_off + length] = old[old_off:old_off + length]
+            mm.flush()
+            del mm
+            os.replace(tmp, os.path.join(self.path, filename))
+
+        rewrite(TIMESTAMP_FILE, np.int64, self._timestamps)
+        for col in self.columns:
+            rewrite(f"{col}.f32", np.float32, self._data[col])
+
+        self.index = new_index
+        self.capacity = capacity
+        self._write_meta(self.path, self.columns, self.feature_columns, self.capacity, self.index)
+        self.refresh()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or append to the on-disk feature store")
+    parser.add_argument('command', choices=['build', 'append'])
+    parser.add_argument('input', help="Parquet/CSV/Excel file with raw feature rows")
+    parser.add_argument('store', help="Feature store directory")
+    parser.add_argument('--slack-hours', type=int, default=DEFAULT_SLACK_HOURS)
+    args = parser.parse_args()
+
+    raw_df = read_table(args.input)
+    print(f"📖 Read {len(raw_df)} rows from {args.input}")
+
+    if args.command == 'build':
+        store = FeatureStore.build(args.store, raw_df, slack_hours=args.slack_hours)
+        print(f"✅ Built feature store with {len(store)} rows for {len(store.olts())} OLTs at {args.store}")
+    else:
+        store = FeatureStore(args.store, mode='r+')
+        appended = store.append(raw_df, slack_hours=args.slack_hours)
+        print(f"✅ Appended {appended} rows ({len(store)} rows total)")
+
+
+if __name__ == "__main__":
+    main()
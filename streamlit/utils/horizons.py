@@ -0,0 +1,292 @@
+"""
+Outage prediction at several horizons from one feature matrix.
+
+label_outage_1h is the production target. The longer horizons are derived from
+it per OLT: label_outage_3h of an hour is 1 when label_outage_1h is 1 in that
+hour or one of the next two, so every horizon model is trained on the same
+rows and the same build_feature_matrix columns (horizon_label, train).
+
+A HorizonSet scores one feature matrix with every horizon: the 1h scorer the
+caller already has (a model set, a model handle) runs on the calling thread
+while the 3h/6h models run in a thread pool, so the matrix is built once and
+the horizons cost about as much wall time as the slowest model. Horizon models
+that aren't deployed are skipped, which leaves the 1h-only path unchanged.
+
+Thresholds are tuned per horizon on the validation split and stored in
+THRESHOLDS_PATH next to the local models; a horizon without a tuned threshold
+uses data_prep_sup.THRESHOLD.
+
+Usage (run from the streamlit/ directory):
+    python -m utils.horizons fact_ml_features.parquet --horizons 3h 6h
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils import data_prep_sup
+from utils import model_cache
+from utils import perf
+
+BASE_HORIZON = '1h'
+
+# Registry name / version and local joblib fallback of each extra horizon model
+HORIZON_MODELS = {
+    '3h': {'hours': 3, 'name': 'catboost_outage_predictor_3h', 'version': 'v1', 'filename': 'best_model_CatBoost_3h.joblib'},
+    '6h': {'hours': 6, 'name': 'catboost_outage_predictor_6h', 'version': 'v1', 'filename': 'best_model_CatBoost_6h.joblib'},
+}
+
+THRESHOLDS_PATH = os.path.join(model_cache.LOCAL_MODEL_DIR, 'horizon_thresholds.json')
+
+LATENCY_WINDOW = 200
+
+# Time-ordered split of the training notebook: test, then validation, then calibration
+TEST_FRAC = 0.20
+VAL_FRAC = 0.10
+CAL_FRAC = 0.05
+
+
+def probability_column(horizon: str) -> str:
+    return 'outage_probability' if horizon == BASE_HORIZON else f'outage_probability_{horizon}'
+
+
+def label_column(horizon: str) -> str:
+    return f'label_outage_{horizon}'
+
+
+def load_thresholds(path: str = THRESHOLDS_PATH) -> dict:
+    """Tuned threshold per horizon; 1h always uses data_prep_sup.THRESHOLD."""
+    thresholds = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            thresholds = {h: float(t['threshold']) for h, t in json.load(f).items()}
+    thresholds[BASE_HORIZON] = data_prep_sup.THRESHOLD
+    return thresholds
+
+
+class HorizonSet:
+    """The extra horizon models, scored on the 1h model's feature matrix alongside it."""
+
+    def __init__(self, specs: dict = None, thresholds: dict = None):
+        self.models = {}
+        for horizon, spec in (HORIZON_MODELS if specs is None else specs).items():
+            try:
+                self.models[horizon] = data_prep_sup.get_model_handle(spec.get('filename'), model_name=spec['name'],
+                                                                      version=spec['version'])
+            except Exception as e:
+                # Horizons are optional: without their models only 1h is predicted
+                print(f"Warning: {horizon} horizon model not loaded: {e}")
+
+        thresholds = load_thresholds() if thresholds is None else thresholds
+        self.thresholds = {h: thresholds.get(h, data_prep_sup.THRESHOLD) for h in self.horizons}
+        self._lock = threading.Lock()
+        self._latency = {h: deque(maxlen=LATENCY_WINDOW) for h in self.models}
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.models), 1), thread_name_prefix="horizons")
+
+    @property
+    def horizons(self) -> list:
+        return [BASE_HORIZON] + list(self.models)
+
+    def probability_columns(self) -> list:
+        return [probability_column(h) for h in self.horizons]
+
+    def _timed_proba(self, horizon: str, values: np.ndarray) -> np.ndarray:
+        started = time.perf_counter()
+        proba = data_prep_sup.predict_proba(values, model=self.models[horizon].model)
+        with self._lock:
+            self._latency[horizon].append((time.perf_counter() - started) * 1000)
+        return proba
+
+    @perf.timed("horizons.score")
+    def score(self, X: pd.DataFrame, base_scorer) -> pd.DataFrame:
+        """
+        Probability of every horizon for every row of a feature matrix.
+
+        Args:
+            X: Feature matrix from data_prep_sup.build_feature_matrix
+            base_scorer: Function taking X and returning the 1h probabilities
+
+        Returns:
+            pd.DataFrame: One probability_column per horizon, indexed like X
+        """
+        # Horizon models are trained on build_feature_matrix's column order (train), so they share
+        # one float array instead of each converting the frame again (a few ms per call)
+        values = X.to_numpy(dtype=float) if self.models else None
+        futures = {h: self._pool.submit(self._timed_proba, h, values) for h in self.models}
+        probabilities = {probability_column(BASE_HORIZON): np.asarray(base_scorer(X), dtype=float)}
+        for horizon, future in futures.items():
+            probabilities[probability_column(horizon)] = future.result()
+        return pd.DataFrame(probabilities, index=X.index)
+
+    def with_labels(self, probabilities: pd.DataFrame) -> pd.DataFrame:
+        """Probabilities followed by each horizon's label at its own threshold."""
+        out = {}
+        for horizon in self.horizons:
+            proba = probabilities[probability_column(horizon)]
+            out[probability_column(horizon)] = proba
+            out[label_column(horizon)] = (proba >= self.thresholds[horizon]).astype(int)
+        return pd.DataFrame(out, index=probabilities.index)
+
+    def predict(self, X: pd.DataFrame, base_scorer) -> pd.DataFrame:
+        return self.with_labels(self.score(X, base_scorer))
+
+    def version_key(self) -> str:
+        """Identifies the active horizon model versions (empty with 1h only)."""
+        return ','.join(f"{h}={self.models[h].model_name}@{self.models[h].version}/{self.models[h].checksum}"
+                        for h in self.models)
+
+    def latency_stats(self) -> pd.DataFrame:
+        """Per-horizon model latency (ms) over the last LATENCY_WINDOW calls."""
+        rows = []
+        with self._lock:
+            for horizon, samples in self._latency.items():
+                values = np.asarray(samples) if samples else np.array([np.nan])
+                rows.append({
+                    'horizon': horizon,
+                    'threshold': self.thresholds[horizon],
+                    'calls': len(samples),
+                    'p50_ms': float(np.nanpercentile(values, 50)),
+                    'p95_ms': float(np.nanpercentile(values, 95)),
+                    'last_ms': float(values[-1]),
+                })
+        return pd.DataFrame(rows)
+
+
+@st.cache_resource
+def get_horizon_set() -> HorizonSet:
+    """Process-wide horizon set shared by all sessions."""
+    return HorizonSet()
+
+
+# ---------------------------------------------------------------------- #
+# Training
+# ---------------------------------------------------------------------- #
+def horizon_label(df: pd.DataFrame, hours: int) -> pd.Series:
+    """
+    label_outage_{hours}h per row: 1 when label_outage_1h of the OLT is 1 in this
+    hour or one of the next hours - 1. NaN when the OLT's data ends before the
+    window does (the outcome is unknown) or an hour of the window is missing
+    with no outage in the others.
+    """
+    ts = pd.to_datetime(df['timestamp_1h'])
+    labels = pd.Series(df['label_outage_1h'].to_numpy(dtype=float), index=pd.MultiIndex.from_arrays([df['olt_id'], ts]))
+    labels = labels[~labels.index.duplicated(keep='last')]
+
+    ahead = np.column_stack([
+        labels.reindex(pd.MultiIndex.from_arrays([df['olt_id'], ts + pd.Timedelta(hours=k)])).to_numpy()
+        for k in range(hours)
+    ])
+    positive = np.nan_to_num(ahead, nan=0.0).max(axis=1)
+    known = ~np.isnan(ahead).any(axis=1)
+    return pd.Series(np.where((positive == 1) | known, positive, np.nan), index=df.index, name=f'label_outage_{hours}h')
+
+
+def _f2_threshold(y_true: np.ndarray, y_proba: np.ndarray) -> tuple:
+    """Threshold with the best F2 (recall weighted, like the notebook) and its precision/recall."""
+    from sklearn.metrics import precision_recall_curve
+    p, r, thr = precision_recall_curve(y_true, y_proba)
+    p, r = p[:-1], r[:-1]
+    f2 = np.where(p + r > 0, 5 * p * r / np.maximum(4 * p + r, 1e-12), 0)
+    best = int(np.argmax(f2))
+    return float(thr[best]), float(p[best]), float(r[best])
+
+
+def _precision_recall(y_true: np.ndarray, y_proba: np.ndarray, threshold: float) -> tuple:
+    predicted = y_proba >= threshold
+    tp = int((predicted & (y_true == 1)).sum())
+    return tp / max(int(predicted.sum()), 1), tp / max(int(y_true.sum()), 1)
+
+
+def train(X: pd.DataFrame, y: pd.Series, timestamps: pd.Series) -> dict:
+    """
+    Fit and calibrate one horizon model on the notebook's time-ordered split.
+
+    Returns:
+        dict: model, threshold and validation/test precision and recall
+    """
+    from catboost import CatBoostClassifier
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.frozen import FrozenEstimator
+
+    known = y.notna()
+    order = timestamps[known].sort_values(kind='stable').index
+    X, y = X.loc[order], y.loc[order].astype(int)
+
+    test_cut = int(len(X) * (1 - TEST_FRAC))
+    val_cut = int(test_cut * (1 - VAL_FRAC))
+    cal_cut = int(val_cut * (1 - CAL_FRAC))
+    parts = {'train': slice(0, cal_cut), 'cal': slice(cal_cut, val_cut), 'val': slice(val_cut, test_cut),
+             'test': slice(test_cut, None)}
+    X_parts = {name: X.iloc[s] for name, s in parts.items()}
+    y_parts = {name: y.iloc[s].to_numpy() for name, s in parts.items()}
+
+    positives = max(int(y_parts['train'].sum()), 1)
+    pos_weight = (len(y_parts['train']) - positives) / positives
+    model = CatBoostClassifier(loss_function="Logloss", eval_metric="AUC", iterations=1200, learning_rate=0.05,
+                               depth=6, l2_leaf_reg=3.0, class_weights=[1.0, pos_weight], verbose=False,
+                               allow_writing_files=False)
+    model.fit(X_parts['train'], y_parts['train'])
+    calibrated = CalibratedClassifierCV(FrozenEstimator(model), method="sigmoid")
+    calibrated.fit(X_parts['cal'], y_parts['cal'])
+
+    threshold, precision_val, recall_val = _f2_threshold(y_parts['val'], calibrated.predict_proba(X_parts['val'])[:, 1])
+    precision_test, recall_test = _precision_recall(y_parts['test'], calibrated.predict_proba(X_parts['test'])[:, 1],
+                                                    threshold)
+    return {
+        'model': calibrated,
+        'threshold': threshold,
+        'positive_rate': float(y.mean()),
+        'precision_val': precision_val,
+        'recall_val': recall_val,
+        'precision_test': precision_test,
+        'recall_test': recall_test,
+    }
+
+
+def save_threshold(horizon: str, result: dict, path: str = THRESHOLDS_PATH):
+    thresholds = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            thresholds = json.load(f)
+    thresholds[horizon] = {k: v for k, v in result.items() if k != 'model'}
+    thresholds[horizon]['trained_at'] = pd.Timestamp.now(tz='UTC').isoformat()
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(thresholds, f, indent=2)
+    os.replace(tmp, path)
+
+
+def main():
+    import joblib
+    from utils.feature_store import read_table
+
+    parser = argparse.ArgumentParser(description="Train the extra outage horizon models on one shared feature matrix")
+    parser.add_argument('input', help="Parquet/CSV of labelled FACT_ML_FEATURES rows (with label_outage_1h)")
+    parser.add_argument('--horizons', nargs='+', default=list(HORIZON_MODELS), choices=list(HORIZON_MODELS))
+    parser.add_argument('--output-dir', default=model_cache.LOCAL_MODEL_DIR)
+    args = parser.parse_args()
+
+    df = read_table(args.input).reset_index(drop=True)
+    started = time.perf_counter()
+    X = data_prep_sup.build_feature_matrix(df.copy())
+    print(f"Feature matrix of {len(X):,} rows built once in {time.perf_counter() - started:.1f}s")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for horizon in args.horizons:
+        spec = HORIZON_MODELS[horizon]
+        started = time.perf_counter()
+        result = train(X, horizon_label(df, spec['hours']).loc[X.index], df.loc[X.index, 'timestamp_1h'])
+        joblib.dump(result['model'], os.path.join(args.output_dir, spec['filename']))
+        save_threshold(horizon, result, os.path.join(args.output_dir, os.path.basename(THRESHOLDS_PATH)))
+        print(f"✅ {horizon}: threshold {result['threshold']:.4f}, positive rate {result['positive_rate']:.2%}, "
+              f"test precision {result['precision_test']:.3f} / recall {result['recall_test']:.3f} "
+              f"({time.perf_counter() - started:.0f}s) -> {spec['filename']}")
+
+
+if __name__ == '__main__':
+    main()
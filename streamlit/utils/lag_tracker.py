@@ -0,0 +1,129 @@
+"""
+End-to-end lag of live records: produce -> ingest -> fetch -> prediction.
+
+    produced_at   sent_at stamped by snowpipe/kafka_producer.py
+    ingested_at   RECORD_METADATA:SnowflakeConnectorPushTime when the connector
+                  writes it, else RECORD_METADATA:CreateTime
+    fetched_at    when the live query returned
+    predicted_at  when the row was scored
+
+Lag is recorded once per record (the first time the live page sees it), so the
+10-second re-polls don't inflate ingest -> fetch. Samples are kept in a
+bounded process-wide window for rolling percentiles per region, and also fed
+into utils/perf so they appear on the Performance page and the metrics export.
+"""
+import os
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+import pandas as pd
+from utils import perf
+
+# Timezone assumed for sent_at values written without an offset (older producer versions)
+PRODUCER_TZ = 'Asia/Jakarta'
+
+# Produce -> prediction budget before the live page warns (seconds)
+LAG_SLO_S = float(os.environ.get('LIVE_LAG_SLO_S', '300'))
+
+WINDOW_SIZE = 20_000
+SEEN_SIZE = 50_000
+
+STAGES = ['produce_to_ingest_s', 'ingest_to_fetch_s', 'fetch_to_prediction_s', 'produce_to_prediction_s']
+
+_lock = threading.Lock()
+_window = deque(maxlen=WINDOW_SIZE)
+_seen = OrderedDict()
+
+
+def parse_sent_at(values: pd.Series) -> pd.Series:
+    """Parse sent_at to UTC; values without an offset are taken as PRODUCER_TZ."""
+    values = values.astype(str)
+    has_offset = values.str.contains(r'(?:Z|[+-]\d{2}:?\d{2})$', regex=True)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns, UTC]')
+    if has_offset.any():
+        parsed[has_offset] = pd.to_datetime(values[has_offset], errors='coerce', utc=True, format='ISO8601')
+    if (~has_offset).any():
+        naive = pd.to_datetime(values[~has_offset], errors='coerce', format='ISO8601')
+        parsed[~has_offset] = naive.dt.tz_localize(PRODUCER_TZ).dt.tz_convert('UTC')
+    return parsed
+
+
+def _utc(values: pd.Series) -> pd.Series:
+    ts = pd.to_datetime(values, errors='coerce')
+    if ts.dt.tz is None:
+        return ts.dt.tz_localize('UTC')
+    return ts.dt.tz_convert('UTC')
+
+
+def record(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add per-record lag columns (seconds) and record lag for records not seen before.
+
+    Args:
+        df: Live rows with sent_at, ingested_time, fetched_at and predicted_at
+            (connector_push_time is used for ingest when present)
+
+    Returns:
+        pd.DataFrame: df with the STAGES columns added
+    """
+    if df.empty or 'sent_at' not in df.columns or 'fetched_at' not in df.columns:
+        return df
+
+    df = df.copy()
+    produced = parse_sent_at(df['sent_at'])
+    ingested = _utc(df['ingested_time']) if 'ingested_time' in df.columns else pd.Series(pd.NaT, index=df.index)
+    if 'connector_push_time' in df.columns:
+        pushed = pd.to_datetime(df['connector_push_time'], unit='ms', errors='coerce', utc=True)
+        ingested = pushed.fillna(ingested)
+    fetched = _utc(df['fetched_at'])
+    predicted = _utc(df['predicted_at']) if 'predicted_at' in df.columns else fetched
+
+    df['produce_to_ingest_s'] = (ingested - produced).dt.total_seconds()
+    df['ingest_to_fetch_s'] = (fetched - ingested).dt.total_seconds()
+    df['fetch_to_prediction_s'] = (predicted - fetched).dt.total_seconds()
+    df['produce_to_prediction_s'] = (predicted - produced).dt.total_seconds()
+
+    keys = list(zip(df['olt_id'].astype(str), df['timestamp_1h'].astype(str), df['sent_at'].astype(str)))
+    regions = df['region'].astype(str) if 'region' in df.columns else pd.Series('Unknown', index=df.index)
+    lags = df[STAGES].to_numpy()
+
+    with _lock:
+        for key, region, row in zip(keys, regions, lags):
+            if key in _seen:
+                continue
+            _seen[key] = True
+            if len(_seen) > SEEN_SIZE:
+                _seen.popitem(last=False)
+            _window.append((region, *row))
+            for stage, value in zip(STAGES, row):
+                if not np.isnan(value):
+                    perf.observe(f"lag.{stage[:-2]}", max(value, 0.0))
+
+    return df
+
+
+def summary() -> pd.DataFrame:
+    """Rolling p50/p95/p99 per region and stage over the recorded window (plus an 'All' row)."""
+    with _lock:
+        window = pd.DataFrame(list(_window), columns=['region'] + STAGES)
+    if window.empty:
+        return pd.DataFrame()
+
+    rows = []
+    for region, part in [('All', window)] + list(window.groupby('region')):
+        row = {'region': region, 'records': len(part)}
+        for stage in STAGES:
+            values = part[stage].dropna()
+            name = stage[:-2]
+            row[f"{name}_p50"], row[f"{name}_p95"], row[f"{name}_p99"] = (
+                np.percentile(values, [50, 95, 99]) if len(values) else (np.nan,) * 3
+            )
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def slo_breaches(lag_summary: pd.DataFrame, slo_s: float = LAG_SLO_S) -> pd.DataFrame:
+    """Regions whose p95 produce -> prediction lag exceeds the SLO."""
+    if lag_summary.empty:
+        return lag_summary
+    return lag_summary[(lag_summary['region'] != 'All') & (lag_summary['produce_to_prediction_p95'] > slo_s)]
@@ -0,0 +1,367 @@
+"""
+Schema-based binary encoding of raw_ml_features_topic messages.
+
+The producer sends JSON by default: every field name in every message, parsed
+again by Snowflake into a VARIANT. With VALUE_FORMAT=binary
+(snowpipe/kafka_producer.py) it writes the fields of a registered schema
+instead, in the schema's order, with no names:
+
+    0x00 | schema id (uint32, big-endian) | null bitmap | fixed-width fields | strings
+
+The framing is the Confluent wire format (magic byte + schema id), so a reader
+always knows which schema wrote a message. Fixed-width fields are packed
+little-endian with struct; strings follow as uint16 length + UTF-8. A set bit
+in the null bitmap means the field is null (NaN/None in JSON).
+
+Schemas live in a local schema registry stand-in (LocalSchemaRegistry): one
+JSON file per subject version under SCHEMA_DIR, the first version being the
+15-field contract of the batch template (create_excel_template.py) plus the
+message metadata. A new version may add fields but not drop or retype them;
+readers decode every message with the schema that wrote it, so messages of old
+and new versions can share a topic.
+
+Usage (run from the streamlit/ directory):
+    python -m utils.message_codec input.csv    # encode/decode throughput and bytes/message vs JSON
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+
+SCHEMA_DIR = 'data/schemas'
+SUBJECT = 'raw_ml_features_topic-value'
+
+MAGIC = 0
+_HEADER = struct.Struct('>BI')
+
+# Field type -> struct code (strings are variable-length and packed after the fixed part)
+FIXED_TYPES = {
+    'uint8': 'B',
+    'int32': 'i',
+    'uint32': 'I',
+    'float32': 'f',
+    'float64': 'd',
+    'timestamp': 'q',    # naive wall-clock time, microseconds since 1970-01-01
+    'timestamptz': 'q',  # UTC, microseconds since the epoch
+}
+STRING_TYPE = 'string'
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+_NULL_FILL = {'B': 0, 'i': 0, 'I': 0, 'f': math.nan, 'd': math.nan, 'q': 0}
+_FLOAT_TYPES = {'float32', 'float64'}
+_TIMESTAMP_TYPES = {'timestamp', 'timestamptz'}
+
+
+def _to_micros(value, utc: bool) -> int:
+    """datetime, pd.Timestamp, ISO string or int microseconds -> int microseconds."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return (value - _EPOCH) // _US if not utc else (value.replace(tzinfo=timezone.utc) - _EPOCH_UTC) // _US
+    if not utc:
+        value = value.replace(tzinfo=None)
+        return (value - _EPOCH) // _US
+    return (value - _EPOCH_UTC) // _US
+
+
+class Schema:
+    """One registered version of a subject, with its encoder and decoder."""
+
+    def __init__(self, subject: str, version: int, schema_id: int, fields: list):
+        unknown = {f['type'] for f in fields} - set(FIXED_TYPES) - {STRING_TYPE}
+        if unknown:
+            raise ValueError(f"Unknown field types {sorted(unknown)}")
+        self.subject = subject
+        self.version = version
+        self.id = schema_id
+        self.fields = [{'name': f['name'], 'type': f['type']} for f in fields]
+        self.names = [f['name'] for f in self.fields]
+
+        self._fixed = [(i, f['name'], f['type']) for i, f in enumerate(self.fields) if f['type'] in FIXED_TYPES]
+        self._strings = [(i, f['name']) for i, f in enumerate(self.fields) if f['type'] == STRING_TYPE]
+        self._fixed_names = [name for _, name, _ in self._fixed]
+        self._timestamps = [name for _, name, kind in self._fixed if kind == 'timestamp']
+        self._timestamptzs = [name for _, name, kind in self._fixed if kind == 'timestamptz']
+        self._struct = struct.Struct('<' + ''.join(FIXED_TYPES[t] for _, _, t in self._fixed))
+        self._bitmap_len = (len(self.fields) + 7) // 8
+        self._header = _HEADER.pack(MAGIC, schema_id)
+
+    def to_dict(self) -> dict:
+        return {'subject': self.subject, 'version': self.version, 'id': self.id, 'fields': self.fields}
+
+    def encode(self, row: dict) -> bytes:
+        """Row dict -> message value; fields missing from the row are written as null."""
+        nulls = 0
+        fixed = []
+        for i, name, kind in self._fixed:
+            value = row.get(name)
+            # NaN is the only value not equal to itself
+            if value is None or value != value:
+                nulls |= 1 << i
+                fixed.append(_NULL_FILL[FIXED_TYPES[kind]])
+            elif kind in _FLOAT_TYPES:
+                fixed.append(value)
+            elif kind in _TIMESTAMP_TYPES:
+                fixed.append(_to_micros(value, kind == 'timestamptz'))
+            else:
+                fixed.append(int(value))
+        strings = []
+        for i, name in self._strings:
+            value = row.get(name)
+            if value is None or value != value:
+                nulls |= 1 << i
+                strings.append(b'\x00\x00')
+            else:
+                data = str(value).encode('utf-8')
+                strings.append(len(data).to_bytes(2, 'little') + data)
+        return b''.join([self._header, nulls.to_bytes(self._bitmap_len, 'little'), self._struct.pack(*fixed)] + strings)
+
+    def decode_payload(self, value: bytes, offset: int = _HEADER.size) -> dict:
+        """
+        Message value (after the header) -> row dict; timestamps come back as datetimes.
+
+        Raises:
+            ValueError: The value is truncated or its strings aren't UTF-8
+        """
+        if len(value) < offset + self._bitmap_len + self._struct.size:
+            raise ValueError(f"Truncated message: {len(value)} bytes, schema {self.id} needs "
+                             f"at least {offset + self._bitmap_len + self._struct.size}")
+        nulls = int.from_bytes(value[offset:offset + self._bitmap_len], 'little')
+        offset += self._bitmap_len
+        row = dict(zip(self._fixed_names, self._struct.unpack_from(value, offset)))
+        for name in self._timestamps:
+            row[name] = _EPOCH + row[name] * _US
+        for name in self._timestamptzs:
+            row[name] = _EPOCH_UTC + row[name] * _US
+        offset += self._struct.size
+        for i, name in self._strings:
+            length = int.from_bytes(value[offset:offset + 2], 'little')
+            offset += 2
+            if offset + length > len(value):
+                raise ValueError(f"Truncated message: string '{name}' runs past the end of the value")
+            row[name] = value[offset:offset + length].decode('utf-8')
+            offset += length
+        if nulls:
+            for i, name in enumerate(self.names):
+                if nulls >> i & 1:
+                    row[name] = None
+        return row
+
+
+def check_compatible(old: list, new: list):
+    """New fields may be added; existing fields may not be dropped or change type."""
+    new_types = {f['name']: f['type'] for f in new}
+    for field in old:
+        if field['name'] not in new_types:
+            raise ValueError(f"Field '{field['name']}' was dropped")
+        if new_types[field['name']] != field['type']:
+            raise ValueError(f"Field '{field['name']}' changed type {field['type']} -> {new_types[field['name']]}")
+
+
+class LocalSchemaRegistry:
+    """
+    Schema registry stand-in backed by files: <path>/<subject>/v<version>.json.
+
+    Mirrors the parts of a Confluent registry used here: ids unique across
+    subjects, versions per subject, registration checked for compatibility with
+    the latest version, and lookup by id for readers.
+    """
+
+    def __init__(self, path: str = SCHEMA_DIR):
+        self.path = path
+        self._by_id = {}
+        self._by_subject = {}
+        self.reload()
+
+    def reload(self):
+        self._by_id.clear()
+        self._by_subject.clear()
+        if not os.path.isdir(self.path):
+            return
+        for subject in sorted(os.listdir(self.path)):
+            folder = os.path.join(self.path, subject)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name.startswith('v') and name.endswith('.json'):
+                    with open(os.path.join(folder, name)) as f:
+                        spec = json.load(f)
+                    schema = Schema(subject, spec['version'], spec['id'], spec['fields'])
+                    self._by_id[schema.id] = schema
+                    self._by_subject.setdefault(subject, {})[schema.version] = schema
+
+    def subjects(self) -> list:
+        return sorted(self._by_subject)
+
+    def versions(self, subject: str) -> list:
+        return sorted(self._by_subject.get(subject, {}))
+
+    def latest(self, subject: str = SUBJECT) -> Schema:
+        versions = self._by_subject.get(subject)
+        if not versions:
+            raise KeyError(f"No schema registered for subject '{subject}' in {self.path}")
+        return versions[max(versions)]
+
+    def by_id(self, schema_id: int) -> Schema:
+        schema = self._by_id.get(schema_id)
+        if schema is None:
+            # Registered by another process since this one loaded
+            self.reload()
+            schema = self._by_id.get(schema_id)
+        if schema is None:
+            raise ValueError(f"Unknown schema id {schema_id}")
+        return schema
+
+    def register(self, subject: str, fields: list) -> Schema:
+        """Register fields as the next version of subject (the existing version when unchanged)."""
+        fields = [{'name': f['name'], 'type': f['type']} for f in fields]
+        versions = self._by_subject.get(subject, {})
+        for schema in versions.values():
+            if schema.fields == fields:
+                return schema
+        if versions:
+            check_compatible(self.latest(subject).fields, fields)
+
+        schema = Schema(subject, max(versions, default=0) + 1, max(self._by_id, default=0) + 1, fields)
+        folder = os.path.join(self.path, subject)
+        os.makedirs(folder, exist_ok=True)
+        tmp = os.path.join(folder, f".v{schema.version}.json.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(schema.to_dict(), f, indent=2)
+        os.replace(tmp, os.path.join(folder, f"v{schema.version}.json"))
+        self._by_id[schema.id] = schema
+        self._by_subject.setdefault(subject, {})[schema.version] = schema
+        return schema
+
+
+_registry = None
+
+
+def get_registry() -> LocalSchemaRegistry:
+    """Process-wide registry (plain module state, also used by the consumer outside Streamlit)."""
+    global _registry
+    if _registry is None:
+        _registry = LocalSchemaRegistry()
+    return _registry
+
+
+def is_binary(value) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview)) and len(value) >= _HEADER.size and value[0] == MAGIC
+
+
+def decode(value: bytes, registry: LocalSchemaRegistry = None) -> dict:
+    """Binary message value -> row dict, with the schema named in its header (ValueError if malformed)."""
+    if len(value) < _HEADER.size:
+        raise ValueError(f"Truncated message: {len(value)} bytes")
+    magic, schema_id = _HEADER.unpack_from(value)
+    if magic != MAGIC:
+        raise ValueError(f"Not a schema-encoded message (magic byte {magic})")
+    return (registry or get_registry()).by_id(schema_id).decode_payload(value)
+
+
+def decode_text(text: str, registry: LocalSchemaRegistry = None) -> dict:
+    """Binary message stored as text by the Kafka connector (hex or base64) -> row dict."""
+    try:
+        value = bytes.fromhex(text)
+    except ValueError:
+        value = base64.b64decode(text)
+    return decode(value, registry)
+
+
+def decode_value(value: bytes) -> dict:
+    """Message value in either format -> row dict (JSON messages start with '{')."""
+    if is_binary(value):
+        return decode(value)
+    return json.loads(value)
+
+
+def decode_column(df, column: str, registry: LocalSchemaRegistry = None):
+    """
+    Decode the binary messages stored as text in df[column] into df's columns.
+
+    Rows where column is null (JSON messages, already parsed) keep their values;
+    decoded fields win on the others. Undecodable rows are left as they are.
+
+    Returns:
+        pd.DataFrame: df without column
+    """
+    import pandas as pd
+
+    rows, index = [], []
+    for i, text in df[column].dropna().items():
+        try:
+            rows.append(decode_text(text, registry))
+        except (ValueError, TypeError):
+            continue
+        index.append(i)
+    df = df.drop(columns=[column])
+    if not rows:
+        return df
+    decoded = pd.DataFrame(rows, index=index)
+    for name in decoded.columns:
+        df[name] = decoded[name].combine_first(df[name]).reindex(df.index) if name in df.columns else decoded[name]
+    return df
+
+
+def _benchmark_rows(df) -> list:
+    rows = []
+    for index, line in enumerate(df.to_json(orient='records', lines=True, date_format='iso').splitlines()):
+        data = json.loads(line)
+        data['sent_at'] = datetime.now(timezone.utc).isoformat()
+        data['row_index'] = index
+        rows.append(data)
+    return rows
+
+
+def benchmark(rows: list, schema: Schema, repeat: int = 3) -> list:
+    """Encode/decode rows/s and bytes/message, JSON vs binary (best of repeat)."""
+    codecs = {
+        'json': (lambda row: json.dumps(row).encode('utf-8'), json.loads),
+        'binary': (schema.encode, decode),
+    }
+    results = []
+    for name, (encode, decode_one) in codecs.items():
+        encode_s = decode_s = math.inf
+        for _ in range(repeat):
+            started = time.perf_counter()
+            values = [encode(row) for row in rows]
+            encode_s = min(encode_s, time.perf_counter() - started)
+            started = time.perf_counter()
+            for value in values:
+                decode_one(value)
+            decode_s = min(decode_s, time.perf_counter() - started)
+        results.append({
+            'format': name,
+            'bytes_per_message': sum(len(v) for v in values) / len(values),
+            'encode_rows_per_s': len(rows) / encode_s,
+            'decode_rows_per_s': len(rows) / decode_s,
+        })
+    return results
+
+
+def main():
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Compare binary and JSON raw_ml_features_topic messages")
+    parser.add_argument('input', help="CSV/Parquet of feature rows, as sent by the producer")
+    parser.add_argument('--rows', type=int, default=10_000)
+    args = parser.parse_args()
+
+    df = pd.read_parquet(args.input) if args.input.endswith('.parquet') else pd.read_csv(args.input)
+    df.columns = df.columns.str.lower()
+    schema = get_registry().latest()
+    rows = _benchmark_rows(df.head(args.rows))
+    print(f"Schema {schema.subject} v{schema.version} (id {schema.id}), {len(schema.fields)} fields, {len(rows)} rows")
+    print(pd.DataFrame(benchmark(rows, schema)).to_string(index=False, float_format=lambda v: f"{v:,.1f}"))
+
+
+if __name__ == '__main__':
+    main()
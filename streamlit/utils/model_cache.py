@@ -0,0 +1,342 @@
+"""
+Local model artifact cache with background registry refresh.
+
+Models pulled from the Snowflake Model Registry are written to disk as joblib
+artifacts keyed by model name, version and SHA-256 checksum:
+
+    model_cache/<model_name>/<version>/<sha256>/model.joblib
+    model_cache/<model_name>/<version>/<sha256>/manifest.json
+    model_cache/<model_name>/<alias>.json      last version an alias resolved to
+
+A warm start loads the newest verified artifact for the requested version
+from local disk without contacting the registry. A daemon thread then checks
+the registry every REFRESH_INTERVAL_S seconds. When the pinned version or the
+alias ('default', 'latest') resolves to a version that is not loaded yet, the
+new model is downloaded, cached and swapped in. Requests keep using the old
+model until the swap.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import joblib
+import pandas as pd
+
+CACHE_DIR = os.environ.get('MODEL_CACHE_DIR', 'model_cache')
+REFRESH_INTERVAL_S = int(os.environ.get('MODEL_REFRESH_INTERVAL_S', '300'))
+LOCAL_MODEL_DIR = 'trained_models'
+
+# Version specs resolved through the registry rather than pinned
+ALIASES = ('default', 'latest')
+
+_stats_lock = threading.Lock()
+_stats = {
+    'cache_hits': 0,
+    'cache_misses': 0,
+    'registry_loads': 0,
+    'fallback_loads': 0,
+    'checksum_failures': 0,
+    'swaps': 0,
+    'refresh_errors': 0,
+}
+
+
+def _count(key: str, n: int = 1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _version_key(version_name: str):
+    # Natural ordering so v10 sorts after v9
+    return [int(p) if p.isdigit() else p for p in re.split(r'(\d+)', str(version_name))]
+
+
+# ---------------------------------------------------------------------- #
+# On-disk artifacts
+# ---------------------------------------------------------------------- #
+def store_artifact(model, model_name: str, version: str, source: str = 'registry') -> str:
+    """
+    Write a model to the cache and return its checksum.
+
+    The artifact is dumped to a temp directory first and renamed into place,
+    so a crash never leaves a partial artifact under its checksum.
+    """
+    version_dir = os.path.join(CACHE_DIR, model_name, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    tmp_dir = tempfile.mkdtemp(dir=version_dir, prefix='.tmp-')
+    try:
+        model_path = os.path.join(tmp_dir, 'model.joblib')
+        joblib.dump(model, model_path)
+        checksum = _sha256(model_path)
+
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump({
+                'model_name': model_name,
+                'version': version,
+                'checksum': checksum,
+                'source': source,
+                'saved_at': pd.Timestamp.now().isoformat(),
+            }, f)
+
+        final_dir = os.path.join(version_dir, checksum)
+        if os.path.exists(final_dir):
+            shutil.rmtree(tmp_dir)
+        else:
+            os.replace(tmp_dir, final_dir)
+        return checksum
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load_artifact(model_name: str, version: str):
+    """
+    Load the newest cached artifact for a model version.
+
+    Returns:
+        tuple: (model, checksum), or (None, None) when nothing valid is cached
+    """
+    version_dir = os.path.join(CACHE_DIR, model_name, version)
+    if not os.path.isdir(version_dir):
+        return None, None
+
+    def drop(checksum):
+        # Corrupted or unloadable entry (counted as a failed verification): drop it so the next one is tried
+        _count('checksum_failures')
+        shutil.rmtree(os.path.join(version_dir, checksum), ignore_errors=True)
+
+    candidates = []
+    for checksum in os.listdir(version_dir):
+        manifest_path = os.path.join(version_dir, checksum, 'manifest.json')
+        if checksum.startswith('.') or not os.path.exists(manifest_path):
+            continue
+        try:
+            with open(manifest_path) as f:
+                candidates.append((str(json.load(f).get('saved_at', '')), checksum))
+        except (OSError, ValueError, AttributeError):
+            drop(checksum)
+
+    for _, checksum in sorted(candidates, reverse=True):
+        model_path = os.path.join(version_dir, checksum, 'model.joblib')
+        try:
+            verified = _sha256(model_path) == checksum
+        except OSError:
+            verified = False
+        if not verified:
+            drop(checksum)
+            continue
+        try:
+            return joblib.load(model_path), checksum
+        except Exception:
+            # Intact bytes that no longer unpickle (e.g. written by another library version)
+            drop(checksum)
+            continue
+
+    return None, None
+
+
+def _read_alias(model_name: str, alias: str):
+    path = os.path.join(CACHE_DIR, model_name, f"{alias}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get('version')
+
+
+def _write_alias(model_name: str, alias: str, version: str):
+    os.makedirs(os.path.join(CACHE_DIR, model_name), exist_ok=True)
+    path = os.path.join(CACHE_DIR, model_name, f"{alias}.json")
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': version, 'resolved_at': pd.Timestamp.now().isoformat()}, f)
+    os.replace(tmp_path, path)
+
+
+# ---------------------------------------------------------------------- #
+# Registry access
+# ---------------------------------------------------------------------- #
+def resolve_version(registry, model_name: str, version_spec: str) -> str:
+    """Concrete version name for a pinned version or an alias."""
+    if version_spec not in ALIASES:
+        return version_spec
+    model = registry.get_model(model_name)
+    if version_spec == 'default':
+        return model.default.version_name
+    return max((v.version_name for v in model.versions()), key=_version_key)
+
+
+def _load_from_registry(registry, model_name: str, version: str):
+    model = registry.get_model(model_name).version(version).load(force=True)
+    _count('registry_loads')
+    return model
+
+
+class ModelHandle:
+    """
+    Holds the current model for one (name, version spec) and refreshes it in the background.
+
+    Read handle.model on every use instead of keeping a reference, so a swap
+    is picked up by the next request.
+    """
+
+    def __init__(self, model_name: str, version_spec: str, fallback_filename: str = None, registry=None):
+        self.model_name = model_name
+        self.version_spec = version_spec
+        self.fallback_filename = fallback_filename
+        self.registry = registry
+        self._lock = threading.Lock()
+
+        self.model = None
+        self.version = None
+        self.checksum = None
+        self.source = None
+        self.load_ms = None
+        self.last_refresh = None
+        self.last_error = None
+
+        self._initial_load()
+
+        if self.registry is not None and REFRESH_INTERVAL_S > 0:
+            self._thread = threading.Thread(target=self._refresh_loop, name=f"model-refresh-{model_name}", daemon=True)
+            self._thread.start()
+
+    def _swap(self, model, version, checksum, source, load_ms):
+        with self._lock:
+            self.model = model
+            self.version = version
+            self.checksum = checksum
+            self.source = source
+            self.load_ms = load_ms
+
+    def _initial_load(self):
+        started = time.perf_counter()
+
+        # 1. Local cache (pinned version, or the version the alias last resolved to)
+        version = self.version_spec
+        if version in ALIASES:
+            version = _read_alias(self.model_name, version)
+        if version is not None:
+            model, checksum = load_artifact(self.model_name, version)
+            if model is not None:
+                _count('cache_hits')
+                self._swap(model, version, checksum, 'cache', (time.perf_counter() - started) * 1000)
+                return
+        _count('cache_misses')
+
+        # 2. Registry, then write through to the cache
+        if self.registry is not None:
+            try:
+                version = resolve_version(self.registry, self.model_name, self.version_spec)
+                model = _load_from_registry(self.registry, self.model_name, version)
+                checksum = self._cache(model, version)
+                self._swap(model, version, checksum, 'registry', (time.perf_counter() - started) * 1000)
+                return
+            except Exception as e:
+                self.last_error = str(e)
+
+        # 3. Local trained_models/ file
+        if self.fallback_filename is not None:
+            model_path = os.path.join(LOCAL_MODEL_DIR, self.fallback_filename)
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"No model found at {model_path}")
+            try:
+                model = joblib.load(model_path)
+            except Exception as e:
+                raise ValueError(f"Error loading model from {model_path}: {e}")
+            _count('fallback_loads')
+            self._swap(model, 'local', None, 'local file', (time.perf_counter() - started) * 1000)
+            return
+
+        raise ValueError(f"No model source available for {self.model_name} (neither Registry, cache nor local file)")
+
+    def _cache(self, model, version):
+        try:
+            checksum = store_artifact(model, self.model_name, version)
+            if self.version_spec in ALIASES:
+                _write_alias(self.model_name, self.version_spec, version)
+            return checksum
+        except Exception as e:
+            # A read-only disk must not stop the model from being served
+            self.last_error = f"Could not write model cache: {e}"
+            return None
+
+    def refresh(self) -> bool:
+        """Check the registry once and swap in a newer version. Returns True on swap."""
+        self.last_refresh = pd.Timestamp.now()
+        version = resolve_version(self.registry, self.model_name, self.version_spec)
+        if version == self.version and self.source != 'local file':
+            return False
+
+        started = time.perf_counter()
+        model, checksum = load_artifact(self.model_name, version)
+        source = 'cache'
+        if model is None:
+            model = _load_from_registry(self.registry, self.model_name, version)
+            checksum = self._cache(model, version)
+            source = 'registry'
+        elif self.version_spec in ALIASES:
+            _write_alias(self.model_name, self.version_spec, version)
+
+        self._swap(model, version, checksum, source, (time.perf_counter() - started) * 1000)
+        _count('swaps')
+        return True
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(REFRESH_INTERVAL_S)
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                _count('refresh_errors')
+                self.last_error = str(e)
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                'model': self.model_name,
+                'version_spec': self.version_spec,
+                'version': self.version,
+                'checksum': (self.checksum or '')[:12],
+                'source': self.source,
+                'load_ms': self.load_ms,
+                'last_refresh': self.last_refresh,
+                'last_error': self.last_error,
+            }
+
+
+_handles = {}
+_handles_lock = threading.Lock()
+
+
+def get_handle(model_name: str, version_spec: str, fallback_filename: str = None, registry=None) -> ModelHandle:
+    """Process-wide handle per (model_name, version_spec), created on first use."""
+    key = (model_name, version_spec)
+    with _handles_lock:
+        if key not in _handles:
+            _handles[key] = ModelHandle(model_name, version_spec, fallback_filename, registry)
+        return _handles[key]
+
+
+def cache_stats() -> dict:
+    """Cache counters for monitoring."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def handles_info() -> pd.DataFrame:
+    with _handles_lock:
+        return pd.DataFrame([h.info() for h in _handles.values()])
@@ -0,0 +1,169 @@
+"""
+Scoring with several models on the same feature matrix.
+
+A model set has one primary model, whose probabilities drive the predictions,
+and any number of shadow models that are scored on the same rows in a thread
+pool (CatBoost and XGBoost release the GIL while predicting). Shadow results
+are only logged for disagreement and latency, so scoring returns as soon as the
+primary is done. With ensemble=True the weighted average of all models is used
+instead; the call then waits for every model, and the wait is about as long as
+the slowest one.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils import data_prep_sup
+from utils import perf
+
+# Registry name / version and local joblib fallback for each model
+DEFAULT_MODEL_SET = [
+    {
+        'name': 'catboost_outage_predictor', 'version': 'v1',
+        'filename': 'best_model_CatBoost.joblib', 'role': 'primary', 'weight': 0.5,
+    },
+    {
+        'name': 'xgboost_outage_predictor', 'version': 'v1',
+        'filename': 'best_model_XGBoost.joblib', 'role': 'shadow', 'weight': 0.5,
+    },
+]
+
+# Recent shadow comparisons, newest last
+DISAGREEMENT_LOG = deque(maxlen=500)
+
+LATENCY_WINDOW = 200
+
+
+class ModelSet:
+    """Primary + shadow models scored concurrently, with optional weighted ensemble."""
+
+    def __init__(self, specs=None, ensemble: bool = False, threshold: float = data_prep_sup.THRESHOLD):
+        self.ensemble = ensemble
+        self.threshold = threshold
+        self.models = {}
+        self.weights = {}
+        self.primary = None
+
+        for spec in (specs or DEFAULT_MODEL_SET):
+            key = f"{spec['name']}:{spec['version']}"
+            try:
+                handle = data_prep_sup.get_model_handle(spec.get('filename'), model_name=spec['name'], version=spec['version'])
+            except Exception as e:
+                if spec.get('role') == 'primary':
+                    raise
+                # A missing shadow model must never break scoring
+                print(f"Warning: shadow model {key} not loaded: {e}")
+                continue
+
+            # Keep the handle so background registry refreshes are picked up
+            self.models[key] = handle
+            self.weights[key] = float(spec.get('weight', 1.0))
+            if spec.get('role') == 'primary':
+                self.primary = key
+
+        if self.primary is None:
+            raise ValueError("Model set needs exactly one model with role 'primary'")
+
+        self._lock = threading.Lock()
+        self._latency = {key: deque(maxlen=LATENCY_WINDOW) for key in self.models}
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.models) - 1, 1), thread_name_prefix="model-set")
+
+    def _timed_proba(self, key: str, X: pd.DataFrame) -> np.ndarray:
+        started = time.perf_counter()
+        proba = data_prep_sup.predict_proba(X, model=self.models[key].model)
+        with self._lock:
+            self._latency[key].append((time.perf_counter() - started) * 1000)
+        return proba
+
+    @perf.timed("model_set.score")
+    def score(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        Score a feature matrix.
+
+        Args:
+            X: Feature matrix from data_prep_sup.build_feature_matrix
+
+        Returns:
+            np.ndarray: Primary (or ensemble) probability per row
+        """
+        others = [key for key in self.models if key != self.primary]
+        futures = {key: self._pool.submit(self._timed_proba, key, X) for key in others}
+
+        # Primary runs on the calling thread while the others run in the pool
+        primary = self._timed_proba(self.primary, X)
+
+        if not self.ensemble:
+            for key, future in futures.items():
+                future.add_done_callback(lambda f, key=key: self._log_disagreement(key, primary, f))
+            return primary
+
+        probas = {self.primary: primary}
+        for key, future in futures.items():
+            try:
+                probas[key] = future.result()
+            except Exception as e:
+                print(f"Warning: model {key} failed, left out of the ensemble: {e}")
+
+        total = sum(self.weights[key] for key in probas)
+        return sum(self.weights[key] * p for key, p in probas.items()) / total
+
+    def _log_disagreement(self, key: str, primary: np.ndarray, future):
+        if future.exception() is not None:
+            DISAGREEMENT_LOG.append({'time': pd.Timestamp.now(), 'model': key, 'error': str(future.exception())})
+            return
+
+        shadow = future.result()
+        disagree = (primary >= self.threshold) != (shadow >= self.threshold)
+        DISAGREEMENT_LOG.append({
+            'time': pd.Timestamp.now(),
+            'model': key,
+            'rows': len(primary),
+            'disagreements': int(disagree.sum()),
+            'disagreement_rate': float(disagree.mean()) if len(primary) else 0.0,
+            'mean_abs_diff': float(np.abs(primary - shadow).mean()) if len(primary) else 0.0,
+        })
+
+    def primary_model(self):
+        return self.models[self.primary].model
+
+    def primary_version_key(self) -> str:
+        """Identifies the primary model's version; explanations are always of the primary."""
+        handle = self.models[self.primary]
+        return f"{self.primary}@{handle.version}/{handle.checksum}"
+
+    def version_key(self) -> str:
+        """Identifies the active model versions, changes whenever a handle swaps its model."""
+        keys = [self.primary] + (sorted(k for k in self.models if k != self.primary) if self.ensemble else [])
+        parts = [f"{key}@{self.models[key].version}/{self.models[key].checksum}" for key in keys]
+        return ('ensemble:' if self.ensemble else '') + ','.join(parts)
+
+    def latency_stats(self) -> pd.DataFrame:
+        """Per-model latency (ms) over the last LATENCY_WINDOW calls."""
+        rows = []
+        with self._lock:
+            for key, samples in self._latency.items():
+                values = np.asarray(samples, dtype=float)
+                # A model with no calls yet reports NaN rather than a percentile of nothing
+                p50, p95 = np.percentile(values, [50, 95]) if len(values) else (np.nan, np.nan)
+                rows.append({
+                    'model': key,
+                    'role': 'primary' if key == self.primary else ('ensemble' if self.ensemble else 'shadow'),
+                    'calls': len(values),
+                    'p50_ms': float(p50),
+                    'p95_ms': float(p95),
+                    'last_ms': float(values[-1]) if len(values) else np.nan,
+                })
+        return pd.DataFrame(rows)
+
+
+@st.cache_resource
+def get_model_set(ensemble: bool = False) -> ModelSet:
+    """Process-wide model set shared by all sessions."""
+    return ModelSet(ensemble=ensemble)
+
+
+def disagreement_log() -> pd.DataFrame:
+    return pd.DataFrame(list(DISAGREEMENT_LOG))
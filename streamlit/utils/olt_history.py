@@ -0,0 +1,157 @@
+"""
+Last 24 hours of model features for a real OLT, for single prediction.
+
+Sources, tried in order for an OLT:
+    1. the feature store (utils/feature_store.py) at FEATURE_STORE_DIR, whose
+       engineered rows are already model inputs (zero-copy slice, no pipeline);
+    2. a Parquet snapshot of raw FACT_ML_FEATURES rows at OLT_SNAPSHOT_PATH,
+       indexed per OLT once when the index is warmed;
+    3. HACKATHON.DATAMART.FACT_ML_FEATURES in Snowflake, queried for that OLT.
+
+Raw rows are run through data_prep_sup.build_feature_matrix together with the
+CONTEXT_ROWS hours before them, so the rolling features of all 24 hours are
+complete. Entries are kept in a bounded LRU with a TTL (OltHistoryIndex)
+shared by every session.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+import streamlit as st
+from snowflake.snowpark.context import get_active_session
+from utils import data_prep_sup
+from utils import dimensions
+from utils.dimensions import RAW_DIR
+from utils.feature_store import FeatureStore, read_table
+
+FEATURE_STORE_DIR = os.environ.get('FEATURE_STORE_DIR', 'feature_store')
+SNAPSHOT_PATH = os.environ.get('OLT_SNAPSHOT_PATH', 'data/fact_ml_features_snapshot.parquet')
+
+HOURS = 24
+MAX_OLTS = 512
+TTL_S = 15 * 60
+
+
+@st.cache_data(show_spinner=False)
+def olt_catalog(raw_dir: str = RAW_DIR) -> pd.DataFrame:
+    """OLTs with city, region and cluster names, from the dimension cache."""
+    catalog = dimensions.get_dimension_cache(raw_dir).olts()
+    catalog['clusters'] = catalog['cluster_names']
+    catalog['label'] = (catalog['olt_id'] + ' · ' + catalog['city'].fillna('?')
+                        + ' (' + catalog['region'].fillna('?') + ')')
+    return catalog[['olt_id', 'city', 'region', 'clusters', 'label']]
+
+
+def _fetch_from_snowflake(olt_id: str, rows: int) -> pd.DataFrame:
+    try:
+        session = get_active_session()
+    except Exception:
+        # Local development: no Snowflake
+        return pd.DataFrame()
+    olt_literal = olt_id.replace("'", "''")
+    df = session.sql(f"""
+        SELECT * FROM HACKATHON.DATAMART.FACT_ML_FEATURES
+        WHERE OLT_ID = '{olt_literal}'
+        ORDER BY TIMESTAMP_1H DESC
+        LIMIT {int(rows)}
+    """).to_pandas()
+    df.columns = df.columns.str.lower()
+    df['timestamp_1h'] = pd.to_datetime(df['timestamp_1h'], errors='coerce')
+    return df.sort_values('timestamp_1h')
+
+
+class OltHistoryIndex:
+    """Thread-safe LRU + TTL index of per-OLT feature windows."""
+
+    def __init__(self, hours: int = HOURS, max_olts: int = MAX_OLTS, ttl_s: float = TTL_S,
+                 store_dir: str = FEATURE_STORE_DIR, snapshot_path: str = SNAPSHOT_PATH):
+        self.hours = hours
+        self.max_olts = max_olts
+        self.ttl_s = ttl_s
+        self.store_dir = store_dir
+        self.snapshot_path = snapshot_path
+        self.store = None
+        self.snapshot = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'expirations': 0, 'evictions': 0, 'warm_s': 0.0}
+
+    def warm(self):
+        """Open the feature store and index the snapshot's latest rows per OLT."""
+        started = time.perf_counter()
+        if os.path.exists(os.path.join(self.store_dir, 'meta.json')):
+            self.store = FeatureStore(self.store_dir)
+        if os.path.exists(self.snapshot_path):
+            raw = read_table(self.snapshot_path)
+            keep = raw.sort_values('timestamp_1h').groupby('olt_id', sort=False).tail(self.hours + data_prep_sup.CONTEXT_ROWS)
+            self.snapshot = {str(olt): part.reset_index(drop=True) for olt, part in keep.groupby('olt_id')}
+        self.stats['warm_s'] = time.perf_counter() - started
+        return self
+
+    def sources(self) -> list:
+        found = []
+        if self.store is not None:
+            found.append(f"feature store ({len(self.store.olts())} OLTs)")
+        if self.snapshot:
+            found.append(f"snapshot ({len(self.snapshot)} OLTs)")
+        return found + ['Snowflake FACT_ML_FEATURES']
+
+    def _load(self, olt_id: str) -> dict:
+        if self.store is not None and olt_id in self.store.index:
+            frame = self.store.last_hours(olt_id, self.hours)
+            return {'source': 'feature store', 'rows': frame, 'X': self.store.model_matrix(frame)}
+
+        raw = self.snapshot.get(olt_id)
+        source = 'snapshot'
+        if raw is None:
+            raw = _fetch_from_snowflake(olt_id, self.hours + data_prep_sup.CONTEXT_ROWS)
+            source = 'snowflake'
+        if raw is None or raw.empty:
+            return {'source': None, 'rows': pd.DataFrame(), 'X': pd.DataFrame()}
+
+        X = data_prep_sup.build_feature_matrix(raw.copy()).sort_index()
+        last = raw.index[-self.hours:]
+        return {'source': source, 'rows': raw.loc[last].reset_index(drop=True), 'X': X.loc[last].reset_index(drop=True)}
+
+    def get(self, olt_id: str) -> dict:
+        """
+        Feature window of an OLT.
+
+        Returns:
+            dict: 'source' (None when no source has the OLT), 'rows' (last hours for
+                display, with timestamp_1h) and 'X' (their model matrix, same order)
+        """
+        olt_id = str(olt_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(olt_id)
+            if entry is not None and now - entry['loaded_at'] > self.ttl_s:
+                del self._entries[olt_id]
+                self.stats['expirations'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(olt_id)
+                self.stats['hits'] += 1
+                return entry
+            self.stats['misses'] += 1
+
+        # Load outside the lock; a Snowflake query must not block other sessions' hits
+        entry = dict(self._load(olt_id), loaded_at=time.monotonic())
+        with self._lock:
+            self._entries[olt_id] = entry
+            self._entries.move_to_end(olt_id)
+            while len(self._entries) > self.max_olts:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return entry
+
+    def snapshot_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, 'size': len(self._entries)}
+
+
+@st.cache_resource(show_spinner="Warming OLT feature index...")
+def get_olt_history_index() -> OltHistoryIndex:
+    """Process-wide index, warmed once."""
+    return OltHistoryIndex().warm()
@@ -0,0 +1,184 @@
+"""
+Lightweight, process-wide timing and counters for the hot paths.
+
+Wrap a function with @perf.timed("stage") or a block with
+`with perf.timer("stage"):` to record its latency; use perf.count("name", n)
+for counters. Samples are aggregated for the whole server process (all
+sessions) and shown on the 📟 Performance page, and can be exported in the
+Prometheus text format via prometheus_text() or an optional scrape endpoint
+(set PERF_METRICS_PORT).
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+
+# Recent samples kept per stage for percentiles
+RESERVOIR_SIZE = 2048
+
+# Cumulative histogram buckets (seconds) for the text export
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_PREFIX = 'netmon'
+
+
+class _Histogram:
+    __slots__ = ('samples', 'count', 'total', 'buckets')
+
+    def __init__(self):
+        self.samples = deque(maxlen=RESERVOIR_SIZE)
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        i = bisect.bisect_left(BUCKETS, seconds)
+        if i < len(BUCKETS):
+            self.buckets[i] += 1
+
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_started_at = time.time()
+
+
+def observe(stage: str, seconds: float):
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = _Histogram()
+        hist.observe(seconds)
+
+
+def count(name: str, n: float = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+@contextmanager
+def timer(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def timed(stage: str):
+    """Decorator recording each call's latency under `stage`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def stage_summary() -> pd.DataFrame:
+    """Per-stage count and p50/p95/p99/mean latency in milliseconds."""
+    with _lock:
+        snapshot = {stage: (np.asarray(h.samples), h.count, h.total) for stage, h in _histograms.items()}
+
+    rows = []
+    for stage, (samples, n, total) in sorted(snapshot.items()):
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000 if len(samples) else (np.nan,) * 3
+        rows.append({
+            'stage': stage,
+            'calls': n,
+            'p50_ms': p50,
+            'p95_ms': p95,
+            'p99_ms': p99,
+            'mean_ms': total / n * 1000 if n else np.nan,
+            'total_s': total,
+        })
+    return pd.DataFrame(rows, columns=['stage', 'calls', 'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'total_s'])
+
+
+def counters() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def _metric_name(name: str) -> str:
+    return METRIC_PREFIX + '_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def prometheus_text() -> str:
+    """All stages and counters in the Prometheus text exposition format."""
+    lines = [
+        f"# TYPE {METRIC_PREFIX}_stage_seconds histogram",
+    ]
+    with _lock:
+        for stage, hist in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS, hist.buckets):
+                cumulative += n
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {hist.total:.6f}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+
+        for name, value in sorted(_counters.items()):
+            metric = _metric_name(name) + '_total'
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+
+    lines.append(f"# TYPE {METRIC_PREFIX}_process_start_time_seconds gauge")
+    lines.append(f"{METRIC_PREFIX}_process_start_time_seconds {_started_at:.0f}")
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep scrapes out of the Streamlit server log
+        pass
+
+
+_server = None
+
+
+def maybe_start_metrics_server():
+    """Serve /metrics on PERF_METRICS_PORT (once per process) if the variable is set."""
+    global _server
+    port = os.environ.get('PERF_METRICS_PORT')
+    with _lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer(('0.0.0.0', int(port)), _MetricsHandler)
+        except OSError as e:
+            print(f"Warning: could not start metrics endpoint on port {port}: {e}")
+            return None
+    threading.Thread(target=_server.serve_forever, name="perf-metrics", daemon=True).start()
+    return _server
@@ -0,0 +1,156 @@
+"""
+Memoized predictions keyed by (olt_id, timestamp_1h, feature hash, model version).
+
+The live page re-fetches the latest rows every refresh, and almost all of them
+were already scored with identical features. score_with_cache() looks up every
+row, scores only the misses in one batch and stores them. The cache is bounded
+(LRU) with a TTL and shared by all sessions in the process. The model version
+is part of every key, so sessions scoring with different models (e.g. with and
+without the ensemble) keep their own entries side by side; entries of a
+version nobody uses any more age out through the LRU and TTL.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+DEFAULT_MAX_ENTRIES = 200_000
+DEFAULT_TTL_S = 2 * 60 * 60
+
+
+def feature_hashes(X: pd.DataFrame) -> np.ndarray:
+    """Vectorized 64-bit hash of each feature row."""
+    return pd.util.hash_pandas_object(X, index=False).to_numpy()
+
+
+def cache_keys(X: pd.DataFrame, olt_ids, timestamps) -> list:
+    """(olt_id, timestamp_1h, feature hash) per row of X."""
+    return list(zip(
+        pd.Series(olt_ids).astype(str).to_numpy(),
+        pd.to_datetime(pd.Series(timestamps)).to_numpy(),
+        feature_hashes(X),
+    ))
+
+
+class PredictionCache:
+    """Thread-safe LRU + TTL cache of outage probabilities (or any per-row value)."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_s: float = DEFAULT_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()
+        # Cached entries per model version
+        self._versions = Counter()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def _drop(self, key):
+        del self._entries[key]
+        self._versions[key[0]] -= 1
+        if not self._versions[key[0]]:
+            del self._versions[key[0]]
+
+    def get_values(self, keys: list, model_version: str) -> list:
+        """Cached value per key, None where missing or expired."""
+        out = [None] * len(keys)
+        now = time.monotonic()
+        with self._lock:
+            for i, key in enumerate(keys):
+                key = (model_version, *key)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, stored_at = entry
+                if now - stored_at > self.ttl_s:
+                    self._drop(key)
+                    self.stats['expirations'] += 1
+                    continue
+                self._entries.move_to_end(key)
+                out[i] = value
+
+            hits = sum(value is not None for value in out)
+            self.stats['hits'] += hits
+            self.stats['misses'] += len(keys) - hits
+        return out
+
+    def put_values(self, keys: list, values, model_version: str):
+        now = time.monotonic()
+        with self._lock:
+            for key, value in zip(keys, values):
+                key = (model_version, *key)
+                if key not in self._entries:
+                    self._versions[model_version] += 1
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def get_many(self, keys: list, model_version: str) -> np.ndarray:
+        """Cached probability per key, NaN where missing or expired."""
+        return np.array([np.nan if value is None else value for value in self.get_values(keys, model_version)], dtype=float)
+
+    def put_many(self, keys: list, probas, model_version: str):
+        self.put_values(keys, [float(proba) for proba in probas], model_version)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'size': len(self._entries),
+                'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+                'model_versions': len(self._versions),
+            }
+
+
+@st.cache_resource
+def get_prediction_cache() -> PredictionCache:
+    """Process-wide cache shared by every session."""
+    return PredictionCache()
+
+
+def score_with_cache(X: pd.DataFrame, olt_ids, timestamps, scorer, model_version: str, cache: PredictionCache = None,
+                     width: int = 1):
+    """
+    Score a feature matrix, calling the model only for rows not seen before.
+
+    Args:
+        X: Feature matrix from data_prep_sup.build_feature_matrix
+        olt_ids: olt_id per row of X
+        timestamps: timestamp_1h per row of X
+        scorer: Function taking a feature matrix and returning probabilities
+        model_version: Identifier of the model(s) behind scorer
+        cache: Cache to use (defaults to the process-wide one)
+        width: Probabilities per row returned by scorer (one per horizon)
+
+    Returns:
+        tuple: (probability per row, number of rows actually scored). When scorer
+        returns several probabilities per row (an (n, width) array), so does this.
+    """
+    cache = cache or get_prediction_cache()
+    keys = cache_keys(X, olt_ids, timestamps)
+
+    if width == 1:
+        proba = cache.get_many(keys, model_version)
+        miss = np.isnan(proba)
+    else:
+        values = cache.get_values(keys, model_version)
+        proba = np.array([[np.nan] * width if value is None else value for value in values], dtype=float).reshape(-1, width)
+        miss = np.isnan(proba).any(axis=1)
+    if miss.any():
+        scored = np.asarray(scorer(X[miss]), dtype=float)
+        proba[miss] = scored
+        missed = [k for k, m in zip(keys, miss) if m]
+        if width == 1:
+            cache.put_many(missed, scored, model_version)
+        else:
+            cache.put_values(missed, [tuple(row) for row in scored.tolist()], model_version)
+    return proba, int(miss.sum())
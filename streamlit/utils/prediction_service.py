@@ -0,0 +1,465 @@
+"""
+Asyncio HTTP prediction service with request micro-batching.
+
+Endpoints:
+    POST /predict         one raw feature row -> {"outage_probability", "label_outage_1h", ...}
+                          (plus outage_probability_3h / label_outage_3h etc. per deployed horizon)
+    POST /predict_batch   {"rows": [...]} -> {"predictions": [...]}
+    GET  /health          status, model version and queue depth
+    GET  /metrics         utils/perf metrics in the Prometheus text format
+
+A row has the raw feature columns the producer sends (olt_id, timestamp_1h,
+hour_of_day, offline_ont_now, ...). Rolling/delta features need the previous
+hours of the OLT; pass them as "history": [...] on the row, otherwise they are
+computed from the row alone.
+
+Requests are queued and a single batcher scores whatever has arrived, up to
+MAX_BATCH_ROWS rows or MAX_WAIT_MS after the first one, in one model call on a
+worker thread, so the event loop keeps accepting connections while a batch is
+scored. The queue is bounded (MAX_QUEUE requests); when it is full the service
+answers 503 with Retry-After instead of letting latency grow without limit.
+
+A request whose rows aren't objects with olt_id and timestamp_1h is refused
+with 400 before it is queued. Values are checked where the batch is built, on
+the worker thread: a request with an unparseable timestamp_1h or a
+non-numeric feature gets 400 on its own and the rest of the batch is scored.
+Should a batch still fail to score, its requests are rescored one by one and
+only the failing ones get an error (500).
+
+The HTTP layer is a small HTTP/1.1 (keep-alive) handler on asyncio streams,
+so the service needs nothing beyond the app's own requirements.
+
+Usage (run from the streamlit/ directory):
+    python -m utils.prediction_service serve --port 8090
+    python -m utils.prediction_service loadtest --url http://127.0.0.1:8090 --concurrency 64 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+from utils import data_prep_sup
+from utils import drift
+from utils import horizons
+from utils import perf
+
+HOST = '0.0.0.0'
+PORT = int(os.environ.get('PREDICTION_SERVICE_PORT', '8090'))
+
+MAX_BATCH_ROWS = 256
+MAX_WAIT_MS = 5
+MAX_QUEUE = 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+RETRY_AFTER_S = 1
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _check_rows(rows: list):
+    """
+    Structural checks of a request, in plain Python (they run on the event loop).
+
+    Raises:
+        BadRequest: A row isn't an object with olt_id and timestamp_1h, or its history isn't a list of rows
+    """
+    for row in rows:
+        if not isinstance(row, dict) or 'olt_id' not in row or 'timestamp_1h' not in row:
+            raise BadRequest("every row needs olt_id and timestamp_1h")
+        history = row.get('history') or []
+        if not isinstance(history, list) or not all(isinstance(h, dict) for h in history):
+            raise BadRequest("history must be a list of rows")
+
+
+def _batch_frame(batch: list) -> pd.DataFrame:
+    """
+    Raw rows of every request of a batch in one frame: each row's history, then the row itself.
+
+    _request is the request's position in the batch, _row the row's position in the
+    request and _target flags the rows to predict. olt_id is prefixed with the request id
+    and row, so histories of different rows and requests never mix.
+    """
+    records = []
+    for r, (request_id, rows) in enumerate(batch):
+        for i, row in enumerate(rows):
+            olt_id = f"{request_id}:{i}:{row['olt_id']}"
+            for past in row.get('history') or []:
+                records.append({**past, 'olt_id': olt_id, '_request': r, '_row': i, '_target': False})
+            records.append({**{k: v for k, v in row.items() if k != 'history'},
+                            'olt_id': olt_id, '_request': r, '_row': i, '_target': True})
+    return pd.DataFrame(records)
+
+
+def _coerce(combined: pd.DataFrame) -> dict:
+    """
+    Parse timestamp_1h and make the raw features numeric, in place.
+
+    Returns:
+        dict: Error message per request position with an unparseable timestamp or a non-numeric feature
+    """
+    errors = {}
+    raw = combined['timestamp_1h']
+    combined['timestamp_1h'] = pd.to_datetime(raw, errors='coerce', format='mixed')
+    for index in combined.index[combined['timestamp_1h'].isna()]:
+        errors.setdefault(combined.at[index, '_request'], f"timestamp_1h is not a timestamp in row {combined.at[index, '_row']}")
+    for col in [c for c in data_prep_sup.RAW_FEATURES if c in combined.columns]:
+        values = pd.to_numeric(combined[col], errors='coerce')
+        for index in combined.index[values.isna() & combined[col].notna()]:
+            errors.setdefault(combined.at[index, '_request'],
+                              f"{col} must be a number, got {combined.at[index, col]!r} in row {combined.at[index, '_row']}")
+        combined[col] = values
+    return errors
+
+
+class MicroBatcher:
+    """Collects queued requests into batches and scores each batch in one model call."""
+
+    def __init__(self, max_batch_rows: int = MAX_BATCH_ROWS, max_wait_ms: float = MAX_WAIT_MS,
+                 max_queue: int = MAX_QUEUE, threshold: float = data_prep_sup.THRESHOLD):
+        self.max_batch_rows = max_batch_rows
+        self.max_wait_s = max_wait_ms / 1000
+        self.threshold = threshold
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.handle = data_prep_sup.get_model_handle(data_prep_sup.MODEL_FILENAME)
+        self.horizon_set = horizons.HorizonSet()
+        self._request_ids = 0
+        self.stats = {'batches': 0, 'rows': 0, 'rejected': 0}
+
+    def submit(self, rows: list) -> asyncio.Future:
+        """Queue rows for scoring; raises asyncio.QueueFull when the service is saturated."""
+        _check_rows(rows)
+        self._request_ids += 1
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait(((self._request_ids, rows), future))
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            perf.count("service_rejected")
+            raise
+        return future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            rows = len(batch[0][0][1])
+            deadline = loop.time() + self.max_wait_s
+            while rows < self.max_batch_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                rows += len(item[0][1])
+
+            try:
+                results = await loop.run_in_executor(None, self._score, [request for request, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    results = [e]
+                else:
+                    # Rescore one by one so only the request that breaks scoring fails
+                    perf.count("service_batch_retries")
+                    results = [await loop.run_in_executor(None, self._score_one, request) for request, _ in batch]
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _score_one(self, request: tuple):
+        """Predictions of a single request, or the exception scoring it raised."""
+        try:
+            return self._score([request])[0]
+        except Exception as e:
+            return e
+
+    @perf.timed("service.score_batch")
+    def _score(self, batch: list) -> list:
+        """
+        Score every request of a batch together.
+
+        Args:
+            batch: (request id, rows) per request
+
+        Returns:
+            list: Per request, its list of predictions or the BadRequest rejecting it
+        """
+        combined = _batch_frame(batch)
+        out = [[] for _ in batch]
+        errors = _coerce(combined)
+        for r, message in errors.items():
+            out[r] = BadRequest(message)
+        if errors:
+            combined = combined[~combined['_request'].isin(list(errors))]
+        if combined.empty:
+            return out
+
+        if 'hour_of_day' not in combined.columns:
+            combined['hour_of_day'] = np.nan
+        combined['hour_of_day'] = combined['hour_of_day'].fillna(combined['timestamp_1h'].dt.hour)
+
+        targets = combined.index[combined['_target'].astype(bool)]
+        X = data_prep_sup.build_feature_matrix(combined.drop(columns=['_request', '_row', '_target']))
+        scored = self.horizon_set.predict(X.loc[targets], lambda X_new: data_prep_sup.predict_proba(X_new, model=self.handle.model))
+        drift.observe(X.loc[targets], combined)
+
+        self.stats['batches'] += 1
+        self.stats['rows'] += len(targets)
+        perf.count("service_rows_scored", len(targets))
+        perf.count("service_batches")
+
+        # Longer horizons (when deployed) keep their own thresholds; 1h uses the batcher's
+        scored['label_outage_1h'] = (scored['outage_probability'] >= self.threshold).astype(int)
+        target_rows = combined.loc[targets]
+        for r, olt, ts, row in zip(target_rows['_request'], target_rows['olt_id'], target_rows['timestamp_1h'],
+                                   scored.to_dict('records')):
+            out[r].append({
+                'olt_id': olt.split(':', 2)[2],
+                'timestamp_1h': ts.isoformat() if pd.notna(ts) else None,
+                **{k: float(v) if k.startswith('outage_probability') else int(v) for k, v in row.items()},
+            })
+        return out
+
+
+class PredictionService:
+    def __init__(self, batcher: MicroBatcher):
+        self.batcher = batcher
+        self.started_at = time.time()
+
+    async def _predict(self, rows: list):
+        started = time.perf_counter()
+        try:
+            future = self.batcher.submit(rows)
+        except asyncio.QueueFull:
+            return 503, {'error': 'overloaded, retry later'}
+        try:
+            result = await future
+        except BadRequest:
+            raise
+        except Exception as e:
+            # Bad values were rejected with BadRequest above, so this is a scoring failure on our side
+            perf.count("service_errors")
+            return 500, {'error': str(e)}
+        perf.observe("service.request", time.perf_counter() - started)
+        return 200, result
+
+    async def route(self, method: str, path: str, body: bytes):
+        if path == '/health':
+            return 200, {
+                'status': 'ok',
+                'model_version': self.batcher.handle.version,
+                'model_source': self.batcher.handle.source,
+                'horizons': self.batcher.horizon_set.horizons,
+                'queue_depth': self.batcher.queue.qsize(),
+                'uptime_s': round(time.time() - self.started_at, 1),
+                **self.batcher.stats,
+            }
+        if path == '/metrics':
+            return 200, perf.prometheus_text()
+        if path not in ('/predict', '/predict_batch'):
+            return 404, {'error': f'unknown path {path}'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+
+        try:
+            payload = json.loads(body or b'null')
+            if path == '/predict':
+                if not isinstance(payload, dict):
+                    raise BadRequest("body must be a JSON object")
+                status, result = await self._predict([payload])
+                return status, result[0] if status == 200 else result
+            if not isinstance(payload, dict) or not isinstance(payload.get('rows'), list) or not payload['rows']:
+                raise BadRequest('body must be {"rows": [...]} with at least one row')
+            status, result = await self._predict(payload['rows'])
+            return status, {'predictions': result} if status == 200 else result
+        except (BadRequest, json.JSONDecodeError) as e:
+            return 400, {'error': str(e)}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_BYTES:
+                    status, result = 413, {'error': 'body too large'}
+                    await reader.readexactly(length)
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    try:
+                        status, result = await self.route(method, urlparse(target).path, body)
+                    except Exception as e:
+                        status, result = 500, {'error': str(e)}
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                self._write(writer, status, result, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _write(writer, status: int, result, keep_alive: bool):
+        if isinstance(result, str):
+            body, content_type = result.encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(result).encode('utf-8'), 'application/json'
+        headers = [
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            headers.append(f"Retry-After: {RETRY_AFTER_S}")
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+
+
+async def serve(host: str = HOST, port: int = PORT, **batcher_kwargs):
+    batcher = MicroBatcher(**batcher_kwargs)
+    service = PredictionService(batcher)
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(service.handle_connection, host, port, backlog=1024)
+    print(f"🚀 Prediction service on http://{host}:{port} (model {batcher.handle.version} from {batcher.handle.source})")
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            batch_task.cancel()
+
+
+# ---- load test ----
+
+def _sample_rows(path: str, n: int = 1000) -> list:
+    df = pd.read_csv(path)
+    df['timestamp_1h'] = pd.to_datetime(df['timestamp_1h']).dt.strftime('%Y-%m-%dT%H:%M:%S')
+    rows = df.to_dict('records')
+    return [rows[i % len(rows)] for i in range(n)]
+
+
+async def _client(host: str, port: int, path: str, payloads: list, stop_at: float, latencies: list, statuses: dict):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    try:
+        while time.perf_counter() < stop_at:
+            body = payloads[i % len(payloads)]
+            i += 1
+            started = time.perf_counter()
+            writer.write(
+                f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 503:
+                await asyncio.sleep(0.01)
+    finally:
+        writer.close()
+
+
+async def load_test(url: str, concurrency: int = 64, duration_s: float = 20, batch_size: int = 1,
+                    sample_path: str = 'data/historical_prev_23_rows.csv') -> dict:
+    """
+    Hammer /predict (batch_size 1) or /predict_batch from `concurrency` keep-alive clients.
+
+    Returns:
+        dict: requests, rows/s, status counts and latency percentiles in ms
+    """
+    parsed = urlparse(url)
+    rows = _sample_rows(sample_path)
+    if batch_size == 1:
+        path, payloads = '/predict', [json.dumps(r).encode() for r in rows]
+    else:
+        path = '/predict_batch'
+        payloads = [json.dumps({'rows': rows[i:i + batch_size]}).encode() for i in range(0, len(rows), batch_size)]
+
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    stop_at = started + duration_s
+    await asyncio.gather(*[
+        _client(parsed.hostname, parsed.port or 80, path, payloads, stop_at, latencies, statuses)
+        for _ in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = (np.percentile(latencies, [50, 95, 99]) * 1000) if latencies else (np.nan,) * 3
+    ok = statuses.get(200, 0)
+    return {
+        'concurrency': concurrency,
+        'batch_size': batch_size,
+        'requests': len(latencies),
+        'statuses': statuses,
+        'requests_per_s': round(ok / elapsed, 1),
+        'rows_per_s': round(ok * batch_size / elapsed, 1),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching HTTP prediction service")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    s = sub.add_parser('serve')
+    s.add_argument('--host', default=HOST)
+    s.add_argument('--port', type=int, default=PORT)
+    s.add_argument('--max-batch-rows', type=int, default=MAX_BATCH_ROWS)
+    s.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS)
+    s.add_argument('--max-queue', type=int, default=MAX_QUEUE)
+
+    t = sub.add_parser('loadtest')
+    t.add_argument('--url', default=f"http://127.0.0.1:{PORT}")
+    t.add_argument('--concurrency', type=int, default=64)
+    t.add_argument('--duration', type=float, default=20)
+    t.add_argument('--batch-size', type=int, default=1, help="Rows per request (>1 uses /predict_batch)")
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port, max_batch_rows=args.max_batch_rows,
+                              max_wait_ms=args.max_wait_ms, max_queue=args.max_queue))
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(json.dumps(asyncio.run(load_test(args.url, args.concurrency, args.duration, args.batch_size)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
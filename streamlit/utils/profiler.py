@@ -0,0 +1,225 @@
+"""
+On-demand profiling of the next page or batch run.
+
+Arm it from the sidebar Profiler section or with the ?profile=1 query parameter
+(?profile=cprofile for a deterministic cProfile run). The next call of a
+function decorated with @profiler.profiled(...) (live_prediction_page,
+network_page, process_batch_excel) is profiled once and the result is kept in
+the session: top functions inline, plus a speedscope JSON and a folded-stacks
+file (flamegraph.pl / speedscope compatible) for download.
+
+When nothing is armed the decorator only does one session_state lookup.
+"""
+import cProfile
+import functools
+import io
+import json
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+import pandas as pd
+import streamlit as st
+
+ARMED_KEY = 'profile_armed'
+MODE_KEY = 'profile_mode'
+RESULT_KEY = 'last_profile'
+
+SAMPLE_INTERVAL_S = 0.005
+TOP_N = 25
+
+
+class _Sampler(threading.Thread):
+    """Samples the call stack of one thread at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_S):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _frame_label(frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({filename}:{line})"
+
+
+def _sampled_result(target: str, stacks: Counter, interval: float, wall_s: float) -> dict:
+    total = sum(stacks.values()) or 1
+
+    self_samples, incl_samples = Counter(), Counter()
+    for stack, n in stacks.items():
+        self_samples[stack[-1]] += n
+        for frame in set(stack):
+            incl_samples[frame] += n
+
+    top = pd.DataFrame([
+        {
+            'function': _frame_label(frame),
+            'self_pct': self_samples[frame] / total * 100,
+            'total_pct': incl_samples[frame] / total * 100,
+            'self_s': self_samples[frame] * interval,
+        }
+        for frame in incl_samples
+    ]).sort_values(['self_pct', 'total_pct'], ascending=False).head(TOP_N)
+
+    folded = '\n'.join(f"{';'.join(_frame_label(f) for f in stack)} {n}" for stack, n in stacks.items())
+
+    frames = sorted({f for stack in stacks for f in stack})
+    frame_index = {f: i for i, f in enumerate(frames)}
+    speedscope = {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': [{'name': name, 'file': filename, 'line': line} for name, filename, line in frames]},
+        'profiles': [{
+            'type': 'sampled',
+            'name': target,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(stacks.values()) * interval,
+            'samples': [[frame_index[f] for f in stack] for stack in stacks],
+            'weights': [n * interval for n in stacks.values()],
+        }],
+        'name': target,
+        'activeProfileIndex': 0,
+        'exporter': 'network-incident-monitoring',
+    }
+
+    return {
+        'target': target,
+        'mode': 'sampling',
+        'wall_s': wall_s,
+        'samples': sum(stacks.values()),
+        'top': top,
+        'files': {
+            f"{target}.speedscope.json": json.dumps(speedscope),
+            f"{target}.folded.txt": folded,
+        },
+    }
+
+
+def _cprofile_result(target: str, prof: cProfile.Profile, wall_s: float) -> dict:
+    stats = pstats.Stats(prof)
+    rows = []
+    for (filename, line, name), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({
+            'function': f"{name} ({os.path.basename(filename)}:{line})",
+            'calls': nc,
+            'self_s': tt,
+            'cumulative_s': ct,
+        })
+    top = pd.DataFrame(rows).sort_values('self_s', ascending=False).head(TOP_N)
+
+    text = io.StringIO()
+    stats.stream = text
+    stats.sort_stats('cumulative').print_stats(50)
+
+    return {
+        'target': target,
+        'mode': 'cprofile',
+        'wall_s': wall_s,
+        'top': top,
+        # .prof is the marshalled pstats format, same bytes as Profile.dump_stats
+        'files': {f"{target}.prof": marshal.dumps(stats.stats), f"{target}.pstats.txt": text.getvalue()},
+    }
+
+
+def _armed():
+    try:
+        return st.session_state.get(ARMED_KEY, False)
+    except Exception:
+        # Outside a Streamlit script run (CLI, worker process)
+        return False
+
+
+def profiled(target: str):
+    """Decorator: profile the next call when profiling is armed for this session."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _armed():
+                return func(*args, **kwargs)
+
+            # One-shot: disarm before running so nested profiled calls run normally
+            st.session_state[ARMED_KEY] = False
+            mode = st.session_state.get(MODE_KEY, 'sampling')
+            started = time.perf_counter()
+
+            if mode == 'cprofile':
+                prof = cProfile.Profile()
+                prof.enable()
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    prof.disable()
+                    st.session_state[RESULT_KEY] = _cprofile_result(target, prof, time.perf_counter() - started)
+            else:
+                sampler = _Sampler(threading.get_ident())
+                sampler.start()
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    sampler.stop()
+                    st.session_state[RESULT_KEY] = _sampled_result(
+                        target, sampler.stacks, sampler.interval, time.perf_counter() - started
+                    )
+
+            # Runs that end in st.rerun() never get here; their profile shows in the sidebar
+            with st.expander("🔬 Profile of this run", expanded=True):
+                show_profile(st.session_state[RESULT_KEY])
+            return result
+        return wrapper
+    return decorator
+
+
+def _arm():
+    st.session_state[ARMED_KEY] = True
+    st.session_state[MODE_KEY] = st.session_state.get('profile_mode_choice', 'sampling')
+
+
+def sidebar_controls():
+    """Sidebar controls (and ?profile= query parameter) to arm profiling, plus the last result."""
+    param = st.query_params.get('profile')
+    if param and not st.session_state.get('_profile_param_used'):
+        # Arm once per session from the URL, otherwise every rerun would re-arm it
+        st.session_state['_profile_param_used'] = True
+        st.session_state[ARMED_KEY] = True
+        st.session_state[MODE_KEY] = 'cprofile' if param == 'cprofile' else 'sampling'
+
+    with st.expander("🔬 Profiler"):
+        st.radio("Mode", options=['sampling', 'cprofile'], key='profile_mode_choice', horizontal=True)
+        st.button("Profile next run", on_click=_arm,
+                  help="Profiles the next Prediction page, Live Prediction page or batch upload run")
+        if st.session_state.get(ARMED_KEY):
+            st.caption("⏺️ Armed: the next page or batch run will be profiled")
+
+        result = st.session_state.get(RESULT_KEY)
+        if result is not None:
+            show_profile(result, key_prefix='sidebar')
+
+
+def show_profile(result: dict, key_prefix: str = 'inline'):
+    st.caption(f"{result['target']} | {result['mode']} | {result['wall_s']:.2f}s wall"
+               + (f" | {result['samples']} samples" if 'samples' in result else ""))
+    st.dataframe(result['top'], hide_index=True, width="stretch")
+    for filename, data in result['files'].items():
+        st.download_button(f"📥 {filename}", data=data, file_name=filename, key=f"{key_prefix}-{filename}")
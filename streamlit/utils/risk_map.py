@@ -0,0 +1,292 @@
+"""
+Live outage-risk map: geometry, aggregate layers and incremental risk updates.
+
+Geometry is built once per process (build_geometry): every OLT of the
+dimension cache (utils/dimensions.py) with its city, region and cluster
+count, placed around its city centroid (data/city_centroids.csv). The dataset has no site
+coordinates, so each OLT gets a fixed offset derived from its id.
+
+A map is drawn from a keyframe: the risk of every OLT when the base map was
+built. OLT markers go into a browser-side cluster (FastMarkerCluster), so
+tens of thousands of markers are one JSON array rather than one Leaflet
+object each in Python. The marker rows are serialized once per keyframe
+(keyframe_rows) and the page keeps them in its session state, so a refresh
+neither rebuilds nor re-serializes them, and the base map's script only
+changes when the keyframe does: st_folium keeps the map in the browser
+between refreshes. Each refresh only sends:
+    - a delta layer with the OLTs whose risk changed since the keyframe,
+      restyling the existing markers in place;
+    - the city or region aggregate circles (at most a few dozen).
+A new keyframe is taken when too many OLTs have changed since the last one.
+"""
+import json
+import zlib
+import folium
+import numpy as np
+import pandas as pd
+import streamlit as st
+from branca.element import Element, MacroElement, Template
+from folium.plugins import FastMarkerCluster
+from utils import alert_state
+from utils import dimensions
+from utils.dimensions import RAW_DIR
+
+CENTROIDS_PATH = 'data/city_centroids.csv'
+MAP_CENTER = (-2.5, 118.0)
+MAP_ZOOM = 5
+
+# Max distance (degrees) of an OLT from its city centroid
+OLT_SPREAD_DEG = 0.35
+
+# Risks are compared at this precision, so noise doesn't count as a change
+RISK_DECIMALS = 3
+
+# Re-key the base map once more than this share of OLTs changed since the keyframe
+KEYFRAME_CHANGED_SHARE = 0.2
+
+HIGH_RISK = alert_state.ENTER_THRESHOLD
+ELEVATED_RISK = alert_state.EXIT_THRESHOLD
+
+_RISK_COLOR_JS = f"""
+    function riskColor(p) {{
+        if (p === null || isNaN(p)) {{ return '#9e9e9e'; }}
+        if (p >= {HIGH_RISK}) {{ return '#d32f2f'; }}
+        if (p >= {ELEVATED_RISK}) {{ return '#f57c00'; }}
+        return '#388e3c';
+    }}
+    function riskLabel(name, p) {{
+        return name + ': ' + ((p === null || isNaN(p)) ? 'no prediction' : (100 * p).toFixed(1) + '%');
+    }}
+"""
+
+_MARKER_CALLBACK = _RISK_COLOR_JS + """
+    var callback = function (row) {
+        var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+            radius: 6, weight: 1, fillOpacity: 0.85, color: riskColor(row[2]), fillColor: riskColor(row[2]), risk: row[2]
+        });
+        marker.bindTooltip(riskLabel(row[3], row[2]));
+        window.oltMarkers = window.oltMarkers || {};
+        window.oltMarkers[row[3]] = marker;
+        return marker;
+    };
+"""
+
+# Cluster icons count the high-risk OLTs below them
+_CLUSTER_ICON_JS = f"""
+    function (cluster) {{
+        var markers = cluster.getAllChildMarkers();
+        var hot = 0;
+        for (var i = 0; i < markers.length; i++) {{
+            if (markers[i].options.risk >= {HIGH_RISK}) {{ hot++; }}
+        }}
+        var size = hot > 0 ? 'large' : 'small';
+        var text = cluster.getChildCount() + (hot > 0 ? ' (' + hot + ' ⚠)' : '');
+        return L.divIcon({{
+            html: '<div><span>' + text + '</span></div>',
+            className: 'marker-cluster marker-cluster-' + size,
+            iconSize: new L.Point(56, 40)
+        }});
+    }}
+"""
+
+
+class _ClusterHandle(MacroElement):
+    """Exposes the OLT cluster to later scripts as window.oltCluster."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            window.oltCluster = {{ this.cluster.get_name() }};
+        {% endmacro %}
+    """)
+
+    def __init__(self, cluster):
+        super().__init__()
+        self._name = 'ClusterHandle'
+        self.cluster = cluster
+
+
+class _Script(Element):
+    """An already rendered script; a plain Element would parse it as a template again."""
+
+    def __init__(self, script: str):
+        super().__init__()
+        self.script = script
+
+    def render(self, **kwargs):
+        return self.script
+
+
+class _KeyframeCluster(FastMarkerCluster):
+    """FastMarkerCluster over rows already serialized by keyframe_rows."""
+
+    _template = folium.template.Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                {{ this.callback }}
+
+                var data = {{ this.rows }};
+                var cluster = L.markerClusterGroup({{ this.options|tojavascript }});
+                {%- if this.icon_create_function is not none %}
+                cluster.options.iconCreateFunction =
+                    {{ this.icon_create_function.strip() }};
+                {%- endif %}
+
+                for (var i = 0; i < data.length; i++) {
+                    var row = data[i];
+                    var marker = callback(row);
+                    marker.addTo(cluster);
+                }
+
+                cluster.addTo({{ this._parent.get_name() }});
+                return cluster;
+            })();
+        {% endmacro %}
+    """)
+
+    # Links and the add-to-map child only; the script is added by render
+    _LINKS_ONLY = Template("")
+
+    def __init__(self, rows: str, **kwargs):
+        super().__init__([], **kwargs)
+        self.rows = rows
+
+    def render(self, **kwargs):
+        # The figure gets the rendered script as is: parsing megabytes of rows as a template is most of a render
+        self.get_root().script.add_child(_Script(self._template.module.script(self, kwargs)), name=self.get_name())
+        self._template = self._LINKS_ONLY
+        try:
+            super().render(**kwargs)
+        finally:
+            del self._template
+
+
+class _RiskDelta(MacroElement):
+    """Restyles the base map's markers of changed OLTs, then refreshes their cluster icons."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            (function () {
+                """ + _RISK_COLOR_JS + """
+                var updates = {{ this.updates|tojson }};
+                var markers = window.oltMarkers || {};
+                var changed = [];
+                for (var i = 0; i < updates.length; i++) {
+                    var marker = markers[updates[i][0]];
+                    if (!marker) { continue; }
+                    var p = updates[i][1];
+                    marker.options.risk = p;
+                    marker.setStyle({color: riskColor(p), fillColor: riskColor(p)});
+                    marker.setTooltipContent(riskLabel(updates[i][0], p));
+                    changed.push(marker);
+                }
+                if (window.oltCluster && changed.length) { window.oltCluster.refreshClusters(changed); }
+            })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, updates: list):
+        super().__init__()
+        self._name = 'RiskDelta'
+        self.updates = updates
+
+
+def _offsets(olt_ids: pd.Series) -> tuple:
+    """Fixed pseudo-random (dlat, dlon) per OLT id, uniform over a disc."""
+    seeds = np.array([zlib.crc32(str(olt).encode()) for olt in olt_ids], dtype=np.uint64)
+    angle = (seeds % 3600).astype(float) / 3600 * 2 * np.pi
+    radius = np.sqrt(((seeds // 3600) % 1000).astype(float) / 1000) * OLT_SPREAD_DEG
+    return radius * np.sin(angle), radius * np.cos(angle)
+
+
+@st.cache_data(show_spinner=False)
+def build_geometry(raw_dir: str = RAW_DIR, centroids_path: str = CENTROIDS_PATH) -> pd.DataFrame:
+    """
+    One row per OLT with its position and dimensions, built once.
+
+    Returns:
+        pd.DataFrame: olt_id, lat, lon, city, region, clusters (count)
+    """
+    centroids = pd.read_csv(centroids_path)
+    geo = dimensions.get_dimension_cache(raw_dir).olts().merge(centroids, on='city', how='left')
+    geo = geo.dropna(subset=['lat', 'lon']).reset_index(drop=True)
+
+    dlat, dlon = _offsets(geo['olt_id'])
+    geo['lat'] = geo['lat'] + dlat
+    geo['lon'] = geo['lon'] + dlon
+    return geo[['olt_id', 'lat', 'lon', 'city', 'region', 'clusters']]
+
+
+def align_risk(geometry: pd.DataFrame, latest: pd.DataFrame) -> np.ndarray:
+    """Latest outage probability per geometry row (NaN where the OLT has none), rounded to RISK_DECIMALS."""
+    if latest.empty:
+        return np.full(len(geometry), np.nan)
+    latest = latest.sort_values('timestamp_1h').drop_duplicates('olt_id', keep='last')
+    proba = geometry['olt_id'].map(latest.set_index('olt_id')['outage_probability'])
+    return np.round(pd.to_numeric(proba, errors='coerce').to_numpy(dtype=float), RISK_DECIMALS)
+
+
+def changed_since(keyframe: np.ndarray, risk: np.ndarray) -> np.ndarray:
+    """Positions whose risk differs from the keyframe (NaN equals NaN)."""
+    both_nan = np.isnan(keyframe) & np.isnan(risk)
+    return np.flatnonzero(~both_nan & (keyframe != risk))
+
+
+def _none_if_nan(values: np.ndarray) -> list:
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+def keyframe_rows(geometry: pd.DataFrame, keyframe: np.ndarray) -> str:
+    """Every OLT marker as a JSON array, serialized once per keyframe: [[lat, lon, risk, olt_id], ...]"""
+    # Compact rows, the whole array is inlined in the page
+    rows = list(zip(geometry['lat'].round(4).tolist(), geometry['lon'].round(4).tolist(), _none_if_nan(keyframe),
+                    geometry['olt_id'].tolist()))
+    return json.dumps(rows, separators=(',', ':'))
+
+
+def base_map(rows: str) -> folium.Map:
+    """Tiles plus every OLT marker coloured by the keyframe risk, from keyframe_rows."""
+    m = folium.Map(location=MAP_CENTER, zoom_start=MAP_ZOOM, prefer_canvas=True)
+    cluster = _KeyframeCluster(rows, callback=_MARKER_CALLBACK, name='OLTs', icon_create_function=_CLUSTER_ICON_JS,
+                               disableClusteringAtZoom=10, chunkedLoading=True)
+    cluster.add_to(m)
+    _ClusterHandle(cluster).add_to(m)
+    return m
+
+
+def aggregate(geometry: pd.DataFrame, risk: np.ndarray, level: str) -> pd.DataFrame:
+    """Risk per city or region: OLTs, OLTs with a prediction, mean/max risk and high-risk OLTs."""
+    frame = geometry[[level, 'lat', 'lon']].assign(risk=risk, high=risk >= HIGH_RISK)
+    return frame.groupby(level).agg(
+        olts=('risk', 'size'),
+        predicted=('risk', 'count'),
+        mean_risk=('risk', 'mean'),
+        max_risk=('risk', 'max'),
+        high_risk=('high', 'sum'),
+        lat=('lat', 'mean'),
+        lon=('lon', 'mean'),
+    ).reset_index()
+
+
+def aggregate_layer(summary: pd.DataFrame, level: str) -> folium.FeatureGroup:
+    """One circle per city/region, sized by OLT count and coloured by its highest risk."""
+    group = folium.FeatureGroup(name=f"{level.title()} risk")
+    for row in summary.itertuples(index=False):
+        worst = row.max_risk
+        color = ('#9e9e9e' if pd.isna(worst) else '#d32f2f' if worst >= HIGH_RISK
+                 else '#f57c00' if worst >= ELEVATED_RISK else '#388e3c')
+        mean_text = 'no prediction' if pd.isna(row.mean_risk) else f"mean {row.mean_risk:.1%}, max {worst:.1%}"
+        folium.Circle(
+            location=(row.lat, row.lon),
+            radius=10_000 + 5_000 * np.sqrt(row.olts),
+            color=color, weight=2, fill=True, fill_opacity=0.15,
+            tooltip=f"{getattr(row, level)}: {row.olts} OLTs, {int(row.high_risk)} high risk ({mean_text})",
+        ).add_to(group)
+    return group
+
+
+def delta_layer(geometry: pd.DataFrame, risk: np.ndarray, changed: np.ndarray) -> folium.FeatureGroup:
+    group = folium.FeatureGroup(name="Risk updates", control=False)
+    updates = [[olt, p] for olt, p in zip(geometry['olt_id'].to_numpy()[changed], _none_if_nan(risk[changed]))]
+    _RiskDelta(updates).add_to(group)
+    return group
+
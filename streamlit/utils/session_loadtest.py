@@ -0,0 +1,413 @@
+"""
+Headless load test of the Streamlit app with concurrent operator sessions.
+
+Every simulated session is an AppTest of streamlit_app.py driven from its own
+thread of this process, the way the server runs one script thread per browser
+tab: sessions share the process-wide caches (st.cache_resource / cache_data,
+model handles, the prediction cache) and compete for the same GIL and cores.
+A session repeats operator actions with an exponential think time between them:
+
+    nav      switch to the Prediction, Dashboard or Live Prediction page
+    single   submit the single-prediction form with perturbed inputs
+    batch    upload the batch Excel file and run the batch prediction
+    live     switch Live Prediction to the stream consumer results, or refresh it
+
+Live Prediction reads the stream consumer's local results (replayed into
+stream_consumer.RESULTS_DIR through the LocalBroker stand-in when there are
+none), so no Snowflake session is needed. Predictions use the production model
+when the app can load one (model cache, registry or trained_models/).
+Otherwise ensure_model installs a stand-in into a scratch model cache: a
+CatBoost the size of the production model, fitted on the bundled
+data/*_prev_23_rows.csv samples. Those samples have no outages, so its labels
+are a rule on the inputs and its probabilities mean nothing, but every model
+call costs what a real one does. The model in use is recorded in the result
+(config.model_source).
+
+Each step runs a number of sessions for --duration seconds and reports reruns/s,
+rerun latency percentiles (overall and per action), process CPU in cores and
+per session, and RSS growth per session. A step is saturated when its p95
+exceeds --slo-ms, more than MAX_ERROR_RATE of its reruns fail, or its
+throughput grows less than MIN_SCALING over the previous step; the last step
+before that is the capacity. Rerun latency is script time plus building the
+element tree; the websocket and the browser aren't part of it.
+
+With --baseline the run is compared with an earlier --output and the command
+exits with status 1 when p95 at a common session count grew by more than
+--tolerance or the capacity shrank.
+
+Usage (run from the streamlit/ directory):
+    python -m utils.session_loadtest --sessions 1,2,4,8 --duration 30 --output loadtest.json
+    python -m utils.session_loadtest --sessions 1,2,4,8 --duration 30 --baseline loadtest.json
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+from utils import data_prep_sup
+from utils import model_cache
+from utils import model_set
+from utils import stream_consumer
+
+APP_SCRIPT = 'streamlit_app.py'
+BATCH_INPUT = 'data/historical_prev_23_rows.csv'
+
+# Stand-in for a missing production model: same tree shape as horizons.train
+STAND_IN_SAMPLES = 'data/*_prev_23_rows.csv'
+STAND_IN_ITERATIONS = 1200
+STAND_IN_DEPTH = 6
+# Share of sample rows the stand-in is taught to call outages
+STAND_IN_POSITIVE_SHARE = 0.25
+
+PAGE_PREDICTION = "📈 Prediction"
+PAGE_DASHBOARD = "📊 Dashboard"
+PAGE_LIVE = "📡 Live Prediction"
+PAGES = [PAGE_PREDICTION, PAGE_DASHBOARD, PAGE_LIVE]
+
+# Share of each operator action
+ACTIONS = {'nav': 0.4, 'single': 0.3, 'batch': 0.1, 'live': 0.2}
+
+THINK_S = 2.0
+RERUN_TIMEOUT_S = 120
+SLO_MS = 2000
+
+# A step must add at least 10% throughput over the previous one
+MIN_SCALING = 1.1
+MAX_ERROR_RATE = 0.01
+
+# Live Prediction's data source without a Snowflake session (custom_pages/live_prediction.py)
+LIVE_SOURCE = "Stream consumer results"
+
+SUBMIT_SINGLE = "🔮 Predict Network Incident"
+RUN_BATCH = "🔮 Run Batch Prediction"
+REFRESH_LIVE = "🔄 Refresh Now"
+
+
+def _rss_mb() -> float:
+    """Resident memory of this process (peak RSS where /proc isn't available)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def batch_file_bytes(path: str = BATCH_INPUT) -> bytes:
+    """The batch upload: raw rows as an Excel file, like the template operators fill in."""
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        pd.read_csv(path).to_excel(writer, index=False)
+    return buffer.getvalue()
+
+
+def ensure_live_results(input_path: str = BATCH_INPUT, results_dir: str = stream_consumer.RESULTS_DIR):
+    """Replay input_path through the local broker stand-in when the live page has no results to read."""
+    if not stream_consumer.read_results(results_dir, limit=1).empty:
+        return
+    from utils.feature_store import read_table
+    broker = stream_consumer.LocalBroker()
+    stream_consumer.produce_local(broker, read_table(input_path))
+    scorer = stream_consumer.StreamScorer(broker.consumer(stream_consumer.INPUT_TOPIC),
+                                          stream_consumer.ParquetSink(results_dir), max_wait_s=0.05)
+    scorer.run(stop_when_idle=True)
+
+
+def fit_stand_in_model(pattern: str = STAND_IN_SAMPLES):
+    """
+    CatBoost of the production model's size on the bundled sample rows.
+
+    The samples carry no outages, so the rows with the highest offline ratio and
+    trap trend are labelled outages; the model is for timing only.
+    """
+    from catboost import CatBoostClassifier
+    df = pd.concat([pd.read_csv(path) for path in sorted(glob.glob(pattern))], ignore_index=True)
+    df['timestamp_1h'] = pd.to_datetime(df['timestamp_1h'], errors='coerce')
+    X = data_prep_sup.build_feature_matrix(df.copy())
+    risk = X['offline_ont_ratio'].rank(pct=True) + X['trap_trend_score'].rank(pct=True)
+    y = (risk >= risk.quantile(1 - STAND_IN_POSITIVE_SHARE)).astype(int)
+    model = CatBoostClassifier(iterations=STAND_IN_ITERATIONS, depth=STAND_IN_DEPTH, verbose=False,
+                               allow_writing_files=False)
+    return model.fit(X, y)
+
+
+def ensure_model(cache_dir: str = None) -> str:
+    """
+    Source of the primary model the app will score with, installing the stand-in
+    into a scratch model cache (cache_dir, or a new temporary directory) when the
+    app can't load one.
+    """
+    primary = next(spec for spec in model_set.DEFAULT_MODEL_SET if spec['role'] == 'primary')
+    try:
+        return data_prep_sup.get_model_handle(primary['filename'], primary['name'], primary['version']).source
+    except (FileNotFoundError, ValueError):
+        pass
+
+    print(f"⚠️ No {primary['name']} {primary['version']} in the model cache, registry or "
+          f"{model_cache.LOCAL_MODEL_DIR}/; fitting a stand-in (timings only, predictions mean nothing)")
+    model_cache.CACHE_DIR = cache_dir or tempfile.mkdtemp(prefix='loadtest-model-cache-')
+    model_cache.store_artifact(fit_stand_in_model(), primary['name'], primary['version'])
+    data_prep_sup.get_model_handle(primary['filename'], primary['name'], primary['version'])
+    return 'stand-in'
+
+
+def _share_runtime():
+    """
+    AppTest installs a stand-in Runtime for each run and removes it when the run
+    ends, which would pull it from under the scripts other sessions are running.
+    Keep serving the last one between runs instead.
+    """
+    from streamlit.runtime.runtime import Runtime
+    if getattr(Runtime, '_shared_by_load_test', False):
+        return
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last['runtime'] = cls._instance
+            return cls._instance
+        if 'runtime' in last:
+            return last['runtime']
+        raise RuntimeError("Runtime hasn't been created!")
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or 'runtime' in last)
+    Runtime._shared_by_load_test = True
+
+
+def _has_predictions(at) -> bool:
+    return any(h.value == "🔮 Predictions on Live Data" for h in at.subheader)
+
+
+class OperatorSession:
+    """One simulated operator: an AppTest of the app and the reruns it has timed."""
+
+    def __init__(self, batch_file: bytes, seed: int = 0):
+        # Relative to the working directory (streamlit/), not to this file
+        self.at = AppTest.from_file(os.path.abspath(APP_SCRIPT), default_timeout=RERUN_TIMEOUT_S)
+        self.batch_file = batch_file
+        self.rng = np.random.default_rng(seed)
+        self.page = PAGE_PREDICTION
+        self.records = []
+
+    def _rerun(self, action: str, step, expect=None):
+        """Time one rerun; it failed when it raised, rendered an exception or lacks its expected output."""
+        started = time.perf_counter()
+        try:
+            step()
+            error = ' | '.join(str(e.value) for e in self.at.exception) or None
+            if error is None and expect is not None and not expect(self.at):
+                error = f"{action}: " + (' | '.join(e.value for e in self.at.error) or "expected output missing")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.records.append({'action': action, 'page': self.page, 'seconds': time.perf_counter() - started,
+                             'error': error})
+
+    def _button(self, label: str):
+        return next(b for b in self.at.button if b.label == label)
+
+    def open(self):
+        self._rerun('open', self.at.run)
+
+    def navigate(self, page: str):
+        self.page = page
+        self._rerun('nav', lambda: self.at.button(key=page).click().run())
+
+    def single(self):
+        if self.page != PAGE_PREDICTION:
+            self.navigate(PAGE_PREDICTION)
+        inputs = {n.label: n for n in self.at.number_input}
+
+        def submit():
+            inputs["Offline ONT Now"].set_value(int(self.rng.integers(0, 30)))
+            inputs["Temperature Avg (°C)"].set_value(round(float(self.rng.uniform(30, 50)), 2))
+            inputs["Trap Trend Score"].set_value(round(float(self.rng.uniform(0, 1)), 6))
+            self._button(SUBMIT_SINGLE).click().run()
+        self._rerun('single', submit, lambda at: any(h.value == "📊 Prediction Result" for h in at.subheader))
+
+    def batch(self):
+        if self.page != PAGE_PREDICTION:
+            self.navigate(PAGE_PREDICTION)
+        upload = (f"batch_{self.rng.integers(1 << 30)}.xlsx", self.batch_file,
+                  "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        self._rerun('upload', lambda: self.at.file_uploader[0].set_value(upload).run())
+        self._rerun('batch', lambda: self._button(RUN_BATCH).click().run(),
+                    lambda at: any("Successfully processed" in m.value for m in at.success))
+
+    def live(self):
+        if self.page != PAGE_LIVE:
+            self.navigate(PAGE_LIVE)
+        source = self.at.radio[0]
+        if source.value != LIVE_SOURCE:
+            self._rerun('live', lambda: source.set_value(LIVE_SOURCE).run(), _has_predictions)
+        else:
+            self._rerun('live', lambda: self._button(REFRESH_LIVE).click().run(), _has_predictions)
+
+    def act(self, action: str):
+        if action == 'nav':
+            self.navigate(self.rng.choice([p for p in PAGES if p != self.page]))
+        else:
+            getattr(self, action)()
+
+
+def _run_session(session: OperatorSession, stop_at: float, think_s: float):
+    session.open()
+    actions, weights = list(ACTIONS), np.array(list(ACTIONS.values()))
+    while time.perf_counter() < stop_at:
+        session.act(session.rng.choice(actions, p=weights / weights.sum()))
+        if think_s:
+            time.sleep(min(session.rng.exponential(think_s), max(stop_at - time.perf_counter(), 0)))
+
+
+def _percentiles(seconds) -> dict:
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1000 if len(seconds) else (np.nan,) * 3
+    return {'p50_ms': round(float(p50), 1), 'p95_ms': round(float(p95), 1), 'p99_ms': round(float(p99), 1)}
+
+
+def run_step(sessions: int, duration_s: float, think_s: float, batch_file: bytes, seed: int = 0) -> dict:
+    """Run `sessions` concurrent operators for duration_s seconds; returns the step's metrics."""
+    rss_before = _rss_mb()
+    operators = [OperatorSession(batch_file, seed=seed * 1000 + i) for i in range(sessions)]
+    stop_at = time.perf_counter() + duration_s
+    started, cpu_started = time.perf_counter(), time.process_time()
+    threads = [threading.Thread(target=_run_session, args=(op, stop_at, think_s), name=f"operator-{i}")
+               for i, op in enumerate(operators)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    cpu_cores = (time.process_time() - cpu_started) / elapsed
+    rss_per_session = (_rss_mb() - rss_before) / sessions
+
+    records = pd.DataFrame([r for op in operators for r in op.records])
+    errors = records['error'].notna()
+    by_action = {action: {'reruns': len(part), **_percentiles(part['seconds'])}
+                 for action, part in records.groupby('action')}
+    return {
+        'sessions': sessions,
+        'reruns': len(records),
+        'errors': int(errors.sum()),
+        'error_rate': round(float(errors.mean()), 4),
+        'reruns_per_s': round(len(records) / elapsed, 2),
+        **_percentiles(records['seconds']),
+        'cpu_cores': round(cpu_cores, 2),
+        'cpu_per_session': round(cpu_cores / sessions, 3),
+        'cpu_ms_per_rerun': round(cpu_cores * elapsed / max(len(records), 1) * 1000, 1),
+        'rss_mb': round(_rss_mb(), 1),
+        'rss_per_session_mb': round(rss_per_session, 1),
+        'by_action': by_action,
+        'first_errors': records.loc[errors, 'error'].drop_duplicates().head(3).tolist(),
+    }
+
+
+def find_capacity(steps: list, slo_ms: float = SLO_MS) -> dict:
+    """First saturated step (p95 over the SLO, errors, or throughput no longer scaling) and the capacity before it."""
+    capacity, previous = 0, None
+    for step in steps:
+        if step['p95_ms'] > slo_ms:
+            reason = f"p95 {step['p95_ms']:.0f} ms > SLO {slo_ms:.0f} ms"
+        elif step['error_rate'] > MAX_ERROR_RATE:
+            reason = f"{step['error_rate']:.1%} of reruns failed"
+        elif previous is not None and step['reruns_per_s'] < previous['reruns_per_s'] * MIN_SCALING:
+            reason = (f"throughput {step['reruns_per_s']:.2f}/s vs {previous['reruns_per_s']:.2f}/s "
+                      f"at {previous['sessions']} sessions")
+        else:
+            capacity, previous = step['sessions'], step
+            continue
+        return {'capacity_sessions': capacity, 'saturated_at': step['sessions'], 'reason': reason}
+    return {'capacity_sessions': capacity, 'saturated_at': None, 'reason': "not saturated in the tested range"}
+
+
+def load_test(session_counts=(1, 2, 4, 8), duration_s: float = 30, think_s: float = THINK_S,
+              slo_ms: float = SLO_MS, batch_input: str = BATCH_INPUT) -> dict:
+    """
+    Step through session_counts (ascending) and find the saturation point.
+
+    Returns:
+        dict: config, one metrics dict per step, capacity_sessions / saturated_at / reason
+    """
+    _share_runtime()
+    model_source = ensure_model()
+    batch_file = batch_file_bytes(batch_input)
+    ensure_live_results(batch_input)
+
+    # Warm the process-wide caches (models, data files) so the first step isn't a cold start
+    warm = OperatorSession(batch_file)
+    warm.open()
+    for action in ('single', 'batch', 'live', 'nav'):
+        warm.act(action)
+
+    steps = []
+    for i, n in enumerate(sorted(session_counts)):
+        step = run_step(n, duration_s, think_s, batch_file, seed=i + 1)
+        steps.append(step)
+        print(f"{n:>3} session(s): {step['reruns_per_s']:.2f} reruns/s, p50 {step['p50_ms']:.0f} ms, "
+              f"p95 {step['p95_ms']:.0f} ms, {step['cpu_cores']:.2f} cores, "
+              f"{step['rss_per_session_mb']:.1f} MB/session, {step['errors']} error(s)")
+    return {
+        'config': {'duration_s': duration_s, 'think_s': think_s, 'slo_ms': slo_ms, 'actions': ACTIONS,
+                   'cpu_count': os.cpu_count(), 'model_source': model_source},
+        'steps': steps,
+        **find_capacity(steps, slo_ms),
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """Regressions of result against an earlier run: p95 growth per common session count, lower capacity."""
+    regressions = []
+    before = {s['sessions']: s for s in baseline['steps']}
+    for step in result['steps']:
+        old = before.get(step['sessions'])
+        if old is not None and step['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{step['sessions']} session(s): p95 {step['p95_ms']:.0f} ms vs {old['p95_ms']:.0f} ms")
+    if result['capacity_sessions'] < baseline['capacity_sessions']:
+        regressions.append(f"capacity {result['capacity_sessions']} vs {baseline['capacity_sessions']} sessions")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test of the Streamlit app")
+    parser.add_argument('--sessions', default='1,2,4,8', help="Comma-separated session counts, one step each")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds per step")
+    parser.add_argument('--think-s', type=float, default=THINK_S, help="Mean think time between actions")
+    parser.add_argument('--slo-ms', type=float, default=SLO_MS, help="p95 rerun latency a step must stay under")
+    parser.add_argument('--batch-input', default=BATCH_INPUT, help="CSV of raw rows uploaded as the batch file")
+    parser.add_argument('--output', help="Write the result as JSON")
+    parser.add_argument('--baseline', help="Earlier --output to gate against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    result = load_test([int(n) for n in args.sessions.split(',')], args.duration, args.think_s, args.slo_ms,
+                       args.batch_input)
+    table = pd.DataFrame([{k: v for k, v in s.items() if k not in ('by_action', 'first_errors')} for s in result['steps']])
+    print(table.to_string(index=False))
+    for step in result['steps']:
+        if step['first_errors']:
+            print(f"Errors at {step['sessions']} session(s): {step['first_errors']}")
+    print(f"Capacity: {result['capacity_sessions']} session(s) per server process "
+          f"(saturated at {result['saturated_at']}: {result['reason']})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            raise SystemExit(1)
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
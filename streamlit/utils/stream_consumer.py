@@ -0,0 +1,493 @@
+"""
+Kafka consumer that scores raw_ml_features_topic directly.
+
+Instead of waiting for the Kafka connector to land rows in Snowflake and the
+live page to poll them, this service consumes the topic the producer writes
+(snowpipe/kafka_producer.py), groups messages into micro-batches (up to
+MAX_BATCH_ROWS rows or MAX_WAIT_S seconds, whichever comes first), scores each
+batch in one model call with the data_prep_sup pipeline and publishes the
+results to a results topic and/or a local Parquet store. The Live Prediction
+page can read the local store ("Stream consumer results" source).
+
+Rolling/delta features need the previous hours of each OLT, so the consumer
+keeps the last CONTEXT_ROWS raw rows per OLT in memory and scores every batch
+together with that context. Offsets are committed after the results are
+written (at-least-once). Messages that can't be decoded, lack olt_id,
+timestamp_1h or a raw feature, or carry a non-numeric feature are dropped and
+counted in stats['bad_messages'], so one bad message never blocks the offsets;
+should a batch still fail to score, its rows are scored one by one and only
+the failing ones are dropped. Slim messages (olt_key/cluster_key instead of the
+OLT/cluster/city/region strings, see utils/dimensions.py) get their olt_id
+back from the dimension cache; results keep the keys rather than the strings.
+Messages may be JSON or schema-encoded binary (utils/message_codec.py).
+
+LocalBroker is an in-process stand-in for a broker (topics, partitions,
+per-group committed offsets) with the parts of the kafka-python producer and
+consumer API used here, so the service can be run and tested without Kafka.
+
+Usage (run from the streamlit/ directory):
+    python -m utils.stream_consumer --broker 172.23.10.132:9092
+    python -m utils.stream_consumer --local input.csv
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import defaultdict, deque, namedtuple
+import pandas as pd
+from utils import data_prep_sup
+from utils import dimensions
+from utils import drift
+from utils import horizons
+from utils import message_codec
+from utils import perf
+
+KAFKA_BROKER = '172.23.10.132:9092'
+INPUT_TOPIC = 'raw_ml_features_topic'
+RESULTS_TOPIC = 'ml_predictions_topic'
+GROUP_ID = 'netmon-stream-scorer'
+
+RESULTS_DIR = 'data/stream_results'
+MAX_RESULT_PARTS = 500
+
+MAX_BATCH_ROWS = 500
+MAX_WAIT_S = 1.0
+
+# Previous hours kept per OLT for the rolling/delta features
+CONTEXT_ROWS = max(data_prep_sup.ROLL_WINDOWS) - 1
+
+# Mirrors kafka-python's ConsumerRecord fields used here
+Record = namedtuple('Record', ['topic', 'partition', 'offset', 'timestamp', 'key', 'value'])
+
+
+def partition_for(key, partitions: int) -> int:
+    """Stable partition of a message key (crc32, so it's the same across processes)."""
+    if key is None:
+        return 0
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return zlib.crc32(key) % partitions
+
+
+class LocalBroker:
+    """In-process broker stand-in: partitioned append-only logs and committed offsets per group."""
+
+    def __init__(self, partitions: int = 1):
+        self.partitions = partitions
+        self._logs = defaultdict(lambda: [[] for _ in range(self.partitions)])
+        self._committed = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def append(self, topic: str, value: bytes, key=None, timestamp_ms: int = None) -> Record:
+        with self._lock:
+            partition = partition_for(key, self.partitions)
+            log = self._logs[topic][partition]
+            record = Record(topic, partition, len(log), timestamp_ms or int(time.time() * 1000), key, value)
+            log.append(record)
+            return record
+
+    def read(self, topic: str, partition: int, offset: int, max_records: int) -> list:
+        with self._lock:
+            return self._logs[topic][partition][offset:offset + max_records]
+
+    def end_offsets(self, topic: str) -> dict:
+        with self._lock:
+            return {p: len(log) for p, log in enumerate(self._logs[topic])}
+
+    def committed(self, group_id: str, topic: str, partition: int) -> int:
+        with self._lock:
+            return self._committed[group_id].get((topic, partition), 0)
+
+    def commit(self, group_id: str, offsets: dict):
+        with self._lock:
+            self._committed[group_id].update(offsets)
+
+    def producer(self) -> 'LocalProducer':
+        return LocalProducer(self)
+
+    def consumer(self, topic: str, group_id: str = GROUP_ID, partitions=None) -> 'LocalConsumer':
+        return LocalConsumer(self, topic, group_id, partitions)
+
+
+class LocalProducer:
+    """KafkaProducer-like sender for LocalBroker."""
+
+    def __init__(self, broker: LocalBroker, value_serializer=None):
+        self.broker = broker
+        self.value_serializer = value_serializer
+
+    def send(self, topic: str, value=None, key=None, timestamp_ms: int = None):
+        if self.value_serializer is not None:
+            value = self.value_serializer(value)
+        return self.broker.append(topic, value, key=key, timestamp_ms=timestamp_ms)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class LocalConsumer:
+    """KafkaConsumer-like poller for LocalBroker (manual commits, like enable_auto_commit=False)."""
+
+    def __init__(self, broker: LocalBroker, topic: str, group_id: str = GROUP_ID, partitions=None):
+        self.broker = broker
+        self.topic = topic
+        self.group_id = group_id
+        self.assign(range(broker.partitions) if partitions is None else partitions)
+
+    def assign(self, partitions):
+        self.partitions = sorted(partitions)
+        self._position = {p: self.broker.committed(self.group_id, self.topic, p) for p in self.partitions}
+
+    def seek(self, partition: int, offset: int):
+        self._position[partition] = offset
+
+    def position(self, partition: int) -> int:
+        return self._position[partition]
+
+    def poll(self, timeout_ms: int = 0, max_records: int = MAX_BATCH_ROWS) -> dict:
+        deadline = time.monotonic() + timeout_ms / 1000
+        while True:
+            # Share max_records across partitions, like Kafka fetches, so none is starved
+            batch = {}
+            remaining = max_records
+            while remaining > 0:
+                share = max(1, remaining // max(len(self.partitions), 1))
+                fetched = 0
+                for p in self.partitions:
+                    records = self.broker.read(self.topic, p, self._position[p], min(share, remaining))
+                    if records:
+                        batch.setdefault((self.topic, p), []).extend(records)
+                        self._position[p] += len(records)
+                        remaining -= len(records)
+                        fetched += len(records)
+                    if remaining <= 0:
+                        break
+                if fetched == 0:
+                    break
+            if batch or time.monotonic() >= deadline:
+                return batch
+            time.sleep(0.005)
+
+    def commit(self):
+        self.broker.commit(self.group_id, {(self.topic, p): pos for p, pos in self._position.items()})
+
+    def close(self):
+        pass
+
+
+def decode_value(value: bytes) -> dict:
+    """Message value -> raw feature row (the producer sends JSON or schema-encoded binary)."""
+    return message_codec.decode_value(value)
+
+
+def kafka_consumer(broker: str = KAFKA_BROKER, topic: str = INPUT_TOPIC, group_id: str = GROUP_ID):
+    """KafkaConsumer for the real broker (kafka-python, as used by the producer)."""
+    from kafka import KafkaConsumer
+    return KafkaConsumer(
+        topic,
+        bootstrap_servers=[broker],
+        group_id=group_id,
+        enable_auto_commit=False,
+        auto_offset_reset='latest',
+    )
+
+
+def kafka_producer(broker: str = KAFKA_BROKER):
+    from kafka import KafkaProducer
+    return KafkaProducer(bootstrap_servers=[broker])
+
+
+class ParquetSink:
+    """Writes each scored batch as a Parquet part file; the newest parts are what the live page reads."""
+
+    def __init__(self, path: str = RESULTS_DIR, max_parts: int = MAX_RESULT_PARTS):
+        self.path = path
+        self.max_parts = max_parts
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, results: pd.DataFrame):
+        # Write then rename so readers never see a partial file; the suffix keeps
+        # names unique when several workers write to the same store
+        name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp = os.path.join(self.path, f".{name}.tmp")
+        results.to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(self.path, name))
+
+        parts = sorted(f for f in os.listdir(self.path) if f.startswith('part-'))
+        for old in parts[:-self.max_parts]:
+            os.remove(os.path.join(self.path, old))
+
+
+class TopicSink:
+    """Publishes one JSON message per scored row, keyed by olt_id."""
+
+    def __init__(self, producer, topic: str = RESULTS_TOPIC):
+        self.producer = producer
+        self.topic = topic
+
+    def write(self, results: pd.DataFrame):
+        lines = results.to_json(orient='records', lines=True, date_format='iso').splitlines()
+        for olt_id, line in zip(results['olt_id'].astype(str), lines):
+            self.producer.send(self.topic, value=line.encode('utf-8'), key=olt_id.encode('utf-8'))
+        self.producer.flush()
+
+
+def read_results(path: str = RESULTS_DIR, limit: int = 100) -> pd.DataFrame:
+    """Latest scored rows from a ParquetSink directory, newest ingest first."""
+    if not os.path.isdir(path):
+        return pd.DataFrame()
+
+    frames, rows = [], 0
+    for name in sorted((f for f in os.listdir(path) if f.startswith('part-')), reverse=True):
+        part = pd.read_parquet(os.path.join(path, name))
+        frames.append(part)
+        rows += len(part)
+        if rows >= limit:
+            break
+    if not frames:
+        return pd.DataFrame()
+
+    df = pd.concat(frames, ignore_index=True)
+    df['ingested_time'] = pd.to_datetime(df['ingested_time'], utc=True).dt.tz_convert('Asia/Jakarta')
+    return df.sort_values('ingested_time', ascending=False).head(limit).reset_index(drop=True)
+
+
+class StreamScorer:
+    """Micro-batching consume -> score -> publish loop."""
+
+    def __init__(self, consumer, sinks, model=None, max_batch_rows: int = MAX_BATCH_ROWS,
+                 max_wait_s: float = MAX_WAIT_S, threshold: float = data_prep_sup.THRESHOLD, horizon_set=None):
+        self.consumer = consumer
+        self.sinks = sinks if isinstance(sinks, (list, tuple)) else [sinks]
+        self.model = model
+        # Optional horizons.HorizonSet, scored on the same feature matrix as the 1h model
+        self.horizon_set = horizon_set
+        self.max_batch_rows = max_batch_rows
+        self.max_wait_s = max_wait_s
+        self.threshold = threshold
+        self.context = defaultdict(lambda: deque(maxlen=CONTEXT_ROWS))
+        self.stats = {'batches': 0, 'rows': 0, 'bad_messages': 0, 'busy_s': 0.0}
+
+    def poll_batch(self) -> list:
+        """Records until the batch is full or max_wait_s has passed since the first one arrived."""
+        records = []
+        first_at = None
+        while len(records) < self.max_batch_rows:
+            if first_at is None:
+                timeout = self.max_wait_s
+            else:
+                timeout = self.max_wait_s - (time.monotonic() - first_at)
+                if timeout <= 0:
+                    break
+            polled = self.consumer.poll(timeout_ms=int(timeout * 1000), max_records=self.max_batch_rows - len(records))
+            for batch in polled.values():
+                records.extend(batch)
+            if records and first_at is None:
+                first_at = time.monotonic()
+            if not polled and first_at is None:
+                break
+        return records
+
+    def _bad_messages(self, n: int, reason: str):
+        self.stats['bad_messages'] += n
+        perf.count("stream_bad_messages", n)
+        print(f"Warning: dropped {n} bad message(s): {reason}")
+
+    def _decode(self, records: list) -> pd.DataFrame:
+        """Valid records as raw rows (features numeric, timestamp_1h parsed); bad ones are counted and dropped."""
+        rows = []
+        consumed_at = pd.Timestamp.now(tz='UTC')
+        for record in records:
+            try:
+                row = decode_value(record.value)
+            except (ValueError, TypeError) as e:
+                self._bad_messages(1, f"offset {record.offset}: {e}")
+                continue
+            if not isinstance(row, dict):
+                self._bad_messages(1, f"offset {record.offset}: not a row")
+                continue
+            missing = ([] if 'olt_id' in row or 'olt_key' in row else ['olt_id']) + \
+                [c for c in ['timestamp_1h'] + data_prep_sup.RAW_FEATURES if c not in row]
+            if missing:
+                self._bad_messages(1, f"offset {record.offset}: missing {', '.join(missing)}")
+                continue
+            row['ingested_time'] = pd.Timestamp(record.timestamp, unit='ms', tz='UTC')
+            row['kafka_partition'] = record.partition
+            row['kafka_offset'] = record.offset
+            rows.append(row)
+        df = pd.DataFrame(rows)
+        if not df.empty:
+            # Slim messages carry olt_key/cluster_key only; scoring context is kept per olt_id
+            df = dimensions.enrich(df, ['olt_id'])
+            df['fetched_at'] = consumed_at
+            df['timestamp_1h'] = pd.to_datetime(df['timestamp_1h'], errors='coerce')
+            if 'olt_id' not in df.columns:
+                df['olt_id'] = None
+            features = df[data_prep_sup.RAW_FEATURES]
+            numeric = features.apply(pd.to_numeric, errors='coerce')
+            invalid = (numeric.isna() & features.notna()).any(axis=1) | df['timestamp_1h'].isna() | df['olt_id'].isna()
+            df[data_prep_sup.RAW_FEATURES] = numeric
+            if invalid.any():
+                self._bad_messages(int(invalid.sum()), "unknown olt_id, unparseable timestamp_1h or non-numeric feature")
+                df = df[~invalid]
+            df['olt_id'] = df['olt_id'].astype(str)
+        return df
+
+    @perf.timed("stream.score_batch")
+    def score(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Score new rows together with each OLT's previous hours, then remember them as context."""
+        context_rows = [row for olt in df['olt_id'].unique() for row in self.context.get(olt, ())]
+        context = pd.DataFrame(context_rows, columns=df.columns) if context_rows else df.iloc[:0]
+        combined = pd.concat([context, df], ignore_index=True)
+        new_index = combined.index[len(context):]
+
+        X = data_prep_sup.build_feature_matrix(combined)
+        base_scorer = lambda X_new: data_prep_sup.predict_proba(X_new, model=self.model)
+        if self.horizon_set is None:
+            proba = base_scorer(X.loc[new_index])
+        else:
+            predictions = self.horizon_set.predict(X.loc[new_index], base_scorer)
+            proba = predictions['outage_probability'].to_numpy()
+        if drift.get_monitor() is not None:
+            regions = dimensions.enrich(combined.loc[new_index, ['olt_id']], ['region']).get('region')
+            drift.observe(X.loc[new_index], combined, regions)
+
+        results = df.copy()
+        results['outage_probability'] = proba
+        results['label_outage_1h'] = (proba >= self.threshold).astype(int)
+        if self.horizon_set is not None:
+            for col in predictions.columns.drop(['outage_probability', 'label_outage_1h']):
+                results[col] = predictions[col].to_numpy()
+        results['predicted_at'] = pd.Timestamp.now(tz='UTC')
+
+        for row in df.sort_values('timestamp_1h').to_dict('records'):
+            self.context[row['olt_id']].append(row)
+        return results
+
+    def _score_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Score a batch that failed as a whole row by row, dropping the rows that still fail."""
+        parts, error = [], None
+        for index in df.sort_values('timestamp_1h').index:
+            try:
+                parts.append(self.score(df.loc[[index]]))
+            except Exception as e:
+                error = e
+        if not parts:
+            # Nothing scores: a problem with the scorer, not with the messages
+            raise error
+        if error is not None:
+            self._bad_messages(len(df) - len(parts), f"scoring failed: {error}")
+        results = pd.concat(parts)
+        return results.loc[df.index.intersection(results.index)]
+
+    def process(self, records: list) -> pd.DataFrame:
+        started = time.perf_counter()
+        df = self._decode(records)
+        try:
+            results = self.score(df) if not df.empty else df
+        except Exception:
+            results = self._score_rows(df)
+        if not results.empty:
+            for sink in self.sinks:
+                sink.write(results)
+        self.consumer.commit()
+
+        elapsed = time.perf_counter() - started
+        self.stats['batches'] += 1
+        self.stats['rows'] += len(results)
+        self.stats['busy_s'] += elapsed
+        perf.count("stream_rows_scored", len(results))
+        return results
+
+    def run(self, max_batches: int = None, stop_when_idle: bool = False):
+        """Consume until stopped (or max_batches / the topic is drained when stop_when_idle)."""
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            records = self.poll_batch()
+            if not records:
+                if stop_when_idle:
+                    break
+                continue
+            results = self.process(records)
+            batches += 1
+            print(f"Scored {len(results)} rows "
+                  f"({int(results['label_outage_1h'].sum()) if len(results) else 0} predicted outages), "
+                  f"{self.stats['rows'] / max(self.stats['busy_s'], 1e-9):,.0f} rows/s busy")
+        return self.stats
+
+
+def produce_local(broker: LocalBroker, df: pd.DataFrame, topic: str = INPUT_TOPIC, slim: bool = False,
+                  value_format: str = 'json'):
+    """
+    Send rows to a LocalBroker the way kafka_producer.py sends them to Kafka.
+
+    slim sends keys instead of dimension strings; value_format 'binary' encodes
+    with the latest registered schema (and implies slim, like the producer).
+    """
+    producer = broker.producer()
+    olt_ids = df['olt_id'].astype(str)
+    encode = lambda data: json.dumps(data).encode('utf-8')
+    if value_format == 'binary':
+        encode = message_codec.get_registry().latest().encode
+        slim = True
+    if slim:
+        df = dimensions.get_dimension_cache().slim(df)
+    lines = df.to_json(orient='records', lines=True, date_format='iso').splitlines()
+    for index, (olt_id, line) in enumerate(zip(olt_ids, lines)):
+        data = json.loads(line)
+        data['sent_at'] = pd.Timestamp.now(tz='UTC').isoformat()
+        data['row_index'] = index
+        producer.send(topic, value=encode(data), key=olt_id.encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score raw_ml_features_topic in micro-batches")
+    parser.add_argument('--broker', default=KAFKA_BROKER)
+    parser.add_argument('--topic', default=INPUT_TOPIC)
+    parser.add_argument('--group-id', default=GROUP_ID)
+    parser.add_argument('--results-topic', default=None, help="Also publish results to this topic")
+    parser.add_argument('--results-dir', default=RESULTS_DIR, help="Local result store read by the live page ('' to disable)")
+    parser.add_argument('--max-batch-rows', type=int, default=MAX_BATCH_ROWS)
+    parser.add_argument('--max-wait-s', type=float, default=MAX_WAIT_S)
+    parser.add_argument('--local', metavar='INPUT', help="Replay a CSV/Parquet file through an in-process broker stand-in instead of Kafka")
+    parser.add_argument('--slim', action='store_true', help="With --local, replay slim (key-only) messages")
+    parser.add_argument('--value-format', choices=['json', 'binary'], default='json',
+                        help="With --local, message encoding to replay (see utils/message_codec.py)")
+    args = parser.parse_args()
+
+    if args.local:
+        from utils.feature_store import read_table
+        broker = LocalBroker()
+        produce_local(broker, read_table(args.local), args.topic, slim=args.slim, value_format=args.value_format)
+        consumer = broker.consumer(args.topic, args.group_id)
+        producer = broker.producer()
+    else:
+        consumer = kafka_consumer(args.broker, args.topic, args.group_id)
+        producer = kafka_producer(args.broker) if args.results_topic else None
+
+    sinks = []
+    if args.results_dir:
+        sinks.append(ParquetSink(args.results_dir))
+    if args.results_topic:
+        sinks.append(TopicSink(producer, args.results_topic))
+
+    scorer = StreamScorer(consumer, sinks, model=data_prep_sup.load_model(data_prep_sup.MODEL_FILENAME),
+                          max_batch_rows=args.max_batch_rows, max_wait_s=args.max_wait_s,
+                          horizon_set=horizons.HorizonSet())
+    try:
+        stats = scorer.run(stop_when_idle=bool(args.local))
+        print(stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        consumer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+"""
+Incrementally maintained rollup cube of tickets and customer feedback.
+
+FACT_MERGED_TICKET_N_FEEDBACK is an inner join of tickets and feedback on
+customer_id, so a customer with several feedback rows multiplies their tickets.
+The cube is built from the two sources instead:
+    - feedback is reduced to one row per customer (mean rating and satisfaction,
+      sentiment shares), a small lookup;
+    - every ticket looks up its customer's row by position (no join is
+      materialized) and tickets are summed per
+      date x city x region x category x severity.
+
+Category is the ticket's root_cause_top. Tickets carry no severity field, so it
+is derived from urgency_visit_count (SEVERITY_BY_URGENCY). Cells hold only
+additive measures (counts and sums), so any slice or coarser grain is a sum of
+cells and means are derived afterwards (TicketCube.query).
+
+Refresh is incremental: the cube keeps a watermark (last day processed) and
+only ticket rows from that day on are read (Parquet row-group filters, or a
+WHERE clause in Snowflake); the watermark day is re-aggregated in case it was
+partial. A change in the feedback lookup re-attributes every ticket, so it
+triggers a full rebuild.
+
+Layout of a cube directory:
+    cube.parquet    one row per non-empty cell
+    meta.json       watermark, feedback fingerprint and build stats
+
+Usage (run from the streamlit/ directory):
+    python -m utils.ticket_rollups            # incremental refresh
+    python -m utils.ticket_rollups --full     # rebuild from scratch
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils import perf
+from utils.dimensions import RAW_DIR
+
+CUBE_DIR = os.environ.get('TICKET_CUBE_DIR', 'data/rollups')
+CUBE_FILE = 'cube.parquet'
+META_FILE = 'meta.json'
+CUBE_VERSION = 1
+
+TICKET_PATH = os.path.join(RAW_DIR, 'RAW_TICKET_SUMMARY.parquet')
+FEEDBACK_PATH = os.path.join(RAW_DIR, 'RAW_CUSTOMER_FEEDBACK.parquet')
+
+DIMENSIONS = ['date', 'city', 'region', 'category', 'severity']
+SEVERITY_BY_URGENCY = {0: 'low', 1: 'medium', 2: 'high'}
+SEVERITIES = ['low', 'medium', 'high']
+SENTIMENTS = ['positive', 'neutral', 'negative']
+
+TICKET_COLUMNS = [
+    'date', 'city', 'region', 'root_cause_top', 'urgency_visit_count', 'customer_id',
+    'ticket_open', 'ticket_closed', 'active_ticket', 'ticket_holding_time_hr', 'total_downtime_duration_hr',
+]
+
+# Cell measures: ticket sums, then feedback sums over tickets whose customer has feedback
+TICKET_MEASURES = {
+    'ticket_open': 'ticket_open',
+    'ticket_closed': 'ticket_closed',
+    'active_ticket': 'active_ticket',
+    'holding_time_hr': 'ticket_holding_time_hr',
+    'downtime_hr': 'total_downtime_duration_hr',
+}
+FEEDBACK_MEASURES = ['rated_tickets', 'rating_sum', 'satisfaction_sum'] + [f"sentiment_{s}" for s in SENTIMENTS]
+MEASURES = ['tickets'] + list(TICKET_MEASURES) + FEEDBACK_MEASURES
+
+TIME_GRAINS = {'day': 'D', 'week': 'W', 'month': 'M'}
+
+
+def _snowflake_session():
+    try:
+        from snowflake.snowpark.context import get_active_session
+        return get_active_session()
+    except Exception:
+        return None
+
+
+def load_tickets(since=None, path: str = TICKET_PATH) -> pd.DataFrame:
+    """
+    Ticket rows dated since (inclusive) or all, with only the cube's columns.
+
+    Reads the local Parquet export with a row-group filter on date, or
+    HACKATHON.STAGING.STG_TICKET_SUMMARY with a WHERE clause when it is absent.
+    """
+    if os.path.exists(path):
+        filters = [('date', '>=', pd.Timestamp(since))] if since is not None else None
+        df = pd.read_parquet(path, columns=TICKET_COLUMNS, filters=filters)
+    else:
+        session = _snowflake_session()
+        if session is None:
+            raise FileNotFoundError(f"No ticket source: {path} is missing and there is no Snowflake session")
+        where = f"WHERE DATE_CONVERTED >= '{pd.Timestamp(since)}'" if since is not None else ""
+        columns = ', '.join(c.upper() for c in TICKET_COLUMNS if c != 'date')
+        df = session.sql(f"""
+            SELECT DATE_CONVERTED AS DATE, {columns}
+            FROM HACKATHON.STAGING.STG_TICKET_SUMMARY {where}
+        """).to_pandas()
+        df.columns = df.columns.str.lower()
+    df['date'] = pd.to_datetime(df['date']).dt.normalize()
+    return df
+
+
+def load_feedback(path: str = FEEDBACK_PATH) -> pd.DataFrame:
+    """Feedback rows (customer_id, rating_1_5, user_satisfaction_score, sentiment_label)."""
+    columns = ['customer_id', 'rating_1_5', 'user_satisfaction_score', 'sentiment_label']
+    if os.path.exists(path):
+        return pd.read_parquet(path, columns=columns)
+    session = _snowflake_session()
+    if session is None:
+        raise FileNotFoundError(f"No feedback source: {path} is missing and there is no Snowflake session")
+    df = session.sql(f"SELECT {', '.join(c.upper() for c in columns)} "
+                     "FROM HACKATHON.STAGING.STG_CUSTOMER_FEEDBACK").to_pandas()
+    df.columns = df.columns.str.lower()
+    return df
+
+
+def customer_feedback(feedback: pd.DataFrame) -> pd.DataFrame:
+    """One row per customer: mean rating and satisfaction, and the share of each sentiment."""
+    sentiment = feedback['sentiment_label'].astype(str).str.lower()
+    per_row = pd.DataFrame({
+        'customer_id': feedback['customer_id'].astype(str),
+        'rating': pd.to_numeric(feedback['rating_1_5'], errors='coerce'),
+        'satisfaction': pd.to_numeric(feedback['user_satisfaction_score'], errors='coerce'),
+        **{f"sentiment_{s}": (sentiment == s).astype(float) for s in SENTIMENTS},
+    })
+    return per_row.groupby('customer_id').mean().sort_index()
+
+
+def feedback_fingerprint(lookup: pd.DataFrame) -> str:
+    return hashlib.sha1(pd.util.hash_pandas_object(lookup, index=True).to_numpy().tobytes()).hexdigest()
+
+
+def aggregate(tickets: pd.DataFrame, lookup: pd.DataFrame) -> pd.DataFrame:
+    """Sum tickets into cube cells, attributing each ticket its customer's feedback."""
+    if tickets.empty:
+        return pd.DataFrame(columns=DIMENSIONS + MEASURES)
+
+    frame = pd.DataFrame({
+        'date': tickets['date'].to_numpy(),
+        'city': tickets['city'].astype(str).to_numpy(),
+        'region': tickets['region'].astype(str).to_numpy(),
+        'category': tickets['root_cause_top'].fillna('Unknown').astype(str).to_numpy(),
+        'severity': (pd.to_numeric(tickets['urgency_visit_count'], errors='coerce')
+                     .clip(0, 2).map(SEVERITY_BY_URGENCY).fillna('low').to_numpy()),
+        'tickets': 1,
+    })
+    for measure, column in TICKET_MEASURES.items():
+        frame[measure] = pd.to_numeric(tickets[column], errors='coerce').fillna(0).to_numpy()
+
+    # Customer -> feedback by position; -1 (no feedback) lands on an all-NaN trailing row
+    position = lookup.index.get_indexer(tickets['customer_id'].astype(str))
+    values = np.vstack([lookup.to_numpy(dtype=float), np.full((1, lookup.shape[1]), np.nan)])[position]
+    columns = {name: values[:, i] for i, name in enumerate(lookup.columns)}
+    rated = ~np.isnan(columns['rating'])
+    frame['rated_tickets'] = rated.astype(int)
+    frame['rating_sum'] = np.where(rated, columns['rating'], 0.0)
+    frame['satisfaction_sum'] = np.nan_to_num(columns['satisfaction'])
+    for s in SENTIMENTS:
+        frame[f"sentiment_{s}"] = np.nan_to_num(columns[f"sentiment_{s}"])
+
+    return frame.groupby(DIMENSIONS, observed=True, sort=False)[MEASURES].sum().reset_index()
+
+
+def _compact(cube: pd.DataFrame) -> pd.DataFrame:
+    """Categorical dimensions: smaller in memory and on disk, faster to filter and group."""
+    cube = cube.sort_values(DIMENSIONS).reset_index(drop=True)
+    for dim in DIMENSIONS[1:]:
+        cube[dim] = cube[dim].astype('category')
+    cube['severity'] = cube['severity'].cat.set_categories(SEVERITIES)
+    return cube
+
+
+def _read_meta(cube_dir: str) -> dict:
+    path = os.path.join(cube_dir, META_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        meta = json.load(f)
+    return meta if meta.get('version') == CUBE_VERSION else {}
+
+
+def _write(cube_dir: str, cube: pd.DataFrame, meta: dict):
+    os.makedirs(cube_dir, exist_ok=True)
+    # Cube first, then meta: a reader never sees a watermark ahead of its cube
+    tmp = os.path.join(cube_dir, CUBE_FILE + '.tmp')
+    cube.to_parquet(tmp, index=False)
+    os.replace(tmp, os.path.join(cube_dir, CUBE_FILE))
+    tmp = os.path.join(cube_dir, META_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, os.path.join(cube_dir, META_FILE))
+
+
+@perf.timed("rollups.refresh")
+def refresh(cube_dir: str = CUBE_DIR, full: bool = False, ticket_path: str = TICKET_PATH,
+            feedback_path: str = FEEDBACK_PATH) -> dict:
+    """
+    Bring the cube up to date with the sources.
+
+    Returns:
+        dict: 'mode' ('full', 'incremental' or 'up to date'), 'since', 'ticket_rows'
+            read, 'days' re-aggregated, 'cells' in the cube, 'watermark' and 'seconds'
+    """
+    started = time.perf_counter()
+    meta = _read_meta(cube_dir)
+    lookup = customer_feedback(load_feedback(feedback_path))
+    fingerprint = feedback_fingerprint(lookup)
+    cube_path = os.path.join(cube_dir, CUBE_FILE)
+
+    incremental = (not full and meta.get('watermark') and meta.get('feedback_fingerprint') == fingerprint
+                   and os.path.exists(cube_path))
+    since = pd.Timestamp(meta['watermark']) if incremental else None
+    tickets = load_tickets(since, ticket_path)
+
+    # Only the watermark day came back, with as many rows as last time: nothing new
+    if incremental and len(tickets) == meta.get('watermark_rows') and (tickets['date'] <= since).all():
+        return {'mode': 'up to date', 'since': str(since.date()), 'ticket_rows': len(tickets), 'days': 0,
+                'cells': meta.get('cells', 0), 'watermark': meta['watermark'],
+                'seconds': time.perf_counter() - started}
+
+    fresh = aggregate(tickets, lookup)
+    if incremental:
+        kept = pd.read_parquet(cube_path)
+        kept = kept[kept['date'] < since]
+        for dim in DIMENSIONS[1:]:
+            kept[dim] = kept[dim].astype(str)
+        cube = pd.concat([kept, fresh], ignore_index=True)
+    else:
+        cube = fresh
+    cube = _compact(cube)
+
+    watermark = tickets['date'].max() if not tickets.empty else since
+    meta = {
+        'version': CUBE_VERSION,
+        'watermark': None if watermark is None else str(pd.Timestamp(watermark).date()),
+        # Rows on the watermark day, to tell "nothing new" from "that day grew"
+        'watermark_rows': int((tickets['date'] == watermark).sum()) if watermark is not None else 0,
+        'feedback_fingerprint': fingerprint,
+        'customers_with_feedback': len(lookup),
+        'cells': len(cube),
+        'built_at': pd.Timestamp.now(tz='UTC').isoformat(),
+    }
+    _write(cube_dir, cube, meta)
+    return {'mode': 'incremental' if incremental else 'full', 'since': None if since is None else str(since.date()),
+            'ticket_rows': len(tickets), 'days': int(tickets['date'].nunique()), 'cells': len(cube),
+            'watermark': meta['watermark'], 'seconds': time.perf_counter() - started}
+
+
+class TicketCube:
+    """The cube in memory, answering slices with a filter and a group-by over cells."""
+
+    def __init__(self, cube: pd.DataFrame, meta: dict = None):
+        self.cells = cube
+        self.meta = meta or {}
+        self._dates = cube['date'].to_numpy(dtype='datetime64[ns]')
+        self._periods = {'day': pd.Series(self._dates)}
+
+    def _period(self, grain: str) -> pd.Series:
+        """Start of each cell's week/month, computed once per grain."""
+        if grain not in self._periods:
+            self._periods[grain] = pd.Series(self._dates).dt.to_period(TIME_GRAINS[grain]).dt.start_time
+        return self._periods[grain]
+
+    @classmethod
+    def load(cls, cube_dir: str = CUBE_DIR) -> 'TicketCube':
+        cube = _compact(pd.read_parquet(os.path.join(cube_dir, CUBE_FILE)))
+        return cls(cube, _read_meta(cube_dir))
+
+    def values(self, dim: str) -> list:
+        if dim == 'date':
+            return [self.cells['date'].min(), self.cells['date'].max()]
+        return [v for v in self.cells[dim].cat.categories if v in set(self.cells[dim].unique())]
+
+    @staticmethod
+    def derive(totals: pd.DataFrame) -> pd.DataFrame:
+        """Means and shares from the additive measures."""
+        def ratio(num, den):
+            num, den = totals[num].to_numpy(dtype=float), totals[den].to_numpy(dtype=float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where(den > 0, num / den, np.nan)
+
+        derived = {
+            'close_rate': ratio('ticket_closed', 'ticket_open'),
+            'avg_holding_time_hr': ratio('holding_time_hr', 'tickets'),
+            'avg_downtime_hr': ratio('downtime_hr', 'tickets'),
+            'avg_rating': ratio('rating_sum', 'rated_tickets'),
+            'avg_satisfaction': ratio('satisfaction_sum', 'rated_tickets'),
+            **{f"{s}_share": ratio(f"sentiment_{s}", 'rated_tickets') for s in SENTIMENTS},
+        }
+        # One concat rather than a column insert per metric
+        return pd.concat([totals, pd.DataFrame(derived, index=totals.index)], axis=1)
+
+    def query(self, filters: dict = None, group_by: list = (), grain: str = 'day') -> pd.DataFrame:
+        """
+        Totals and derived metrics of the cells matching filters, per group.
+
+        Args:
+            filters: {dimension: allowed values}, and 'date': (start, end) inclusive
+            group_by: Dimensions to keep; 'date' is truncated to grain
+            grain: 'day', 'week' or 'month'
+        """
+        cells = self.cells
+        mask = np.ones(len(cells), dtype=bool)
+        for dim, allowed in (filters or {}).items():
+            if dim == 'date':
+                start, end = allowed
+                mask &= (self._dates >= np.datetime64(pd.Timestamp(start))) & \
+                        (self._dates <= np.datetime64(pd.Timestamp(end)))
+            elif allowed:
+                mask &= np.isin(cells[dim].cat.codes.to_numpy(), cells[dim].cat.categories.get_indexer(allowed))
+        cells = cells[mask]
+
+        group_by = list(group_by)
+        if not group_by:
+            totals = cells[MEASURES].sum().to_frame().T
+        else:
+            keys = [self._period(grain)[mask].to_numpy() if dim == 'date' else cells[dim] for dim in group_by]
+            totals = cells[MEASURES].groupby(keys, observed=True).sum().reset_index()
+            totals.columns = group_by + MEASURES
+        return self.derive(totals)
+
+
+@st.cache_resource(show_spinner="Loading ticket cube...")
+def _cached_cube(cube_dir: str, built_at: str) -> TicketCube:
+    return TicketCube.load(cube_dir)
+
+
+def get_ticket_cube(cube_dir: str = CUBE_DIR):
+    """Process-wide cube, reloaded when a refresh rewrote it; None before the first build."""
+    meta = _read_meta(cube_dir)
+    if not meta or not os.path.exists(os.path.join(cube_dir, CUBE_FILE)):
+        return None
+    return _cached_cube(cube_dir, meta['built_at'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the ticket/feedback rollup cube")
+    parser.add_argument('--cube-dir', default=CUBE_DIR)
+    parser.add_argument('--full', action='store_true', help="Rebuild from scratch instead of processing new days")
+    args = parser.parse_args()
+
+    stats = refresh(args.cube_dir, full=args.full)
+    print(f"{stats['mode']}: read {stats['ticket_rows']:,} ticket rows over {stats['days']} day(s) "
+          f"since {stats['since'] or 'the start'}, cube has {stats['cells']:,} cells up to {stats['watermark']} "
+          f"({stats['seconds']:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,508 @@
+"""
+Local BM25 search over operator transcripts (RAW_EVENT_TRANSCRIPTS).
+
+A local stand-in for the NETOPS_TRANSCRIPTS Cortex Search service
+(sql/cortex_search.sql) that keeps answering when the warehouse is not
+available. event_transcript is indexed into an inverted index, ranked with
+BM25 and filtered on olt_id, cluster_id, severity_bucket and a time range.
+
+The index is a list of immutable segments, each a directory of .npy arrays
+opened with mmap_mode='r', so opening an index reads only meta.json and the
+OS pages postings in as queries touch them:
+    terms.npy       sorted 64-bit term hashes
+    offsets.npy     postings range of each term
+    docs.npy        doc number of each posting, ascending within a term
+    tfs.npy         term frequency of each posting
+    doc_len.npy     tokens per doc (BM25 length normalization)
+    timestamp.npy   int64 ns; docs are sorted by time within a segment
+    olt.npy, cluster.npy, severity.npy, event.npy
+                    int32 codes into the dictionaries in meta.json
+    ids.bin, text.bin (+ *_offsets.npy)
+                    transcript_id and event_transcript as UTF-8 blobs
+
+Refresh is incremental: meta.json keeps the newest timestamp indexed and the
+transcript ids of that hour; only rows from that hour on are read, and new
+rows become a new segment. Once there are more than MAX_SEGMENTS segments
+they are merged into one, so queries touch a bounded number of files.
+
+Usage (run from the streamlit/ directory):
+    python -m utils.transcript_search refresh             # index new transcripts
+    python -m utils.transcript_search refresh --full      # rebuild from scratch
+    python -m utils.transcript_search search "link loss" --severity critical
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils import perf
+from utils.dimensions import RAW_DIR
+
+INDEX_DIR = os.environ.get('TRANSCRIPT_INDEX_DIR', 'data/transcript_index')
+META_FILE = 'meta.json'
+INDEX_VERSION = 1
+
+SOURCE_PATH = os.path.join(RAW_DIR, 'RAW_EVENT_TRANSCRIPTS.parquet')
+SOURCE_TABLE = 'HACKATHON.DATAMART.FACT_EVENT_TRANSCRIPTS'
+COLUMNS = ['timestamp_1h', 'olt_id', 'cluster_id', 'transcript_id', 'event_type', 'severity_bucket', 'event_transcript']
+
+# Dictionary-encoded columns: column -> segment file
+CODED_COLUMNS = {'olt_id': 'olt', 'cluster_id': 'cluster', 'severity_bucket': 'severity', 'event_type': 'event'}
+
+# Docs per new segment, and segments kept before merging them into one
+SEGMENT_DOCS = 250_000
+MAX_SEGMENTS = 8
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words like "OLT-NTB20-01" are indexed whole and as their parts
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[-_./]")
+STOPWORDS = frozenset("""
+    a an and are as at be by for from has in is it its of on or that the this to was were will with no not
+""".split())
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _expand(token: str) -> tuple:
+    """Index terms of one word; cached, transcripts reuse a small vocabulary."""
+    if token in STOPWORDS:
+        return ()
+    if not _SEPARATORS.search(token):
+        return (token,)
+    return (token, *(part for part in _SEPARATORS.split(token) if part and part not in STOPWORDS))
+
+
+def tokenize(text: str) -> list:
+    """Lower-case terms of text; compound words also yield their parts."""
+    terms = []
+    for token in _TOKEN.findall(str(text).lower()):
+        terms.extend(_expand(token))
+    return terms
+
+
+def term_hashes(terms) -> np.ndarray:
+    """Stable 64-bit hash of each term (Python's hash() changes between processes)."""
+    return np.array([int.from_bytes(hashlib.blake2b(t.encode('utf-8'), digest_size=8).digest(), 'little')
+                     for t in terms], dtype=np.uint64)
+
+
+def load_transcripts(since=None, path: str = SOURCE_PATH) -> pd.DataFrame:
+    """
+    Transcripts from since (inclusive) or all, from the local Parquet export or SOURCE_TABLE.
+
+    Raises:
+        FileNotFoundError: Neither the export nor a Snowflake session is available
+    """
+    if os.path.exists(path):
+        filters = [('timestamp_1h', '>=', pd.Timestamp(since))] if since is not None else None
+        df = pd.read_parquet(path, columns=COLUMNS, filters=filters)
+    else:
+        try:
+            from snowflake.snowpark.context import get_active_session
+            session = get_active_session()
+        except Exception:
+            raise FileNotFoundError(f"No transcript source: {path} is missing and there is no Snowflake session")
+        where = f"WHERE TIMESTAMP_1H >= '{pd.Timestamp(since)}'" if since is not None else ""
+        df = session.sql(f"SELECT {', '.join(c.upper() for c in COLUMNS)} FROM {SOURCE_TABLE} {where}").to_pandas()
+        df.columns = df.columns.str.lower()
+    df['timestamp_1h'] = pd.to_datetime(df['timestamp_1h'])
+    return df
+
+
+def _encode(values: pd.Series, dictionary: list) -> np.ndarray:
+    """Codes of values in dictionary (-1 for nulls); unseen values are appended to dictionary."""
+    values = values.astype(object).where(values.notna(), None)
+    new = [v for v in pd.unique(values.dropna().astype(str)) if v not in set(dictionary)]
+    dictionary.extend(new)
+    codes = pd.Index(dictionary).get_indexer(values.astype(str))
+    codes[values.isna().to_numpy()] = -1
+    return codes.astype(np.int32)
+
+
+def _write_strings(path: str, name: str, values: list):
+    encoded = [str(v).encode('utf-8') for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(os.path.join(path, f'{name}.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    np.save(os.path.join(path, f'{name}_offsets.npy'), offsets)
+
+
+def _save(path: str, arrays: dict, strings: dict):
+    """Write a segment into a fresh directory, then move it into place."""
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f'{name}.npy'), array)
+    for name, values in strings.items():
+        _write_strings(tmp, name, values)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+
+def _postings(texts: list) -> tuple:
+    """(terms, offsets, docs, tfs, doc_len) for texts, postings grouped by term hash."""
+    tokens = [tokenize(text) for text in texts]
+    doc_len = np.array([len(t) for t in tokens], dtype=np.uint32)
+    codes, uniques = pd.factorize(pd.Series([term for doc in tokens for term in doc], dtype=object))
+    docs = np.repeat(np.arange(len(texts), dtype=np.int64), doc_len)
+
+    # One posting per (term, doc), with its count as the term frequency
+    keys, tfs = np.unique(codes.astype(np.int64) * max(len(texts), 1) + docs, return_counts=True)
+    hashes = term_hashes(uniques)[keys // max(len(texts), 1)]
+    docs = (keys % max(len(texts), 1)).astype(np.uint32)
+    order = np.lexsort((docs, hashes))
+    hashes, docs, tfs = hashes[order], docs[order], np.minimum(tfs[order], np.iinfo(np.uint16).max).astype(np.uint16)
+
+    terms, starts = np.unique(hashes, return_index=True)
+    offsets = np.append(starts, len(hashes)).astype(np.int64)
+    return terms, offsets, docs, tfs, doc_len
+
+
+def build_segment(path: str, df: pd.DataFrame, dictionaries: dict) -> dict:
+    """Index df's transcripts into a segment at path; returns its meta entry."""
+    df = df.sort_values('timestamp_1h', kind='stable').reset_index(drop=True)
+    terms, offsets, docs, tfs, doc_len = _postings(df['event_transcript'].fillna('').astype(str).tolist())
+    timestamp = df['timestamp_1h'].astype('datetime64[ns]').to_numpy().view('i8')
+    arrays = {'terms': terms, 'offsets': offsets, 'docs': docs, 'tfs': tfs, 'doc_len': doc_len, 'timestamp': timestamp}
+    for column, name in CODED_COLUMNS.items():
+        arrays[name] = _encode(df[column], dictionaries.setdefault(column, []))
+    _save(path, arrays, {'ids': df['transcript_id'].astype(str).tolist(),
+                         'text': df['event_transcript'].fillna('').astype(str).tolist()})
+    return {'name': os.path.basename(path), 'docs': len(df), 'tokens': int(doc_len.sum()),
+            'ts_min': int(timestamp.min()), 'ts_max': int(timestamp.max())}
+
+
+class Segment:
+    """One segment's arrays, memory-mapped."""
+
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.meta = meta
+        self.n = meta['docs']
+        for name in ['terms', 'offsets', 'docs', 'tfs', 'doc_len', 'timestamp', *CODED_COLUMNS.values(),
+                     'ids_offsets', 'text_offsets']:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+        self._blobs = {}
+        self._norm = (None, None)
+
+    def strings(self, name: str, rows: np.ndarray) -> list:
+        if name not in self._blobs:
+            self._blobs[name] = np.memmap(os.path.join(self.path, f'{name}.bin'), dtype=np.uint8, mode='r') \
+                if os.path.getsize(os.path.join(self.path, f'{name}.bin')) else np.zeros(0, dtype=np.uint8)
+        blob, offsets = self._blobs[name], getattr(self, f'{name}_offsets')
+        return [bytes(blob[offsets[r]:offsets[r + 1]]).decode('utf-8') for r in rows]
+
+    def postings(self, term_hash) -> tuple:
+        """(docs, tfs) of a term, empty when the segment doesn't have it."""
+        j = int(np.searchsorted(self.terms, term_hash))
+        if j == len(self.terms) or self.terms[j] != term_hash:
+            return None, None
+        lo, hi = self.offsets[j], self.offsets[j + 1]
+        return self.docs[lo:hi], self.tfs[lo:hi]
+
+    def document_frequency(self, term_hash) -> int:
+        j = int(np.searchsorted(self.terms, term_hash))
+        return int(self.offsets[j + 1] - self.offsets[j]) if j < len(self.terms) and self.terms[j] == term_hash else 0
+
+    def length_norm(self, avg_len: float) -> np.ndarray:
+        """k1 * (1 - b + b * len / avg_len) per doc, cached until the average length changes."""
+        if self._norm[0] != avg_len:
+            self._norm = (avg_len, (BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / avg_len)).astype(np.float32))
+        return self._norm[1]
+
+    def time_slice(self, start, end) -> slice:
+        lo = 0 if start is None else int(np.searchsorted(self.timestamp, start, side='left'))
+        hi = self.n if end is None else int(np.searchsorted(self.timestamp, end, side='right'))
+        return slice(lo, hi)
+
+
+def _read_meta(index_dir: str) -> dict:
+    path = os.path.join(index_dir, META_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        meta = json.load(f)
+    return meta if meta.get('version') == INDEX_VERSION else {}
+
+
+def _write_meta(index_dir: str, meta: dict):
+    meta['updated_at'] = pd.Timestamp.now(tz='UTC').isoformat()
+    tmp = os.path.join(index_dir, META_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(index_dir, META_FILE))
+
+
+def _ns(value):
+    return None if value is None else int(pd.Timestamp(value).value)
+
+
+class TranscriptIndex:
+    """Memory-mapped segments plus the dictionaries, answering BM25 queries."""
+
+    def __init__(self, index_dir: str, meta: dict):
+        self.index_dir = index_dir
+        self.meta = meta
+        self.dictionaries = {column: pd.Index(values) for column, values in meta.get('dictionaries', {}).items()}
+        self.segments = [Segment(os.path.join(index_dir, s['name']), s) for s in meta.get('segments', [])]
+        self.docs = sum(s.n for s in self.segments)
+        self.avg_len = max(sum(s.meta['tokens'] for s in self.segments) / max(self.docs, 1), 1.0)
+
+    @classmethod
+    def open(cls, index_dir: str = INDEX_DIR) -> 'TranscriptIndex':
+        return cls(index_dir, _read_meta(index_dir))
+
+    def time_range(self) -> tuple:
+        """Oldest and newest timestamp_1h indexed."""
+        return (pd.Timestamp(min(s.meta['ts_min'] for s in self.segments)),
+                pd.Timestamp(max(s.meta['ts_max'] for s in self.segments)))
+
+    def values(self, column: str) -> list:
+        return sorted(self.dictionaries[column]) if column in self.dictionaries else []
+
+    def _codes(self, column: str, values) -> np.ndarray:
+        codes = self.dictionaries[column].get_indexer(list(values)) if column in self.dictionaries else np.array([])
+        return codes[codes >= 0]
+
+    def _matches(self, segment: Segment, rows: np.ndarray, filters: dict) -> np.ndarray:
+        keep = np.ones(len(rows), dtype=bool)
+        for column, codes in filters.items():
+            keep &= np.isin(getattr(segment, CODED_COLUMNS[column])[rows], codes)
+        return rows[keep]
+
+    def _document_frequency(self, term: str) -> tuple:
+        h = term_hashes([term])[0]
+        return h, sum(s.document_frequency(h) for s in self.segments)
+
+    def query_terms(self, query: str) -> list:
+        """
+        (hash, document frequency) of the query's indexed terms.
+
+        A compound word found in the index is searched whole, so "OLT-NTB20-01"
+        doesn't also match every transcript mentioning "olt"; its parts are only
+        searched when the whole word isn't indexed.
+        """
+        terms = {}
+        for token in _TOKEN.findall(query.lower()):
+            if token in STOPWORDS:
+                continue
+            h, df = self._document_frequency(token)
+            if df or not _SEPARATORS.search(token):
+                terms[h] = df
+                continue
+            for part in _SEPARATORS.split(token):
+                if part and part not in STOPWORDS:
+                    h, df = self._document_frequency(part)
+                    terms[h] = df
+        return [(h, df) for h, df in terms.items() if df]
+
+    @perf.timed("search.query")
+    def search(self, query: str = '', olt_ids=(), cluster_ids=(), severities=(), start=None, end=None,
+               limit: int = 20) -> tuple:
+        """
+        Top transcripts for query by BM25, or the newest matches when query is empty.
+
+        Args:
+            olt_ids, cluster_ids, severities: Allowed values (empty: any)
+            start, end: Inclusive timestamp_1h bounds (None: open)
+
+        Returns:
+            tuple: (results DataFrame best first, number of matching transcripts)
+        """
+        start, end = _ns(start), _ns(end)
+        filters = {}
+        for column, values in (('olt_id', olt_ids), ('cluster_id', cluster_ids), ('severity_bucket', severities)):
+            if len(values):
+                filters[column] = self._codes(column, values)
+                if not len(filters[column]):
+                    return self._frame([]), 0
+
+        idf = [(h, np.float32(np.log(1 + (self.docs - df + 0.5) / (df + 0.5)))) for h, df in self.query_terms(query)]
+
+        hits, total = [], 0
+        for segment in self.segments:
+            if (start is not None and segment.meta['ts_max'] < start) or \
+                    (end is not None and segment.meta['ts_min'] > end):
+                continue
+            window = segment.time_slice(start, end)
+            if not query.strip():
+                rows = self._matches(segment, np.arange(window.start, window.stop), filters)
+                total += len(rows)
+                # Docs are in time order: the newest are last
+                hits.extend((float(segment.timestamp[r]), segment, r) for r in rows[-limit:])
+                continue
+
+            scores = np.zeros(segment.n, dtype=np.float32)
+            norm = segment.length_norm(self.avg_len)
+            for h, weight in idf:
+                docs, tfs = segment.postings(h)
+                if docs is None:
+                    continue
+                tf = tfs.astype(np.float32)
+                # Doc numbers are unique within a term's postings, so += adds once per doc
+                scores[docs] += weight * tf * (BM25_K1 + 1) / (tf + norm[docs])
+            rows = np.flatnonzero(scores[window]) + window.start
+            rows = self._matches(segment, rows, filters)
+            total += len(rows)
+            if len(rows) > limit:
+                rows = rows[np.argpartition(-scores[rows], limit)[:limit]]
+            hits.extend((float(scores[r]), segment, r) for r in rows)
+
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        return self._frame(hits[:limit], by_time=not query.strip()), total
+
+    def _frame(self, hits: list, by_time: bool = False) -> pd.DataFrame:
+        columns = ['score', 'timestamp_1h', 'olt_id', 'cluster_id', 'severity_bucket', 'event_type',
+                   'transcript_id', 'event_transcript']
+        rows = []
+        for score, segment, r in hits:
+            row = {'score': None if by_time else score, 'timestamp_1h': pd.Timestamp(int(segment.timestamp[r]))}
+            for column, name in CODED_COLUMNS.items():
+                code = int(getattr(segment, name)[r])
+                row[column] = self.dictionaries[column][code] if code >= 0 else None
+            row['transcript_id'] = segment.strings('ids', [r])[0]
+            row['event_transcript'] = segment.strings('text', [r])[0]
+            rows.append(row)
+        return pd.DataFrame(rows, columns=columns)
+
+
+def _segment_frame(segment: Segment, dictionaries: dict) -> pd.DataFrame:
+    """A segment's docs back as source rows, for merging."""
+    rows = np.arange(segment.n)
+    df = pd.DataFrame({
+        'timestamp_1h': pd.to_datetime(np.asarray(segment.timestamp)),
+        'transcript_id': segment.strings('ids', rows),
+        'event_transcript': segment.strings('text', rows),
+    })
+    for column, name in CODED_COLUMNS.items():
+        codes = np.asarray(getattr(segment, name))
+        values = np.append(np.array(dictionaries[column], dtype=object), None)
+        df[column] = values[np.where(codes < 0, len(values) - 1, codes)]
+    return df
+
+
+def _merge(index_dir: str, meta: dict) -> tuple:
+    """Replace all segments with one; returns the new meta and the names of the old segments."""
+    segments = [Segment(os.path.join(index_dir, s['name']), s) for s in meta['segments']]
+    merged = pd.concat([_segment_frame(s, meta['dictionaries']) for s in segments], ignore_index=True)
+    name = f"seg_{meta['next_segment']:06d}"
+    meta['next_segment'] += 1
+    entry = build_segment(os.path.join(index_dir, name), merged, meta['dictionaries'])
+    old = [s['name'] for s in meta['segments']]
+    meta['segments'] = [entry]
+    return meta, old
+
+
+@perf.timed("search.refresh")
+def refresh(index_dir: str = INDEX_DIR, full: bool = False, source_path: str = SOURCE_PATH) -> dict:
+    """
+    Index transcripts added since the last refresh.
+
+    Returns:
+        dict: 'mode' ('full', 'incremental' or 'up to date'), 'since', 'indexed' (new transcripts),
+            'docs' and 'segments' in the index, 'merged' (bool) and 'seconds'
+    """
+    started = time.perf_counter()
+    meta = {} if full else _read_meta(index_dir)
+    if not meta:
+        shutil.rmtree(index_dir, ignore_errors=True)
+        meta = {'version': INDEX_VERSION, 'dictionaries': {}, 'segments': [], 'next_segment': 0,
+                'watermark': None, 'watermark_ids': []}
+    os.makedirs(index_dir, exist_ok=True)
+
+    since = meta['watermark']
+    df = load_transcripts(since, source_path)
+    if since is not None:
+        # Transcripts of the watermark hour may already be indexed
+        df = df[~df['transcript_id'].astype(str).isin(set(meta['watermark_ids']))]
+
+    stats = {'mode': 'full' if since is None else 'incremental', 'since': since, 'indexed': len(df), 'merged': False}
+    if df.empty:
+        stats['mode'] = 'up to date' if since is not None else stats['mode']
+    else:
+        for begin in range(0, len(df), SEGMENT_DOCS):
+            name = f"seg_{meta['next_segment']:06d}"
+            meta['next_segment'] += 1
+            meta['segments'].append(build_segment(os.path.join(index_dir, name), df.iloc[begin:begin + SEGMENT_DOCS],
+                                                  meta['dictionaries']))
+        removed = []
+        if len(meta['segments']) > MAX_SEGMENTS:
+            meta, removed = _merge(index_dir, meta)
+            stats['merged'] = True
+
+        watermark = df['timestamp_1h'].max()
+        ids = df.loc[df['timestamp_1h'] == watermark, 'transcript_id'].astype(str).tolist()
+        if since is not None and pd.Timestamp(since) == watermark:
+            ids = meta['watermark_ids'] + ids
+        meta['watermark'], meta['watermark_ids'] = str(watermark), ids
+        _write_meta(index_dir, meta)
+        # Only once meta no longer lists them; open readers keep their mapped files
+        for name in removed:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+    stats.update(docs=sum(s['docs'] for s in meta['segments']), segments=len(meta['segments']),
+                 seconds=time.perf_counter() - started)
+    return stats
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_index(index_dir: str, updated_at: str) -> TranscriptIndex:
+    return TranscriptIndex.open(index_dir)
+
+
+def get_transcript_index(index_dir: str = INDEX_DIR):
+    """Process-wide index, reopened after a refresh; None before the first build."""
+    meta = _read_meta(index_dir)
+    if not meta.get('segments'):
+        return None
+    return _cached_index(index_dir, meta['updated_at'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local BM25 transcript index")
+    parser.add_argument('--index-dir', default=INDEX_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    refresh_parser = sub.add_parser('refresh', help="Index new transcripts")
+    refresh_parser.add_argument('--source', default=SOURCE_PATH, help="Parquet export (else Snowflake)")
+    refresh_parser.add_argument('--full', action='store_true', help="Rebuild from scratch")
+    search_parser = sub.add_parser('search', help="Query the index")
+    search_parser.add_argument('query', nargs='?', default='')
+    search_parser.add_argument('--olt', action='append', default=[])
+    search_parser.add_argument('--cluster', action='append', default=[])
+    search_parser.add_argument('--severity', action='append', default=[])
+    search_parser.add_argument('--start')
+    search_parser.add_argument('--end')
+    search_parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        stats = refresh(args.index_dir, full=args.full, source_path=args.source)
+        print(f"{stats['mode']}: indexed {stats['indexed']:,} transcript(s) since {stats['since'] or 'the start'}; "
+              f"{stats['docs']:,} docs in {stats['segments']} segment(s)"
+              f"{' after a merge' if stats['merged'] else ''} ({stats['seconds']:.2f}s)")
+        return
+
+    started = time.perf_counter()
+    index = TranscriptIndex.open(args.index_dir)
+    opened = time.perf_counter()
+    results, total = index.search(args.query, args.olt, args.cluster, args.severity, args.start, args.end, args.limit)
+    done = time.perf_counter()
+    print(f"{total:,} match(es) among {index.docs:,} transcripts; opened in {(opened - started) * 1000:.1f} ms, "
+          f"searched in {(done - opened) * 1000:.1f} ms")
+    with pd.option_context('display.max_colwidth', 120, 'display.width', 200):
+        print(results.drop(columns=['transcript_id']).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
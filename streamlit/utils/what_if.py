@@ -0,0 +1,136 @@
+"""
+What-if sweeps for single prediction.
+
+Perturbs one or two raw inputs of a row over a grid of values and scores the
+whole grid in one model call. The history (and the row itself) is engineered
+once; a raw input only feeds its own engineered columns (the value itself, or
+its log delta and rolling means, or hour_sin/cos), so each grid row is the
+base feature vector with those columns replaced. The replacement values are
+computed per axis from the engineered history with the same formulas as
+data_prep_sup.engineer_features, and broadcast over the grid.
+"""
+import time
+import numpy as np
+import pandas as pd
+from utils import data_prep_sup
+from utils import perf
+
+# Sweepable inputs and their ranges (the single-prediction form's bounds)
+SWEEP_FEATURES = {
+    'offline_ont_now': (0, 500),
+    'snr_avg': (10.0, 50.0),
+    'rx_power_avg_dbm': (-40.0, -10.0),
+    'temperature_avg_c': (25.0, 70.0),
+    'offline_ont_ratio': (0.0, 1.0),
+    'fault_rate': (0.0, 1.0),
+    'trap_trend_score': (0.0, 2.0),
+    'link_loss_count': (0, 1_000),
+    'bad_rsl_count': (0, 1_000),
+    'high_temp_count': (0, 1_000),
+    'dying_gasp_count': (0, 1_000),
+    'hour_of_day': (0, 23),
+}
+
+INTEGER_FEATURES = {
+    'offline_ont_now', 'link_loss_count', 'bad_rsl_count', 'high_temp_count', 'dying_gasp_count', 'hour_of_day'
+}
+
+MAX_STEPS = 100
+
+
+def axis_values(feature: str, low: float, high: float, steps: int) -> np.ndarray:
+    """Evenly spaced values of a feature (whole numbers for counts, without duplicates)."""
+    values = np.linspace(low, high, steps)
+    if feature in INTEGER_FEATURES:
+        values = np.unique(np.round(values))
+    return values
+
+
+def _owned_columns(feature: str, values: np.ndarray, history: pd.DataFrame) -> dict:
+    """
+    Engineered columns of the newest row that depend on a raw feature, for each value.
+
+    Args:
+        feature: Raw input name
+        values: Candidate values of the newest row
+        history: Engineered rows before it (same OLT, chronological)
+    """
+    values = np.asarray(values, dtype=float)
+    if feature == 'hour_of_day':
+        return {'hour_sin': np.sin(2 * np.pi * values / 24.0), 'hour_cos': np.cos(2 * np.pi * values / 24.0)}
+
+    key = f"{feature}_log"
+    if key not in data_prep_sup.ROLL_KEYS:
+        return {feature: values}
+
+    # Same as handling_skewness + add_roll_delta for the last row of a group
+    t = np.log1p(np.clip(values, 0, None))
+    past = history[key].to_numpy(dtype=float) if key in history.columns else np.empty(0)
+    prev = past[-1] if len(past) else np.nan
+    columns = {f"{key}_delta_1h": t - prev if not np.isnan(prev) else np.zeros_like(t)}
+    for w in data_prep_sup.ROLL_WINDOWS:
+        window = past[-(w - 1):] if w > 1 else past[:0]
+        columns[f"{key}_roll{w}h_mean"] = (np.nansum(window) + t) / (np.count_nonzero(~np.isnan(window)) + 1)
+    return columns
+
+
+@perf.timed("what_if.sweep")
+def sweep(df: pd.DataFrame, axes: dict, model=None) -> dict:
+    """
+    Score a grid of perturbations of the last row of df.
+
+    Args:
+        df: Raw rows of one OLT; the last row (by timestamp_1h) is the one perturbed
+        axes: {feature: values} for one or two features from SWEEP_FEATURES
+        model: Model to score with (defaults to the production model)
+
+    Returns:
+        dict: 'probability' (shape (len(v1),) or (len(v1), len(v2))), 'axes',
+            'base_probability', 'rows' and 'seconds'
+    """
+    if not 1 <= len(axes) <= 2:
+        raise ValueError("sweep takes one or two features")
+    unknown = set(axes) - set(SWEEP_FEATURES)
+    if unknown:
+        raise ValueError(f"Cannot sweep {sorted(unknown)}")
+
+    started = time.perf_counter()
+    engineered = data_prep_sup.engineer_features(df)
+    base = data_prep_sup.select_model_features(engineered.iloc[[-1]])
+    history = engineered.iloc[:-1]
+
+    names = list(axes)
+    values = [np.asarray(axes[name], dtype=float) for name in names]
+    shape = tuple(len(v) for v in values)
+    grid = pd.DataFrame(np.repeat(base.to_numpy(), int(np.prod(shape)), axis=0), columns=base.columns)
+
+    for i, name in enumerate(names):
+        for column, column_values in _owned_columns(name, values[i], history).items():
+            if column not in grid.columns:
+                continue
+            # Row-major grid: axis 0 varies slowest
+            if i == 0 and len(shape) == 2:
+                column_values = np.repeat(column_values, shape[1])
+            elif i == 1:
+                column_values = np.tile(column_values, shape[0])
+            grid[column] = column_values
+
+    probability = data_prep_sup.predict_proba(grid, model=model).reshape(shape)
+    base_probability = float(data_prep_sup.predict_proba(base, model=model)[0])
+    return {
+        'probability': probability,
+        'axes': dict(zip(names, values)),
+        'base_probability': base_probability,
+        'rows': len(grid),
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def crossings(values: np.ndarray, probability: np.ndarray, threshold: float = data_prep_sup.THRESHOLD) -> list:
+    """Values (linearly interpolated) where a 1-D sweep crosses the threshold."""
+    above = probability >= threshold
+    found = []
+    for i in np.flatnonzero(above[1:] != above[:-1]):
+        p0, p1 = probability[i], probability[i + 1]
+        found.append(values[i] + (threshold - p0) * (values[i + 1] - values[i]) / (p1 - p0))
+    return found